@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""
+Cooks a synthetic inventory with the default classes and templates and
+reports the time of every phase, objects/s and the peak memory.
+
+  python benchmarks/cook.py --hosts 10000 --output result.json
+  python benchmarks/cook.py --hosts 10000 --compare result.json
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import logging
+from optparse import OptionParser
+
+sys.dont_write_bytecode = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import coshsh
+from coshsh.generator import Generator
+from coshsh.util import setup_logging
+from inventory import write_inventory
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PHASES = ["collect", "assemble", "render", "output"]
+
+
+def peak_rss():
+    # bytes, the own process and the biggest of the finished children
+    if not resource:
+        return (0, 0)
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
+def run_benchmark(workdir, hosts=1000, inventory={}, recipe_options={}):
+    datadir = os.path.join(workdir, "data")
+    counts = write_inventory(datadir, "bench", hosts, **inventory)
+    recipe = {
+        "name": "bench",
+        "objects_dir": os.path.join(workdir, "objects"),
+        # the applications of the inventory, the os come with the default recipe
+        "classes_dir": os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipe", "classes"),
+        "templates_dir": os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipe", "templates"),
+        "datasources": "bench",
+        "pid_dir": workdir,
+        "git_init": "no",
+    }
+    recipe.update(recipe_options)
+    generator = Generator()
+    generator.add_recipe(**recipe)
+    generator.recipes["bench"].add_datasource(name="bench", type="csv", dir=datadir)
+    summary = generator.run()[0]
+    if summary["status"] != "ok":
+        raise Exception("recipe bench %s" % summary["status"])
+    objects = sum(summary["objects"].values(), 0)
+    phases = dict([(s[2], {"wall": s[3], "cpu": s[4]}) for s in summary["steps"] if s[0] == "recipe"])
+    own_rss, children_rss = peak_rss()
+    return {
+        "hosts": hosts,
+        "rows": counts,
+        "objects": summary["objects"],
+        "duration": summary["duration"],
+        "phases": phases,
+        "objects_per_second": objects / summary["duration"] if summary["duration"] else 0,
+        "hosts_per_second": hosts / summary["duration"] if summary["duration"] else 0,
+        "peak_rss": own_rss,
+        "peak_rss_children": children_rss,
+    }
+
+
+def compare(result, baseline, threshold):
+    """
+    Returns a list of (metric, baseline, result, change in percent, regression).
+    Times and memory must not grow, throughput must not shrink by more
+    than threshold percent.
+    """
+    def change(new, old):
+        return 100.0 * (new - old) / old if old else 0.0
+    rows = []
+    metrics = [("duration", result["duration"], baseline["duration"], 1)]
+    for phase in PHASES:
+        if phase in result["phases"] and phase in baseline["phases"]:
+            metrics.append(("%s wall" % phase, result["phases"][phase]["wall"], baseline["phases"][phase]["wall"], 1))
+            metrics.append(("%s cpu" % phase, result["phases"][phase]["cpu"], baseline["phases"][phase]["cpu"], 1))
+    metrics.append(("objects/s", result["objects_per_second"], baseline["objects_per_second"], -1))
+    metrics.append(("peak rss", result["peak_rss"], baseline["peak_rss"], 1))
+    for metric, new, old, direction in metrics:
+        percent = change(new, old)
+        rows.append((metric, old, new, percent, direction * percent > threshold))
+    return rows
+
+
+def report(result):
+    print "%d hosts, %s" % (result["hosts"], ", ".join(["%d %s" % (result["objects"][k], k) for k in sorted(result["objects"]) if result["objects"][k]]))
+    print "%-10s %9s %9s" % ("phase", "wall s", "cpu s")
+    for phase in PHASES:
+        if phase in result["phases"]:
+            print "%-10s %9.3f %9.3f" % (phase, result["phases"][phase]["wall"], result["phases"][phase]["cpu"])
+    print "%-10s %9.3f" % ("total", result["duration"])
+    print "%.0f objects/s, %.0f hosts/s" % (result["objects_per_second"], result["hosts_per_second"])
+    print "peak rss %.1f MB (children %.1f MB)" % (result["peak_rss"] / 1048576.0, result["peak_rss_children"] / 1048576.0)
+
+
+if __name__ == '__main__':
+    parser = OptionParser("%prog [options]")
+    parser.add_option('--hosts', action='store', type='int', dest="hosts", default=1000, help="Number of hosts")
+    for option, default in [("linux", 70), ("apps", 1), ("filesystems", 3), ("ports", 1), ("urls", 1), ("keyvalues", 1), ("sites", 10), ("contacts", 20)]:
+        parser.add_option('--' + option, action='store', type='int', dest=option, default=default, help="see inventory.py")
+    parser.add_option('--option', action='append', dest="options", default=[], help="A recipe option key=value, e.g. render_workers=4")
+    parser.add_option('--workdir', action='store', dest="workdir", help="Keep inventory and output here instead of a temp dir")
+    parser.add_option('--output', action='store', dest="output", help="Write the result as json")
+    parser.add_option('--compare', action='store', dest="compare", help="A json result of an earlier run")
+    parser.add_option('--threshold', action='store', type='float', dest="threshold", default=10.0, help="Percent a metric may get worse")
+    opts, args = parser.parse_args()
+
+    workdir = opts.workdir or tempfile.mkdtemp(prefix="coshsh_bench_")
+    setup_logging(logdir=workdir, scrnloglevel=logging.WARNING)
+    try:
+        inventory = dict([(k, getattr(opts, k)) for k in ["linux", "apps", "filesystems", "ports", "urls", "keyvalues", "sites", "contacts"]])
+        recipe_options = dict([o.split("=", 1) for o in opts.options])
+        result = run_benchmark(workdir, opts.hosts, inventory, recipe_options)
+    finally:
+        if not opts.workdir:
+            shutil.rmtree(workdir, True)
+    report(result)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(result, f, sort_keys=True, indent=1)
+    if opts.compare:
+        baseline = json.load(open(opts.compare))
+        if baseline["hosts"] != result["hosts"]:
+            print "warning: the baseline has %d hosts" % baseline["hosts"]
+        regressions = 0
+        print "%-14s %12s %12s %8s" % ("metric", "baseline", "now", "change")
+        for metric, old, new, percent, regression in compare(result, baseline, opts.threshold):
+            print "%-14s %12.3f %12.3f %7.1f%% %s" % (metric, old, new, percent, "REGRESSION" if regression else "")
+            regressions += 1 if regression else 0
+        if regressions:
+            sys.exit(1)
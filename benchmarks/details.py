@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""
+Memory of the monitoring details. Creates --number details from the
+rows of the micro benchmark fixtures, once with the slotted default
+detail classes (compact) and once with twins of them without __slots__
+(classic, like every detail was before). Every variant runs in its own
+process, so the growth of the max. rss belongs to the details only.
+
+  python benchmarks/details.py
+  python benchmarks/details.py --number 100000 --output result.json
+"""
+
+import sys
+import os
+import json
+import logging
+import subprocess
+from optparse import OptionParser
+
+sys.dont_write_bytecode = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import coshsh
+from coshsh.item import slot_names
+from coshsh.monitoringdetail import MonitoringDetail
+from coshsh.memprofile import deep_size
+from coshsh.runstats import rusage
+import micro
+
+VARIANTS = ["compact", "classic"]
+
+
+def classic_twin(cls, twins={}):
+    # the same class without __slots__, its objects have a __dict__
+    if cls not in twins:
+        skip = set(slot_names(cls)) | set(["__slots__", "__dict__", "__weakref__"])
+        twins[cls] = type(cls.__name__, cls.__bases__, dict([(k, v) for k, v in cls.__dict__.items() if k not in skip]))
+    return twins[cls]
+
+
+def use_classic_details():
+    get_class = MonitoringDetail.get_class
+    MonitoringDetail.get_class = classmethod(lambda cls, params={}: get_class(params) and classic_twin(get_class(params)))
+
+
+def create_details(number):
+    fixtures = micro.Fixtures()
+    details = []
+    i = 0
+    while len(details) < number:
+        for row in fixtures.detail_rows(i, fixtures.app_row(i)):
+            if len(details) < number:
+                details.append(MonitoringDetail(row))
+        i += 1
+    return details
+
+
+def measure(variant, number):
+    """
+    Creates the details in this process. Returns a dict with the
+    deep size and the growth of the max. rss per detail.
+    """
+    micro.init_classes()
+    if variant == "classic":
+        use_classic_details()
+    # warm up the class factory before the rss is taken
+    create_details(100)
+    rss = rusage()[2]
+    details = create_details(number)
+    rss = rusage()[2] - rss
+    seen = set([id(MonitoringDetail.log)])
+    size = sum([deep_size(d, seen) for d in details])
+    return {
+        "number": number,
+        "classes": sorted(set([d.__class__.__name__ for d in details])),
+        "bytes_per_detail": float(size) / number,
+        "rss_per_detail": float(rss) / number,
+    }
+
+
+def run(number=1000000):
+    """
+    Returns a dict variant: result of measure, every variant is
+    measured in a child process.
+    """
+    results = {}
+    for variant in VARIANTS:
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--variant", variant, "--number", str(number)])
+        results[variant] = json.loads(output.strip().split("\n")[-1])
+    return results
+
+
+def report(results):
+    print "%-10s %12s %16s %16s" % ("variant", "details", "bytes/detail", "rss/detail")
+    for variant in VARIANTS:
+        print "%-10s %12d %16.1f %16.1f" % (variant, results[variant]["number"], results[variant]["bytes_per_detail"], results[variant]["rss_per_detail"])
+    saved = results["classic"]["bytes_per_detail"] - results["compact"]["bytes_per_detail"]
+    print "saved %.1f bytes per detail (%.1f%%), %.1f MB per %d details" % (saved, 100.0 * saved / results["classic"]["bytes_per_detail"], saved * results["compact"]["number"] / 1024 / 1024, results["compact"]["number"])
+
+
+if __name__ == '__main__':
+    parser = OptionParser("%prog [options]")
+    parser.add_option('--number', action='store', type='int', dest="number", default=1000000, help="Number of details")
+    parser.add_option('--variant', action='store', dest="variant", help="Measure only this variant in this process")
+    parser.add_option('--output', action='store', dest="output", help="Write the results to this json file")
+    opts, args = parser.parse_args()
+
+    logging.getLogger('coshsh').setLevel(logging.WARNING)
+    if opts.variant:
+        print json.dumps(measure(opts.variant, opts.number))
+        sys.exit(0)
+    results = run(opts.number)
+    report(results)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(results, f, sort_keys=True, indent=1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""
+Writes a synthetic inventory in the format of datasource_csvfile.
+
+  python benchmarks/inventory.py --dir /tmp/bench --hosts 5000
+"""
+
+import os
+import csv
+import random
+from optparse import OptionParser
+
+LINUX_TYPES = ["red hat", "debian", "ubuntu", "sles"]
+WINDOWS_TYPES = ["windows2k8r2", "windows2012", "windows2016"]
+APP_TYPES = ["mysql", "apache", "tomcat", "oracle", "nginx"]
+
+
+def write_inventory(directory, name="bench", hosts=1000, linux=70, apps=1,
+        filesystems=3, ports=1, urls=1, keyvalues=1, sites=10, contacts=20, seed=42):
+    """
+    hosts       number of hosts, every one has an os application
+    linux       percent of hosts with a linux os, the others are windows
+    apps        applications per host (besides the os)
+    filesystems FILESYSTEM details per os
+    ports, urls PORT and URL details per application
+    keyvalues   KEYVALUES details per os
+    sites       the hosts are spread over sites, every site has a
+                contactgroup which is assigned with regex host_name rows
+    Returns a dict with the number of rows per file.
+    """
+    rnd = random.Random(seed)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    counts = dict.fromkeys(["hosts", "applications", "applicationdetails", "contactgroups", "contacts"], 0)
+    def writer(kind, columns):
+        f = open(os.path.join(directory, "%s_%s.csv" % (name, kind)), "wb")
+        w = csv.writer(f)
+        w.writerow(columns)
+        return f, w
+    hf, hw = writer("hosts", ["host_name", "address", "type", "os", "hardware", "virtual", "notification_period", "location", "department"])
+    af, aw = writer("applications", ["host_name", "name", "type", "component", "version", "check_period"])
+    df, dw = writer("applicationdetails", ["host_name", "name", "type", "monitoring_type", "monitoring_0", "monitoring_1", "monitoring_2", "monitoring_3", "monitoring_4", "monitoring_5"])
+    os_types = {}
+    for i in range(hosts):
+        site = i % sites
+        host_name = "bench_s%d_host_%06d" % (site, i)
+        address = "10.%d.%d.%d" % (site, (i / 250) % 250, i % 250 + 1)
+        if rnd.randint(1, 100) <= linux:
+            os_type = rnd.choice(LINUX_TYPES)
+        else:
+            os_type = rnd.choice(WINDOWS_TYPES)
+        os_types[os_type] = True
+        hw.writerow([host_name, address, "server", "", "Proliant DL380 G%d" % rnd.randint(6, 10), rnd.choice(["ps", "vs"]), "7x24", "rack%d" % site, "department%d" % site])
+        counts["hosts"] += 1
+        aw.writerow([host_name, "os", os_type, "", "%d.%d" % (rnd.randint(5, 10), rnd.randint(0, 9)), "7x24"])
+        counts["applications"] += 1
+        for fs in range(filesystems):
+            path = ("/data%d" % fs if fs else "/") if os_type in LINUX_TYPES else "%s:" % chr(ord("C") + fs)
+            dw.writerow([host_name, "os", os_type, "FILESYSTEM", path, rnd.randint(10, 20), rnd.randint(5, 9), "", "", ""])
+            counts["applicationdetails"] += 1
+        for kv in range(keyvalues):
+            dw.writerow([host_name, "os", os_type, "KEYVALUES", "swap_warning_%d" % kv, "15%", "swap_critical_%d" % kv, "8%", "", ""])
+            counts["applicationdetails"] += 1
+        for a in range(apps):
+            app_type = APP_TYPES[(i + a) % len(APP_TYPES)]
+            app_name = "%s%d" % (app_type, a)
+            aw.writerow([host_name, app_name, app_type, "", "1.%d" % a, "7x24"])
+            counts["applications"] += 1
+            for p in range(ports):
+                dw.writerow([host_name, app_name, app_type, "PORT", 3000 + 10 * a + p, "1", "10", "", "", ""])
+                counts["applicationdetails"] += 1
+            for u in range(urls):
+                dw.writerow([host_name, app_name, app_type, "URL", "http://%s:%d/status/%d" % (host_name, 8000 + a, u), "5", "10", "", "", ""])
+                counts["applicationdetails"] += 1
+    for f in [hf, af, df]:
+        f.close()
+    cf, cw = writer("contactgroups", ["host_name", "name", "type", "groups"])
+    for site in range(sites):
+        # regular expressions, every row matches a whole site
+        cw.writerow(["bench_s%d_host_.*" % site, "", "", "site%d_admins" % site])
+        counts["contactgroups"] += 1
+        for os_type in sorted(os_types.keys()):
+            cw.writerow(["bench_s%d_host_.*" % site, "os", os_type, "site%d_os:all_os" % site])
+            counts["contactgroups"] += 1
+    cf.close()
+    tf, tw = writer("contacts", ["name", "type", "address", "userid", "notification_period", "groups"])
+    for c in range(contacts):
+        site = c % sites
+        tw.writerow(["Admin %d" % c, rnd.choice(["MAIL", "WEBREADONLY", "WEBREADWRITE"]), "admin%d@example.com" % c, "admin%d" % c, "7x24", "site%d_admins:all_os" % site])
+        counts["contacts"] += 1
+    tf.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = OptionParser("%prog --dir directory [options]")
+    parser.add_option('--dir', action='store', dest="dir", help="Where the csv files are written")
+    parser.add_option('--name', action='store', dest="name", default="bench", help="The name of the datasource, the prefix of the files")
+    for option, default, text in [("hosts", 1000, "Number of hosts"), ("linux", 70, "Percent of linux hosts"), ("apps", 1, "Applications per host"), ("filesystems", 3, "FILESYSTEM details per os"), ("ports", 1, "PORT details per application"), ("urls", 1, "URL details per application"), ("keyvalues", 1, "KEYVALUES details per os"), ("sites", 10, "Sites, every site has a contactgroup"), ("contacts", 20, "Number of contacts"), ("seed", 42, "Random seed")]:
+        parser.add_option('--' + option, action='store', type='int', dest=option, default=default, help=text)
+    opts, args = parser.parse_args()
+    if not opts.dir:
+        parser.error("Use option --dir")
+    counts = write_inventory(opts.dir, opts.name, opts.hosts, opts.linux, opts.apps, opts.filesystems, opts.ports, opts.urls, opts.keyvalues, opts.sites, opts.contacts, opts.seed)
+    print ", ".join(["%d %s" % (counts[k], k) for k in sorted(counts)])
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""
+Micro-benchmarks of the functions which run once per row or per item.
+The fixtures are made of the default recipe classes (and the benchmark
+applications), every operation works on a fresh object.
+
+  python benchmarks/micro.py
+  python benchmarks/micro.py --filter get_class --save
+  python benchmarks/micro.py --check
+
+ns/op is the best of --repeat rounds of --number operations.
+allocs/op is the net change of the number of objects tracked by the
+garbage collector, i.e. the containers an operation leaves behind
+(negative if it releases more than it creates).
+"""
+
+import sys
+import os
+import re
+import gc
+import json
+import time
+import copy
+import random
+import logging
+from optparse import OptionParser
+
+sys.dont_write_bytecode = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import coshsh
+from coshsh.util import compare_attr
+from coshsh.item import Item
+from coshsh.application import Application
+from coshsh.monitoringdetail import MonitoringDetail
+from coshsh.datasource import Datasource
+from coshsh.host import Host
+from coshsh.jinja2_extensions import filter_service, filter_host, filter_custom_macros
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+CLASSES = [
+    os.path.join(BENCHDIR, "recipe", "classes"),
+    os.path.join(BENCHDIR, "..", "recipes", "default", "classes"),
+]
+BASELINE = os.path.join(BENCHDIR, "micro_baseline.json")
+LINUX_RE = ".*red\s*hat.*|.*rhel.*|.*sles.*|.*linux.*|.*limux.*|.*debian.*|.*ubuntu.*|.*centos.*"
+OS_TYPES = ["red hat", "debian", "ubuntu", "sles", "windows2012", "windows2016"]
+APP_TYPES = ["mysql", "apache", "tomcat", "oracle", "nginx"]
+
+_classes_loaded = False
+
+
+def init_classes():
+    # like recipe.init_class_cache, classpath in the same order
+    global _classes_loaded
+    if not _classes_loaded:
+        Application.init_classes(CLASSES)
+        MonitoringDetail.init_classes(CLASSES)
+        Datasource.init_classes(CLASSES)
+        _classes_loaded = True
+
+
+class Fixtures(object):
+    """
+    Rows like a datasource reads them.
+    """
+
+    def __init__(self, seed=42):
+        self.rnd = random.Random(seed)
+
+    def host_row(self, i):
+        return {
+            "host_name": "bench_host_%06d" % i,
+            "address": "10.0.%d.%d" % (i / 250 % 250, i % 250 + 1),
+            "type": "server",
+            "os": "",
+            "hardware": "Proliant",
+            "virtual": "vs",
+            "templates": "generic-host,site%d" % (i % 10),
+            "hostgroups": "site%d,department%d,%s" % (i % 10, i % 7, self.rnd.choice(["web", "db", "app"])),
+            "contactgroups": "site%d_admins,department%d_admins" % (i % 10, i % 7),
+            "parents": "switch%d" % (i % 20),
+        }
+
+    def app_row(self, i):
+        if i % 2:
+            name, app_type = "os", self.rnd.choice(OS_TYPES)
+        else:
+            name, app_type = "app", self.rnd.choice(APP_TYPES)
+        return {
+            "host_name": "bench_host_%06d" % i,
+            "name": name,
+            "type": app_type,
+            "component": "",
+            "version": "1.0",
+            "check_period": "7x24",
+        }
+
+    def detail_rows(self, i, app_row):
+        base = dict([(k, app_row[k]) for k in ["host_name", "name", "type"]])
+        rows = []
+        for fs in ["/", "/var", "/data", "/data", "/opt", "/tmp"]:
+            rows.append(dict(base, monitoring_type="FILESYSTEM", monitoring_0=fs, monitoring_1=str(self.rnd.randint(10, 20)), monitoring_2="5"))
+        for port in [3306, 8080, 8443]:
+            rows.append(dict(base, monitoring_type="PORT", monitoring_0=str(port), monitoring_1="1", monitoring_2="10"))
+        rows.append(dict(base, monitoring_type="URL", monitoring_0="http://%s:8080/status" % base["host_name"], monitoring_1="5", monitoring_2="10"))
+        rows.append(dict(base, monitoring_type="KEYVALUES", monitoring_0="swap_warning", monitoring_1="15%", monitoring_2="swap_critical", monitoring_3="8%"))
+        rows.append(dict(base, monitoring_type="LOGIN", monitoring_0="monitor", monitoring_1="secret"))
+        rows.append(dict(base, monitoring_type="CUSTOMMACRO", monitoring_0="OWNER", monitoring_1="team%d" % (i % 5)))
+        for service in ["os_linux_default_check_ssh", "app_bench_default_port"]:
+            rows.append(dict(base, monitoring_type="NAGIOSCONF", monitoring_0=service, monitoring_1="max_check_attempts", monitoring_2="3"))
+        return rows
+
+    def host(self, i):
+        return Host(self.host_row(i))
+
+    def application(self, i):
+        row = self.app_row(i)
+        app = Application(copy.copy(row))
+        # like recipe.assemble does before the details are resolved
+        app.host = self.host(i)
+        for detail_row in self.detail_rows(i, row):
+            app.monitoring_details.append(MonitoringDetail(detail_row))
+        return app
+
+    def resolved_application(self, i):
+        app = self.application(i)
+        app.resolve_monitoring_details()
+        return app
+
+
+def bench_compare_attr(fixtures, n):
+    rows = [fixtures.app_row(i) for i in range(n)]
+    return rows, lambda row: compare_attr("type", row, LINUX_RE)
+
+
+def bench_application_get_class(fixtures, n):
+    rows = [fixtures.app_row(i) for i in range(n)]
+    return rows, Application.get_class
+
+
+def bench_detail_get_class(fixtures, n):
+    rows = []
+    while len(rows) < n:
+        rows.extend(fixtures.detail_rows(len(rows), fixtures.app_row(len(rows))))
+    return rows[:n], MonitoringDetail.get_class
+
+
+def bench_resolve_monitoring_details(fixtures, n):
+    return [fixtures.application(i) for i in range(n)], lambda app: app.resolve_monitoring_details()
+
+
+def bench_pythonize(fixtures, n):
+    items = []
+    for i in range(n):
+        items.append(Item(fixtures.host_row(i)))
+    return items, lambda item: item.pythonize()
+
+
+def bench_depythonize(fixtures, n):
+    items = []
+    for i in range(n):
+        item = Item(fixtures.host_row(i))
+        item.pythonize()
+        items.append(item)
+    return items, lambda item: item.depythonize()
+
+
+def bench_filter_service(fixtures, n):
+    return [fixtures.resolved_application(i) for i in range(n)], lambda app: filter_service(app, "os_linux_default_check_ssh")
+
+
+def bench_filter_host(fixtures, n):
+    hosts = []
+    for i in range(n):
+        host = fixtures.host(i)
+        app = fixtures.application(i)
+        host.monitoring_details = [d for d in app.monitoring_details if d.monitoring_type == "NAGIOSCONF"]
+        host.custom_macros = {"OWNER": "team%d" % (i % 5), "_SITE": "site%d" % (i % 10)}
+        hosts.append(host)
+    return hosts, filter_host
+
+
+def bench_filter_custom_macros(fixtures, n):
+    return [fixtures.resolved_application(i) for i in range(n)], filter_custom_macros
+
+
+def bench_detail_sort(fixtures, n):
+    # the lists of one application are sorted in recipe.assemble
+    details = []
+    for i in range(n):
+        app = fixtures.application(i)
+        details.append([d for d in app.monitoring_details])
+        fixtures.rnd.shuffle(details[-1])
+    return details, lambda details: details.sort()
+
+
+def bench_datasource_add(fixtures, n):
+    init_classes()
+    ds = Datasource(name="bench", type="csv", dir="/nonexistent")
+    ds.objects = {"hosts": {}, "applications": {}}
+    for i in range(n):
+        ds.add("hosts", fixtures.host(i))
+    return [fixtures.application(i) for i in range(n)], lambda app: ds.add("applications", app)
+
+
+BENCHMARKS = [
+    ("compare_attr", bench_compare_attr),
+    ("application_get_class", bench_application_get_class),
+    ("detail_get_class", bench_detail_get_class),
+    ("resolve_monitoring_details", bench_resolve_monitoring_details),
+    ("pythonize", bench_pythonize),
+    ("depythonize", bench_depythonize),
+    ("filter_service", bench_filter_service),
+    ("filter_host", bench_filter_host),
+    ("filter_custom_macros", bench_filter_custom_macros),
+    ("detail_sort", bench_detail_sort),
+    ("datasource_add", bench_datasource_add),
+]
+
+
+def measure(prepare, number):
+    """
+    Runs the operation once on every prepared argument.
+    Returns (seconds, allocs) of the whole round.
+    """
+    fixtures = Fixtures()
+    args, op = prepare(fixtures, number)
+    gcold = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        objects = len(gc.get_objects())
+        timer = time.time
+        t0 = timer()
+        for arg in args:
+            op(arg)
+        t1 = timer()
+        allocs = len(gc.get_objects()) - objects
+    finally:
+        if gcold:
+            gc.enable()
+    return t1 - t0, allocs
+
+
+def run(pattern=None, number=1000, repeat=5):
+    """
+    Returns a dict name: {"ns_per_op":, "allocs_per_op":, "number":}
+    """
+    init_classes()
+    results = {}
+    for name, prepare in BENCHMARKS:
+        if pattern and not re.search(pattern, name):
+            continue
+        rounds = [measure(prepare, number) for r in range(repeat)]
+        seconds = min([r[0] for r in rounds])
+        allocs = min([r[1] for r in rounds])
+        results[name] = {
+            "ns_per_op": 1e9 * seconds / number,
+            "allocs_per_op": float(allocs) / number,
+            "number": number,
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of (name, baseline ns/op, ns/op, change in percent, regression).
+    """
+    rows = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["ns_per_op"], results[name]["ns_per_op"]
+        percent = 100.0 * (new - old) / old if old else 0.0
+        rows.append((name, old, new, percent, percent > threshold))
+    return rows
+
+
+def report(results, baseline={}):
+    print "%-28s %12s %10s %12s %8s" % ("benchmark", "ns/op", "allocs/op", "baseline", "change")
+    for name, prepare in BENCHMARKS:
+        if name not in results:
+            continue
+        line = "%-28s %12.0f %10.1f" % (name, results[name]["ns_per_op"], results[name]["allocs_per_op"])
+        if name in baseline:
+            old = baseline[name]["ns_per_op"]
+            line += " %12.0f %7.1f%%" % (old, 100.0 * (results[name]["ns_per_op"] - old) / old if old else 0.0)
+        print line
+
+
+if __name__ == '__main__':
+    parser = OptionParser("%prog [options]")
+    parser.add_option('--filter', action='store', dest="filter", help="Run only benchmarks matching this regex")
+    parser.add_option('--number', action='store', type='int', dest="number", default=1000, help="Operations per round")
+    parser.add_option('--repeat', action='store', type='int', dest="repeat", default=5, help="Rounds, the best one counts")
+    parser.add_option('--baseline', action='store', dest="baseline", default=BASELINE, help="The json file with the stored baseline")
+    parser.add_option('--save', action='store_true', dest="save", default=False, help="Store the results in the baseline")
+    parser.add_option('--check', action='store_true', dest="check", default=False, help="Exit 1 if a benchmark is slower than the baseline")
+    parser.add_option('--threshold', action='store', type='float', dest="threshold", default=20.0, help="Percent a benchmark may get slower")
+    opts, args = parser.parse_args()
+
+    logging.getLogger('coshsh').setLevel(logging.WARNING)
+    results = run(opts.filter, opts.number, opts.repeat)
+    baseline = {}
+    if os.path.exists(opts.baseline):
+        baseline = json.load(open(opts.baseline))
+    report(results, baseline)
+    if opts.save:
+        # keep the baselines of benchmarks which were filtered out
+        baseline.update(results)
+        with open(opts.baseline, "w") as f:
+            json.dump(baseline, f, sort_keys=True, indent=1)
+        print "baseline written to %s" % opts.baseline
+    if opts.check:
+        regressions = [r for r in compare(results, baseline, opts.threshold) if r[4]]
+        for name, old, new, percent, regression in regressions:
+            print "REGRESSION %s %.0f ns/op -> %.0f ns/op (%+.1f%%)" % (name, old, new, percent)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import coshsh
+from coshsh.application import Application
+from coshsh.templaterule import TemplateRule
+from coshsh.util import compare_attr
+
+def __mi_ident__(params={}):
+    if coshsh.util.compare_attr("type", params, "mysql|apache|tomcat|oracle|nginx"):
+        return BenchApplication
+__mi_ident__.ident_match = {"type": "mysql|apache|tomcat|oracle|nginx"}
+
+
+class BenchApplication(coshsh.application.Application):
+    template_rules = [
+        coshsh.templaterule.TemplateRule(
+            template="app_bench_default",
+            unique_config="app_bench_%s_default",
+        )
+    ]
@@ -0,0 +1,23 @@
+{# the applications of benchmarks/inventory.py #}
+{% for port in application.ports %}
+{{ application|service("app_bench_default_" + application.name + "_port_" + port.port) }}
+    host_name              {{ application.host_name }}
+    use                    app_bench_default
+    check_command          check_tcp!{{ port.port }}!{{ port.warning }}!{{ port.critical }}
+}
+
+{% endfor %}
+{% for url in application.urls %}
+{{ application|service("app_bench_default_" + application.name + "_url_" + loop.index|string) }}
+    host_name              {{ application.host_name }}
+    use                    app_bench_default
+    check_command          check_http!{{ url.hostname }}!{{ url.port }}!{{ url.path }}!{{ url.warning }}!{{ url.critical }}
+}
+
+{% endfor %}
+{{ application|service("app_bench_default_" + application.name + "_version") }}
+    host_name              {{ application.host_name }}
+    use                    app_bench_default
+    check_command          check_version!{{ application.type }}!{{ application.version }}
+{{ application|custom_macros }}
+}
@@ -12,6 +12,7 @@ import imp
 import inspect
 import logging
 import coshsh
+from coshsh.classregistry import ClassRegistry
 from coshsh.item import Item
 from coshsh.templaterule import TemplateRule
 
@@ -24,6 +25,8 @@ class ApplicationNotImplemented(Exception):
 class Application(coshsh.item.Item):
 
     class_factory = []
+    # the params which the ident functions look at, see ClassRegistry.dispatch
+    ident_params = ["name", "type"]
     lower_columns = ['name', 'type', 'component', 'version', 'patchlevel']
 
     def __init__(self, params):
@@ -41,7 +44,7 @@ class Application(coshsh.item.Item):
                 self.contact_groups = []
                 super(Application, self).__init__(params)
                 self.__init__(params)
-                self.fingerprint = lambda s=self:s.__class__.fingerprint(params)
+                self.set_fingerprint(params)
             else:
                 logger.debug('this will be Generic %s' % params)
                 self.__class__ = GenericApplication
@@ -49,11 +52,11 @@ class Application(coshsh.item.Item):
                 super(Application, self).__init__(params)
                 self.__init__(params)
                 #raise ApplicationNotImplemented
-                self.fingerprint = lambda s=self:s.__class__.fingerprint(params)
+                self.set_fingerprint(params)
         else:
             pass
 
-    @classmethod
+    @coshsh.item.fingerprintmethod
     def fingerprint(self, params={}):
         return "%s+%s+%s" % (params["host_name"], params["name"], params["type"])
 
@@ -71,39 +74,18 @@ class Application(coshsh.item.Item):
         pass
 
     @classmethod
-    def init_classes(cls, classpath):
+    def init_classes(cls, classpath, cache_dir=None):
         sys.dont_write_bytecode = True
-        for p in [p for p in reversed(classpath) if os.path.exists(p) and os.path.isdir(p)]:
-            for module, path in [(item, p) for item in sorted(os.listdir(p), reverse=True) if item[-3:] == ".py" and (item.startswith('app_') or item.startswith('os_'))]:
-                try:
-                    path = os.path.abspath(path)
-                    fp, filename, data = imp.find_module(module.replace('.py', ''), [path])
-                    toplevel = imp.load_source(module.replace(".py", ""), filename)
-                    for cl in inspect.getmembers(toplevel, inspect.isfunction):
-                        if cl[0] ==  "__mi_ident__":
-                            cls.class_factory.append([path, module, cl[1]])
-                except Exception, e:
-                    print e
-                finally:
-                    if fp:
-                        fp.close()
+        cls.class_factory = ClassRegistry.class_factory(classpath, lambda item: item.startswith('app_') or item.startswith('os_'), '__mi_ident__', cache_dir)
         #print ".............fill %s / %s woth %s" % (cls, cls.__name__, cls.class_factory)
 
 
     @classmethod
     def get_class(cls, params={}):
-        #print "getclass from cache", cls, cls.__name__,  cls.class_factory
-        for path, module, class_func in reversed(cls.class_factory):
-            try:
-                #print "get_class trys", path, module, class_func
-                newcls = class_func(params)
-                #print "get_class says", newcls.__module__, sys.modules[newcls.__module__].__file__
-                if newcls:
-                    return newcls
-            except Exception:
-                pass
-        logger.debug("found no matching class for this monitoring item %s" % params)
-        return None
+        newcls = ClassRegistry.dispatch(cls, params)
+        if not newcls:
+            logger.debug("found no matching class for this monitoring item %s" % params)
+        return newcls
 
 
 class GenericApplication(Application):
@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import sys
+import os
+import re
+import imp
+import ast
+import json
+import time
+import struct
+import marshal
+import hashlib
+import inspect
+import logging
+import threading
+
+logger = logging.getLogger('coshsh')
+
+INDEX_VERSION = 1
+IDENT_RE = re.compile(r'^__\w+_ident__$')
+
+
+class ClassRegistry(object):
+    """
+    The class files of all the recipes of a process.
+    The class files with the same name in the directories of a classes_path
+    share one module, because class files rely on names which an earlier
+    file of the same name imported. This module has a name which is unique
+    for the classes_path (a ClassScope), so recipes with other classes dirs
+    never see it, recipes with the same classes_path use the same one.
+    A group of files is imported once and again only if an mtime changed.
+    The ident functions of a class file which is not imported yet are
+    LazyIdent placeholders, made from the plugin index of the directory.
+    """
+
+    # (filename, module name): (mtime, module)
+    modules = {}
+    loads = {}
+    duplicates = {}
+    # tuple(classes_path): ClassScope
+    scopes = {}
+    active = threading.local()
+    default_scope = None
+    lock = threading.RLock()
+    # directory: {file: index entry}
+    indexes = {}
+    prefiltered = 0
+    # how class files were imported: [number, seconds]
+    load_times = {"source": [0, 0.0], "compiled": [0, 0.0], "cached": [0, 0.0]}
+    dispatch_caches = {}
+    # class name: [hits, misses, exceptions of ident functions]
+    dispatch_stats = {}
+    # class files with ident functions which switch off the dispatch cache
+    undeclared = set()
+
+    @classmethod
+    def load(cls, path, module, cache_dir=None, name=None):
+        """
+        Executes a class file in the module called name (which is created
+        if necessary), by default the name of the file.
+        """
+        filename = os.path.join(os.path.abspath(path), module)
+        name = name or module.replace(".py", "")
+        mtime = os.path.getmtime(filename)
+        try:
+            started = time.time()
+            if cache_dir:
+                toplevel, how = cls.load_cached(filename, name, cache_dir)
+            else:
+                toplevel, how = imp.load_source(name, filename), "source"
+            cls.load_times[how][0] += 1
+            cls.load_times[how][1] += time.time() - started
+        except Exception, exp:
+            if (filename, name) in cls.modules:
+                # maybe somebody is still editing the file
+                logger.critical("could not reload %s, keeping the old classes: %s" % (filename, exp))
+                sys.modules.setdefault(name, cls.modules[(filename, name)][1])
+                return cls.modules[(filename, name)][1]
+            raise
+        cls.modules[(filename, name)] = (mtime, toplevel)
+        cls.loads[filename] = cls.loads.get(filename, 0) + 1
+        return toplevel
+
+    @classmethod
+    def load_cached(cls, filename, name, cache_dir):
+        """
+        Imports a class file like imp.load_source, but the code object
+        comes from a marshal file in cache_dir if it was compiled from a
+        source with the same mtime and size by the same python version.
+        Returns the module and "cached" or "compiled".
+        """
+        st = os.stat(filename)
+        header = imp.get_magic() + struct.pack("<dq", st.st_mtime, st.st_size)
+        # the same file in other scopes uses the same cache file
+        cache_file = os.path.join(cache_dir, "%s_%s.code" % (os.path.basename(filename)[:-3], hashlib.sha1(filename).hexdigest()[:16]))
+        code = None
+        try:
+            with open(cache_file, "rb") as f:
+                if f.read(len(header)) == header:
+                    code = marshal.loads(f.read())
+        except (IOError, EOFError, ValueError, TypeError):
+            code = None
+        if code is not None:
+            return exec_code(name, filename, code), "cached"
+        with open(filename, "rU") as f:
+            code = compile(f.read(), filename, "exec", 0, True)
+        try:
+            tmp_file = cache_file + ".%d" % os.getpid()
+            with open(tmp_file, "wb") as f:
+                f.write(header)
+                marshal.dump(code, f)
+            os.rename(tmp_file, cache_file)
+        except Exception, exp:
+            logger.debug("could not write code cache %s: %s" % (cache_file, exp))
+        return exec_code(name, filename, code), "compiled"
+
+    @classmethod
+    def scope(cls, classpath):
+        key = tuple([os.path.abspath(p) for p in classpath])
+        with cls.lock:
+            if key not in cls.scopes:
+                cls.scopes[key] = ClassScope(key)
+                if not [i for i in sys.meta_path if isinstance(i, ScopeImporter)]:
+                    sys.meta_path.append(ScopeImporter())
+            return cls.scopes[key]
+
+    @classmethod
+    def activate(cls, classpath):
+        """
+        Top level imports which are not found in sys.modules are looked
+        up in the classes dirs of the active scope first, like they were
+        in the days when every recipe prepended its classes_path to sys.path.
+        Threads without an own active scope use the last activated one.
+        """
+        scope = cls.scope(classpath) if classpath else None
+        cls.active.scope = scope
+        cls.default_scope = scope
+
+    @classmethod
+    def active_scope(cls):
+        return getattr(cls.active, "scope", None) or cls.default_scope
+
+    @classmethod
+    def class_factory(cls, classpath, accept, ident_name, cache_dir=None):
+        """
+        The class_factory list of the class files in classpath, for which
+        accept(filename) is true. The directories are read in reverse
+        order, so the ident functions of the first one are the last ones.
+        Only class files which have already been imported contribute their
+        functions, the others get a LazyIdent with what the plugin index
+        knows about the function named ident_name.
+        With a cache_dir the plugin indexes and the compiled class files
+        are stored there, without one the indexes are kept in memory.
+        """
+        with cls.lock:
+            scope = cls.scope(classpath)
+            scope.found.clear()
+            listing = []
+            for p in [p for p in reversed(scope.classpath) if os.path.exists(p) and os.path.isdir(p)]:
+                index = cls.index(p, cache_dir)
+                for module in sorted([f for f in index.keys() if accept(f)], reverse=True):
+                    listing.append((p, module, index[module]))
+            members = {}
+            for p, module, entry in listing:
+                members.setdefault(module, []).append((p, entry["mtime"]))
+            for module in members:
+                group = scope.groups.get(module)
+                if group and group.members == members[module] and group.loaded:
+                    for p, mtime in members[module]:
+                        filename = os.path.join(p, module)
+                        cls.duplicates[filename] = cls.duplicates.get(filename, 0) + 1
+                elif not group or group.members != members[module]:
+                    scope.groups[module] = LazyGroup(scope, module, members[module], cache_dir)
+            class_factory = []
+            for p, module, entry in listing:
+                group = scope.groups[module]
+                if "error" in entry and not group.loaded:
+                    # nothing to wait for, a broken file fails like it always did
+                    group.load()
+                if group.loaded:
+                    func = group.idents.get(p, {}).get(ident_name)
+                    if func:
+                        class_factory.append([p, module, func])
+                elif ident_name in entry.get("idents", {}):
+                    lazy_entry = [p, module, None]
+                    lazy_entry[2] = LazyIdent(group, ident_name, lazy_entry, entry["idents"][ident_name])
+                    group.add(p, lazy_entry[2])
+                    class_factory.append(lazy_entry)
+            return class_factory
+
+    @classmethod
+    def index(cls, path, cache_dir=None):
+        """
+        The plugin index of a classes directory, {file: entry} with
+        entry = {"mtime":, "size":, "idents": {name: declarations}} or
+        {"mtime":, "size":, "error":} for files which can not be parsed.
+        Only files whose mtime or size changed are parsed again. The index
+        is stored in cache_dir (if there is one) for the next run, never
+        in the classes directory itself.
+        """
+        index = cls.indexes.get(path)
+        if index is None:
+            index = cls.read_index(path, cache_dir)
+        changed = False
+        files = {}
+        for module in [f for f in os.listdir(path) if f[-3:] == ".py"]:
+            filename = os.path.join(path, module)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            entry = index.get(module)
+            if not entry or entry["mtime"] != st.st_mtime or entry["size"] != st.st_size:
+                entry = {"mtime": st.st_mtime, "size": st.st_size}
+                entry.update(index_source(filename))
+                changed = True
+            files[module] = entry
+        if changed or len(files) != len(index):
+            cls.write_index(path, files, cache_dir)
+        cls.indexes[path] = files
+        return files
+
+    @classmethod
+    def index_file(cls, path, cache_dir=None):
+        if cache_dir:
+            return os.path.join(cache_dir, "plugin_index_%s.json" % hashlib.sha1(path).hexdigest()[:16])
+        return None
+
+    @classmethod
+    def read_index(cls, path, cache_dir=None):
+        if not cache_dir:
+            return {}
+        try:
+            with open(cls.index_file(path, cache_dir)) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                return data["files"]
+        except Exception:
+            pass
+        return {}
+
+    @classmethod
+    def write_index(cls, path, files, cache_dir=None):
+        index_file = cls.index_file(path, cache_dir)
+        if not index_file or not os.access(os.path.dirname(index_file), os.W_OK):
+            # without a (writable) cache_dir a new process indexes again
+            return
+        try:
+            tmp_path = index_file + ".%d" % os.getpid()
+            with open(tmp_path, "w") as f:
+                json.dump({"version": INDEX_VERSION, "files": files}, f, sort_keys=True, indent=1)
+            os.rename(tmp_path, index_file)
+        except Exception, exp:
+            logger.debug("could not write plugin index of %s: %s" % (path, exp))
+
+    @classmethod
+    def is_loaded(cls, filename):
+        filename = os.path.abspath(filename)
+        return bool([key for key in cls.modules if key[0] == filename])
+
+    @classmethod
+    def forget(cls, filename):
+        filename = os.path.abspath(filename)
+        keys = [key for key in cls.modules if key[0] == filename]
+        for key in keys:
+            del cls.modules[key]
+        if keys:
+            logger.info("class registry forgets %s" % filename)
+
+    @classmethod
+    def clear_dispatch_caches(cls, filenames, class_factories=()):
+        """
+        Drops the remembered classes of the class_factory lists which
+        contain one of the class files or are among class_factories,
+        together with the ident functions which these lists hold.
+        """
+        filenames = set([os.path.abspath(f) for f in filenames])
+        class_factories = [id(class_factory) for class_factory in class_factories]
+        with cls.lock:
+            for key, cache in cls.dispatch_caches.items():
+                if key in class_factories or [e for e in cache.class_factory if os.path.join(os.path.abspath(e[0]), e[1]) in filenames]:
+                    del cls.dispatch_caches[key]
+
+    @classmethod
+    def dispatch(cls, klass, params, reverse=True):
+        """
+        get_class of Application, MonitoringDetail and Contact.
+        The class found by the ident functions is remembered for the
+        values of the params it depends on, which are the ident_params
+        of klass plus the ones which an ident function declares, e.g.
+          __mi_ident__.ident_params = ["type", "version"]
+        An ident function with ident_params = None depends on all the
+        params, it is called every time. So is an ident function which
+        declares neither ident_params nor ident_match, nobody knows
+        which params it reads. The results of the other ones are still
+        remembered (see DispatchCache).
+        """
+        cache = cls.dispatch_caches.get(id(klass.class_factory))
+        if not cache or cache.class_factory is not klass.class_factory or cache.size != len(klass.class_factory):
+            # every recipe has its own class_factory list
+            cache = DispatchCache(klass.class_factory, klass.ident_params)
+            cls.dispatch_caches[id(klass.class_factory)] = cache
+        stats = cls.dispatch_stats.get(klass.__name__)
+        if not stats:
+            stats = cls.dispatch_stats.setdefault(klass.__name__, [0, 0, 0])
+        newcls = None
+        called = False
+        for ident_params, class_funcs, classes in (reversed(cache.segments) if reverse else cache.segments):
+            key = None
+            if ident_params is not None:
+                key = (reverse,) + tuple(map(params.get, ident_params))
+                try:
+                    newcls = classes[key]
+                    if newcls:
+                        break
+                    continue
+                except (KeyError, TypeError):
+                    # TypeError: an unhashable value
+                    pass
+            called = True
+            newcls = None
+            for class_func in (reversed(class_funcs) if reverse else class_funcs):
+                try:
+                    newcls = class_func(params)
+                    if newcls:
+                        break
+                except Exception:
+                    stats[2] += 1
+            if key is not None:
+                try:
+                    classes[key] = newcls
+                except TypeError:
+                    pass
+            if newcls:
+                break
+        # a miss is a lookup which had to call ident functions
+        stats[1 if called else 0] += 1
+        return newcls
+
+    @classmethod
+    def get_stats(cls):
+        return {
+            "indexed": sum([len(index) for index in cls.indexes.values()], 0),
+            "prefiltered": cls.prefiltered,
+            "registered": len(set([key[0] for key in cls.modules])),
+            "scopes": len(cls.scopes),
+            "modules": len(cls.modules),
+            "loads": sum(cls.loads.values(), 0),
+            "duplicates": sum(cls.duplicates.values(), 0),
+            "load_times": dict([(how, tuple(times)) for how, times in cls.load_times.items()]),
+            "dispatch": dict([(name, tuple(stats)) for name, stats in cls.dispatch_stats.items()]),
+        }
+
+    @classmethod
+    def log_stats(cls):
+        stats = cls.get_stats()
+        if not stats["registered"]:
+            return
+        for filename in sorted(set([key[0] for key in cls.modules])):
+            logger.debug("class file %s imported %d times, reused %d times" % (filename, cls.loads.get(filename, 0), cls.duplicates.get(filename, 0)))
+        logger.info("class registry: %d of %d indexed class files imported %d times into %d modules of %d scopes, %d duplicates reused, %d imports avoided by ident_match" % (stats["registered"], stats["indexed"], stats["loads"], stats["modules"], stats["scopes"], stats["duplicates"], stats["prefiltered"]))
+        for how, text in [("source", "imported from source"), ("compiled", "compiled for the code cache (cold)"), ("cached", "loaded from the code cache (warm)")]:
+            number, seconds = stats["load_times"][how]
+            if number:
+                logger.info("class registry: %d class files %s in %.3fs, %.2fms per file" % (number, text, seconds, 1000.0 * seconds / number))
+        for name, (hits, misses, exceptions) in sorted(stats["dispatch"].items()):
+            logger.info("class dispatch %s: %d hits, %d misses, %d exceptions in ident functions" % (name, hits, misses, exceptions))
+
+
+class DispatchCache(object):
+    """
+    The classes which get_class found in one class_factory list.
+    Consecutive ident functions which declare their params form a
+    segment, which remembers its result (a class or None) for the
+    values of these params. The ident functions which can depend on
+    every param form segments which are called every time.
+    A segment is a list [ident_params or None, ident functions, results].
+    """
+
+    def __init__(self, class_factory, ident_params):
+        self.class_factory = class_factory
+        self.size = len(class_factory)
+        self.segments = []
+        for path, module, class_func in class_factory:
+            if not hasattr(class_func, "ident_params") and not getattr(class_func, "ident_match", None):
+                filename = os.path.join(path, module)
+                if filename not in ClassRegistry.undeclared:
+                    ClassRegistry.undeclared.add(filename)
+                    logger.info("ident function of %s declares neither ident_params nor ident_match, it is called for every get_class" % filename)
+                params = None
+            elif getattr(class_func, "ident_params", ()) is None:
+                params = None
+            else:
+                params = set(ident_params)
+                params.update(getattr(class_func, "ident_params", ()))
+                params.update(getattr(class_func, "ident_match", {}).keys())
+            if self.segments and (params is None) == (self.segments[-1][0] is None):
+                if params is not None:
+                    self.segments[-1][0].update(params)
+                self.segments[-1][1].append(class_func)
+            else:
+                self.segments.append([params, [class_func], {}])
+        for segment in self.segments:
+            if segment[0] is not None:
+                segment[0] = sorted(segment[0])
+
+
+class ClassScope(object):
+    """
+    The classes dirs of a recipe. The class files and the other modules
+    which are found there are imported under names with the id of the
+    scope, so an os_linux.py of one recipe can not replace the one of
+    another recipe in sys.modules.
+    """
+
+    def __init__(self, classpath):
+        self.classpath = classpath
+        self.id = hashlib.sha1("\n".join(classpath)).hexdigest()[:10]
+        # class file: LazyGroup
+        self.groups = {}
+        # other modules in the classes dirs
+        self.helpers = {}
+        self.found = {}
+
+    def module_name(self, name):
+        return "%s_%s" % (name.replace(".py", ""), self.id)
+
+    def find(self, name):
+        """
+        Returns True if name is a module in one of the classes dirs
+        """
+        if name + ".py" in self.groups or name in self.helpers:
+            return True
+        if name not in self.found:
+            try:
+                f, pathname, description = imp.find_module(name, list(self.classpath))
+                if f:
+                    f.close()
+                self.found[name] = True
+            except ImportError:
+                self.found[name] = False
+        return self.found[name]
+
+    def import_module(self, name):
+        with ClassRegistry.lock:
+            if name + ".py" in self.groups:
+                group = self.groups[name + ".py"]
+                group.load()
+                return sys.modules.get(group.name)
+            if name not in self.helpers:
+                f, pathname, description = imp.find_module(name, list(self.classpath))
+                try:
+                    self.helpers[name] = imp.load_module(self.module_name(name), f, pathname, description)
+                finally:
+                    if f:
+                        f.close()
+            return self.helpers[name]
+
+
+class ScopeImporter(object):
+    """
+    Finds top level modules in the classes dirs of the active ClassScope.
+    """
+
+    def find_module(self, fullname, path=None):
+        if path is not None or "." in fullname:
+            return None
+        scope = ClassRegistry.active_scope()
+        if scope and scope.find(fullname):
+            return self
+        return None
+
+    def load_module(self, fullname):
+        # the module is not registered as fullname, the next import of
+        # fullname comes here again and gets the module of its scope
+        return ClassRegistry.active_scope().import_module(fullname)
+
+
+class LazyGroup(object):
+    """
+    The class files with the same name in the directories of a classpath.
+    They share one module, so they are imported together and in the
+    order of the classpath, like init_classes always did.
+    """
+
+    def __init__(self, scope, module, members, cache_dir=None):
+        self.module = module
+        self.name = scope.module_name(module)
+        # [(path, mtime)]
+        self.members = members
+        self.cache_dir = cache_dir
+        self.lazies = []
+        # path: {name: ident function}
+        self.idents = {}
+        self.loaded = False
+        self.loading = False
+
+    def add(self, path, lazy):
+        self.lazies.append((path, lazy))
+
+    def load(self):
+        with ClassRegistry.lock:
+            if self.loaded or self.loading:
+                return
+            self.loading = True
+            try:
+                for path, mtime in self.members:
+                    try:
+                        toplevel = ClassRegistry.load(path, self.module, self.cache_dir, self.name)
+                    except Exception, exp:
+                        logger.critical("could not load %s from %s: %s" % (self.module, path, exp))
+                        continue
+                    # the functions as they are right after this file was imported
+                    self.idents[path] = dict([(name, func) for name, func in inspect.getmembers(toplevel, inspect.isfunction) if IDENT_RE.match(name)])
+                for path, lazy in self.lazies:
+                    lazy.resolve(self.idents.get(path, {}).get(lazy.name))
+                self.lazies = []
+                self.loaded = True
+            finally:
+                self.loading = False
+
+
+class LazyIdent(object):
+    """
+    Stands in for the ident function of a class file which was not
+    imported yet. The first call imports it and replaces the placeholder
+    in the class_factory with the real function. The declarations of
+    the function found by the plugin index are copied, ident_match is
+    a dict param: regex, a param value which does not match (ignoring
+    case) or a missing param means that the function would return None,
+    which is then known without importing the file.
+    """
+
+    def __init__(self, group, name, entry, declarations):
+        self.group = group
+        self.name = name
+        self.entry = entry
+        self.func = None
+        if "ident_params" in declarations:
+            self.ident_params = declarations["ident_params"]
+        self.ident_match = declarations.get("ident_match") or {}
+        self.prefilter = [(key, re.compile(regex, re.IGNORECASE)) for key, regex in self.ident_match.items()]
+
+    def resolve(self, func):
+        self.func = func if inspect.isfunction(func) else None
+        if self.func:
+            self.entry[2] = self.func
+
+    def __call__(self, params={}):
+        for key, regex in self.prefilter:
+            value = params.get(key)
+            if value is None or (isinstance(value, basestring) and not regex.match(value)):
+                ClassRegistry.prefiltered += 1
+                return None
+        if not self.group.loaded:
+            self.group.load()
+        if self.func:
+            return self.func(params)
+        return None
+
+    def __repr__(self):
+        return "<lazy %s of %s>" % (self.name, os.path.join(self.entry[0], self.entry[1]))
+
+
+def exec_code(name, filename, code):
+    # like imp.load_source, a module of the same name is executed again
+    module = sys.modules.get(name)
+    if module is None:
+        module = imp.new_module(name)
+        sys.modules[name] = module
+    module.__file__ = filename
+    try:
+        exec code in module.__dict__
+    except Exception:
+        sys.modules.pop(name, None)
+        raise
+    return sys.modules.get(name, module)
+
+
+def index_source(filename):
+    """
+    The ident functions of a class file and their literal declarations
+      __mi_ident__.ident_params = ["type", "version"]
+      __mi_ident__.ident_match = {"name": "^os$", "type": ".*windows.*"}
+    ident_params which are not a literal are recorded as None, ident_match
+    which is not a literal dict is left out.
+    """
+    try:
+        with open(filename) as f:
+            tree = ast.parse(f.read(), filename)
+    except Exception, exp:
+        return {"error": str(exp)}
+    idents = {}
+    declarations = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and IDENT_RE.match(node.name):
+            idents.setdefault(node.name, {})
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if IDENT_RE.match(alias.asname or alias.name):
+                    idents.setdefault(alias.asname or alias.name, {})
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and IDENT_RE.match(target.id):
+                    idents.setdefault(target.id, {})
+                elif isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and IDENT_RE.match(target.value.id) and target.attr in ("ident_params", "ident_match"):
+                    declarations.append((target.value.id, target.attr, node.value))
+    for name, attr, value in declarations:
+        if name not in idents:
+            continue
+        try:
+            value = ast.literal_eval(value)
+        except ValueError:
+            value = None
+        if attr == "ident_params":
+            if value is not None and not (isinstance(value, (list, tuple)) and all([isinstance(v, basestring) for v in value])):
+                value = None
+            idents[name]["ident_params"] = list(value) if value is not None else None
+        elif isinstance(value, dict) and all([isinstance(k, basestring) and isinstance(v, basestring) for k, v in value.items()]):
+            idents[name]["ident_match"] = value
+        else:
+            idents[name].pop("ident_match", None)
+    return {"idents": idents}
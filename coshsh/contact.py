@@ -12,6 +12,7 @@ import imp
 import inspect
 import logging
 import coshsh
+from coshsh.classregistry import ClassRegistry
 from coshsh.item import Item
 from coshsh.templaterule import TemplateRule
 from coshsh.util import clean_umlauts
@@ -22,6 +23,8 @@ logger = logging.getLogger('coshsh')
 class Contact(coshsh.item.Item):
 
     class_factory = []
+    # the params which the ident functions look at, see ClassRegistry.dispatch
+    ident_params = ["type"]
     lower_columns = []
 
     template_rules = [
@@ -57,14 +60,14 @@ class Contact(coshsh.item.Item):
                 self.__class__ = newcls
                 super(Contact, self).__init__(params)
                 self.__init__(params)
-                self.fingerprint = lambda s=self:s.__class__.fingerprint(params)
+                self.set_fingerprint(params)
             else:
                 logger.debug('this will be Generic %s' % params)
                 self.__class__ = GenericContact
                 self.contactgroups = []
                 super(Contact, self).__init__(params)
                 self.__init__(params)
-                self.fingerprint = lambda s=self:s.__class__.fingerprint(params)
+                self.set_fingerprint(params)
             if not hasattr(self, 'host_notification_period') or not self.host_notification_period:
                 self.host_notification_period = self.notification_period
                 logger.debug('no column host_notification_period found use notification_period instead')
@@ -78,7 +81,7 @@ class Contact(coshsh.item.Item):
         self.name = clean_umlauts(self.name)
 
 
-    @classmethod
+    @coshsh.item.fingerprintmethod
     def fingerprint(self, params):
         return "+".join([unicode(params.get(a, "")) for a in ["name", "type", "address", "userid"]])
 
@@ -88,39 +91,18 @@ class Contact(coshsh.item.Item):
         return unicode("contact %s groups (%s)" % (fipri, grps))
 
     @classmethod
-    def init_classes(cls, classpath):
+    def init_classes(cls, classpath, cache_dir=None):
         sys.dont_write_bytecode = True
-        for p in [p for p in reversed(classpath) if os.path.exists(p) and os.path.isdir(p)]:
-            for module, path in [(item, p) for item in sorted(os.listdir(p), reverse=True) if item[-3:] == ".py" and (item.startswith('contact_') or item == 'contact.py')]:
-                try:
-                    path = os.path.abspath(path)
-                    fp, filename, data = imp.find_module(module.replace('.py', ''), [path])
-                    toplevel = imp.load_source(module.replace(".py", ""), filename)
-                    for cl in inspect.getmembers(toplevel, inspect.isfunction):
-                        if cl[0] ==  "__mi_ident__":
-                            cls.class_factory.append([path, module, cl[1]])
-                except Exception, e:
-                    print e
-                finally:
-                    if fp:
-                        fp.close()
+        cls.class_factory = ClassRegistry.class_factory(classpath, lambda item: item.startswith('contact_') or item == 'contact.py', '__mi_ident__', cache_dir)
         #print ".............fill %s / %s woth %s" % (cls, cls.__name__, cls.class_factory)
 
 
     @classmethod
     def get_class(cls, params={}):
-        #print "getclass from cache", cls, cls.__name__,  cls.class_factory
-        for path, module, class_func in reversed(cls.class_factory):
-            try:
-                #print "get_class trys", path, module, class_func
-                newcls = class_func(params)
-                #print "get_class says", newcls.__module__, sys.modules[newcls.__module__].__file__
-                if newcls:
-                    return newcls
-            except Exception:
-                pass
-        logger.debug("found no matching class for this monitoring item %s" % params)
-        return None
+        newcls = ClassRegistry.dispatch(cls, params)
+        if not newcls:
+            logger.debug("found no matching class for this monitoring item %s" % params)
+        return newcls
 
 
 class GenericContact(Contact):
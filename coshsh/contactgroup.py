@@ -24,9 +24,9 @@ class ContactGroup(coshsh.item.Item):
     def __init__(self, params={}):
         self.members = []
         super(ContactGroup, self).__init__(params)
-        self.fingerprint = lambda s=self:s.__class__.fingerprint(params)
+        self.set_fingerprint(params)
 
-    @classmethod
+    @coshsh.item.fingerprintmethod
     def fingerprint(self, params):
         return "%s" % (params["contactgroup_name"], )
 
@@ -12,8 +12,11 @@ import re
 import imp
 import inspect
 import logging
+import hashlib
+import json
 import coshsh
-from coshsh.util import compare_attr, substenv
+from coshsh.classregistry import ClassRegistry
+from coshsh.util import compare_attr, substenv, fsync_path
 
 logger = logging.getLogger('coshsh')
 
@@ -40,6 +43,17 @@ class Datarecipient(object):
 
     my_type = 'datarecipient'
     class_factory = []
+    # a datarecipient which writes nothing but the config_files of the
+    # items in output() can get them one by one while they are rendered
+    streamable = False
+    streamed = False
+    want_tool = None
+    # path -> (size, sha1) of the files written in the last run. None
+    # means, the files are simply written
+    manifest = None
+    manifest_file = ".coshsh_manifest"
+    # file, dir, syncfs or None
+    fsync = None
 
     def __init__(self, **params):
         #print "datarecipientinit with", self.__class__
@@ -95,20 +109,114 @@ class Datarecipient(object):
             if not want_tool or want_tool == tool:
                 for file in obj.config_files[tool]:
                     content = obj.config_files[tool][file]
-                    with open(os.path.join(my_target_dir, file), "w") as f:
-                        f.write(content)
+                    self.write_file(os.path.join(my_target_dir, file), content)
+
+    def write_file(self, path, content):
+        if self.manifest is None:
+            self.write_content(path, content)
+            return
+        relpath = os.path.relpath(path, self.dynamic_dir)
+        entry = [len(content), hashlib.sha1(content).hexdigest()]
+        self.new_manifest[relpath] = entry
+        old_path = os.path.join(self.manifest_dir, relpath)
+        if self.manifest.get(relpath) == entry and os.path.exists(old_path) and os.path.getsize(old_path) == entry[0]:
+            if old_path != path:
+                # a new dir is populated, the unchanged file is taken over
+                try:
+                    os.link(old_path, path)
+                except OSError:
+                    self.write_content(path, content)
+            self.files_skipped += 1
+        else:
+            self.write_content(path, content)
+            self.files_written += 1
+
+    def write_content(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+            if self.fsync == "file":
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load_manifest(self, manifest_dir=None):
+        """
+        From now on only files which are new or have a different content
+        than in the last run are written. finish_manifest removes the
+        files which were not written again.
+        If the files of the last run are in a manifest_dir other than
+        dynamic_dir, unchanged files are hard-linked from there.
+        """
+        self.manifest_dir = manifest_dir or self.dynamic_dir
+        self.manifest = {}
+        self.new_manifest = {}
+        self.files_written = 0
+        self.files_skipped = 0
+        self.files_deleted = 0
+        try:
+            with open(os.path.join(self.manifest_dir, self.manifest_file)) as f:
+                self.manifest = json.load(f)
+        except IOError:
+            pass
+        except Exception, exp:
+            logger.info("recipient %s manifest is unusable (%s)" % (self.name, exp))
+
+    def finish_manifest(self):
+        if self.manifest is None:
+            return
+        for relpath in [p for p in self.manifest if p not in self.new_manifest]:
+            if self.manifest_dir != self.dynamic_dir:
+                # simply not taken over to the new dir
+                self.files_deleted += 1
+                continue
+            path = os.path.join(self.dynamic_dir, relpath)
+            try:
+                os.remove(path)
+                self.files_deleted += 1
+            except OSError:
+                pass
+            # the directory of a host which is gone
+            dirname = os.path.dirname(path)
+            while os.path.abspath(dirname) != os.path.abspath(self.dynamic_dir):
+                try:
+                    os.rmdir(dirname)
+                except OSError:
+                    break
+                dirname = os.path.dirname(dirname)
+        if self.new_manifest != self.manifest or not os.path.exists(os.path.join(self.dynamic_dir, self.manifest_file)):
+            tmp_path = os.path.join(self.dynamic_dir, self.manifest_file + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.new_manifest, f, sort_keys=True, indent=0)
+            os.rename(tmp_path, os.path.join(self.dynamic_dir, self.manifest_file))
+        self.manifest = self.new_manifest
+        logger.info("recipient %s wrote %d files, %d were unchanged, %d were deleted" % (self.name, self.files_written, self.files_skipped, self.files_deleted))
+
+    def output_stats(self):
+        if self.manifest is None:
+            return None
+        return {"written": self.files_written, "skipped": self.files_skipped, "deleted": self.files_deleted}
+
+    def item_dir(self, objtype, obj):
+        if objtype in ['hostgroups', 'contactgroups', 'contacts']:
+            return objtype
+        elif objtype in ['hosts', 'applications']:
+            return os.path.join("hosts", obj.host_name)
+        return None
 
     def output(self, filter=None, want_tool=None):
-        for hostgroup in self.objects['hostgroups'].values():
-            self.item_write_config(hostgroup, self.dynamic_dir, "hostgroups", want_tool)
-        for host in self.objects['hosts'].values():
-            self.item_write_config(host, self.dynamic_dir, os.path.join("hosts", host.host_name), want_tool)
-        for app in self.objects['applications'].values():
-            self.item_write_config(app, self.dynamic_dir, os.path.join("hosts", app.host_name), want_tool)
-        for cg in self.objects['contactgroups'].values():
-            self.item_write_config(cg, self.dynamic_dir, "contactgroups", want_tool)
-        for c in self.objects['contacts'].values():
-            self.item_write_config(c, self.dynamic_dir, "contacts", want_tool)
+        if self.streamed:
+            # the items were already written by stream_item
+            return
+        for objtype in ['hostgroups', 'hosts', 'applications', 'contactgroups', 'contacts']:
+            for obj in self.objects[objtype].values():
+                self.item_write_config(obj, self.dynamic_dir, self.item_dir(objtype, obj), want_tool)
+
+    def stream_item(self, objtype, obj):
+        # called by the writer thread of Recipe.render
+        subdir = self.item_dir(objtype, obj)
+        if subdir:
+            self.item_write_config(obj, self.dynamic_dir, subdir, self.want_tool)
+            return True
+        return False
 
     def count_objects(self):
         try:
@@ -166,23 +274,9 @@ class Datarecipient(object):
 
 
     @classmethod
-    def init_classes(cls, classpath):
+    def init_classes(cls, classpath, cache_dir=None):
         sys.dont_write_bytecode = True
-        for p in [p for p in reversed(classpath) if os.path.exists(p) and os.path.isdir(p)]:
-            for module, path in [(item, p) for item in sorted(os.listdir(p), reverse=True) if item[-3:] == ".py" and item.startswith('datarecipient_')]:
-                try:
-                    #print "try dr", module, path
-                    path = os.path.abspath(path)
-                    fp, filename, data = imp.find_module(module.replace('.py', ''), [path])
-                    toplevel = imp.load_source(module.replace(".py", ""), filename)
-                    for cl in inspect.getmembers(toplevel, inspect.isfunction):
-                        if cl[0] ==  "__dr_ident__":
-                            cls.class_factory.append([path, module, cl[1]])
-                except Exception, exp:
-                    logger.critical("could not load datarecipient %s from %s: %s" % (module, path, exp))
-                finally:
-                    if fp:
-                        fp.close()
+        cls.class_factory = ClassRegistry.class_factory(classpath, lambda item: item.startswith('datarecipient_'), '__dr_ident__', cache_dir)
 
 
     @classmethod
@@ -13,6 +13,7 @@ import imp
 import inspect
 import logging
 import coshsh
+from coshsh.classregistry import ClassRegistry
 from coshsh.util import compare_attr, substenv
 
 logger = logging.getLogger('coshsh')
@@ -40,6 +41,9 @@ class Datasource(object):
 
     my_type = 'datasource'
     class_factory = []
+    # can be read by a thread while other datasources are read
+    # (a datasource section can say parallel = yes/no)
+    parallel = False
 
     def __init__(self, **params):
         #print "datasourceinit with", self.__class__
@@ -108,23 +112,9 @@ class Datasource(object):
         return objtype in self.objects and fingerprint in self.objects[objtype]
 
     @classmethod
-    def init_classes(cls, classpath):
+    def init_classes(cls, classpath, cache_dir=None):
         sys.dont_write_bytecode = True
-        for p in [p for p in reversed(classpath) if os.path.exists(p) and os.path.isdir(p)]:
-            for module, path in [(item, p) for item in os.listdir(p) if item[-3:] == ".py" and item.startswith('datasource_')]:
-                try:
-                    #print "try ds", module, path
-                    path = os.path.abspath(path)
-                    fp, filename, data = imp.find_module(module.replace('.py', ''), [path])
-                    toplevel = imp.load_source(module.replace(".py", ""), filename)
-                    for cl in inspect.getmembers(toplevel, inspect.isfunction):
-                        if cl[0] ==  "__ds_ident__":
-                            cls.class_factory.append([path, module, cl[1]])
-                except Exception, exp:
-                    logger.critical("could not load datasource %s from %s: %s" % (module, path, exp))
-                finally:
-                    if fp:
-                        fp.close()
+        cls.class_factory = ClassRegistry.class_factory(classpath, lambda item: item.startswith('datasource_'), '__ds_ident__', cache_dir)
 
 
     @classmethod
@@ -6,13 +6,18 @@
 # This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
+import sys
 import os
 import re
 import logging
 import time
 import getpass
+import multiprocessing
 import coshsh
 from coshsh.recipe import Recipe, RecipePidAlreadyRunning, RecipePidNotWritable, RecipePidGarbage
+from coshsh.templateregistry import TemplateRegistry
+from coshsh.classregistry import ClassRegistry
+from coshsh.memprofile import MemProfiler
 from coshsh.util import odict, switch_logging, restore_logging
 
 logger = logging.getLogger('coshsh')
@@ -24,6 +29,15 @@ class Generator(object):
 
     def __init__(self):
         self.recipes = coshsh.util.odict()
+        self.jobs = 1
+        self.summaries = []
+        # daemon mode, the default interval of a recipe and how often
+        # the input files are checked
+        self.interval = 300
+        self.poll_interval = 5
+        self.running = False
+        # snapshot the memory of the recipes after every phase
+        self.memprofile = False
 
     def add_recipe(self, *args, **kwargs):
         try:
@@ -40,6 +54,18 @@ class Generator(object):
         self.pg_password = kwargs.get("password", None)
 
     def run(self):
+        self.init_prometheus()
+        if self.jobs > 1 and len(self.recipes) > 1 and hasattr(os, "fork"):
+            self.summaries = self.run_parallel()
+        else:
+            self.summaries = [self.run_recipe(recipe) for recipe in self.recipes.values()]
+        for summary in self.summaries:
+            self.log_summary(summary)
+        TemplateRegistry.log_stats()
+        ClassRegistry.log_stats()
+        return self.summaries
+
+    def init_prometheus(self):
         try:
             from prometheus_client import CollectorRegistry, Gauge, push_to_gateway, pushadd_to_gateway
             from prometheus_client.exposition import basic_auth_handler, default_handler
@@ -47,33 +73,192 @@ class Generator(object):
             from socket import gethostname
             has_prometheus = True
             try:
-                coshshuser = getpass.getuser()
+                self.pg_coshshuser = getpass.getuser()
             except Exception:
-                coshshuser = os.getenv("username")
-            hostname = gethostname()
-            cookbook = self.cookbook
+                self.pg_coshshuser = os.getenv("username")
+            self.pg_hostname = gethostname()
+            self.pg_cookbook = self.cookbook
             if hasattr(self, "pg_username"):
-                pg_auth_handler = lambda url, method, timeout, headers, data: basic_auth_handler(url, method, timeout, headers, data, self.pg_username, self.pg_password)
+                self.pg_auth_handler = lambda url, method, timeout, headers, data: basic_auth_handler(url, method, timeout, headers, data, self.pg_username, self.pg_password)
             else:
-                pg_auth_handler = default_handler
+                self.pg_auth_handler = default_handler
         except Exception, e:
             if hasattr(self, "pg_job"):
                 logger.critical("problem with prometheus modules: %s" % e)
             has_prometheus = False
         if has_prometheus and not hasattr(self, "pg_address"):
             has_prometheus = False
-        for recipe in self.recipes.values():
-            try:
-	        switch_logging(logfile=recipe.log_file)
-                if recipe.pid_protect():
-                    if has_prometheus:
-                        registry = CollectorRegistry()
-                    tic = time.time()
-                    if recipe.collect():
-                        recipe.assemble()
-                        recipe.render()
-                        recipe.output()
-                        if has_prometheus:
+        self.has_prometheus = has_prometheus
+
+    def log_summary(self, summary):
+        logger.info("recipe %s %s after %.2fs" % (summary["name"], summary["status"], summary["duration"]))
+        if summary.get("files"):
+            logger.info("recipe %s wrote %d files, %d unchanged, %d deleted" % (summary["name"], summary["files"]["written"], summary["files"]["skipped"], summary["files"]["deleted"]))
+
+    def run_daemon(self, cycles=None):
+        """
+        Keeps the recipes with their classes, jinja2 environments and
+        compiled templates and runs every recipe when its interval
+        expired or when one of its input files changed. Changed class
+        files are reloaded, changed templates are compiled again when
+        they are used the next time.
+        cycles limits the number of checks, None runs until stop().
+        """
+        self.init_prometheus()
+        self.running = True
+        next_run = dict([(name, 0) for name in self.recipes])
+        watched = dict([(name, {}) for name in self.recipes])
+        self.daemon_runs = dict([(name, 0) for name in self.recipes])
+        logger.info("daemon watches %d recipes every %ds" % (len(self.recipes), self.poll_interval))
+        cycle = 0
+        while self.running and (cycles is None or cycle < cycles):
+            cycle += 1
+            for name, recipe in self.recipes.items():
+                files = recipe.watched_files()
+                changed = [f for f in set(files.keys() + watched[name].keys()) if files.get(f) != watched[name].get(f)]
+                if time.time() >= next_run[name]:
+                    logger.info("recipe %s is due" % name)
+                elif changed:
+                    logger.info("recipe %s has changed input %s" % (name, ", ".join(sorted(changed)[:5])))
+                else:
+                    continue
+                if watched[name]:
+                    recipe.reload_classes(changed)
+                # the snapshot is taken before the run, a change during
+                # the run triggers the next one
+                watched[name] = files
+                recipe.reset_objects()
+                summary = self.run_recipe(recipe)
+                self.log_summary(summary)
+                self.daemon_runs[name] += 1
+                next_run[name] = time.time() + (recipe.interval or self.interval)
+            if TemplateRegistry.get_stats():
+                TemplateRegistry.log_stats()
+                TemplateRegistry.compiles.clear()
+                TemplateRegistry.hits.clear()
+            if cycles is None or cycle < cycles:
+                self.sleep(self.poll_interval)
+        logger.info("daemon stops")
+
+    def sleep(self, seconds):
+        # wake up early when stop() was called
+        until = time.time() + seconds
+        while self.running and time.time() < until:
+            time.sleep(min(1, until - time.time()))
+
+    def stop(self):
+        self.running = False
+
+    def run_parallel(self):
+        global _worker_generator
+        jobs = min(self.jobs, len(self.recipes))
+        logger.info("running %d recipes with %d jobs" % (len(self.recipes), jobs))
+        _worker_generator = self
+        # every recipe gets a fresh forked process, so the memory of one
+        # recipe's objects is given back before the next one starts. the
+        # summary comes back through a pipe, a process which exits without
+        # sending one (killed, out of memory) fails its recipe.
+        pending = self.recipes.keys()
+        running = {}
+        summaries = {}
+        try:
+            while pending or running:
+                while pending and len(running) < jobs:
+                    name = pending.pop(0)
+                    receiver, sender = multiprocessing.Pipe(False)
+                    process = multiprocessing.Process(target=_run_recipe_in_worker, args=(name, sender), name="coshsh-%s" % name)
+                    process.start()
+                    sender.close()
+                    running[name] = (process, receiver, time.time())
+                finished = False
+                for name, (process, receiver, started) in running.items():
+                    summary = None
+                    # the summary must be read before the process can exit
+                    if receiver.poll():
+                        summary = self.receive_summary(receiver)
+                    elif process.is_alive():
+                        continue
+                    process.join()
+                    if summary is None and receiver.poll():
+                        summary = self.receive_summary(receiver)
+                    receiver.close()
+                    if summary is None:
+                        logger.error("recipe %s worker %d died with exit code %s" % (name, process.pid, process.exitcode))
+                        summary = {
+                            "name": name,
+                            "pid": process.pid,
+                            "status": "failed",
+                            "duration": time.time() - started,
+                            "objects": {},
+                            "files": None,
+                            "steps": [],
+                            "exitcode": process.exitcode,
+                        }
+                    else:
+                        TemplateRegistry.merge_stats(summary.pop("template_stats"))
+                    summaries[name] = summary
+                    del running[name]
+                    finished = True
+                if running and not finished:
+                    # short naps keep the parent interruptible
+                    time.sleep(0.05)
+        except BaseException:
+            for process, receiver, started in running.values():
+                process.terminate()
+                process.join()
+            raise
+        finally:
+            _worker_generator = None
+        return [summaries[name] for name in self.recipes.keys()]
+
+    def receive_summary(self, receiver):
+        try:
+            return receiver.recv()
+        except (EOFError, IOError):
+            # the process died while it was sending
+            return None
+
+    def run_recipe(self, recipe):
+        summary = {
+            "name": recipe.name,
+            "pid": os.getpid(),
+            "status": "skipped",
+            "duration": 0.0,
+            "objects": {},
+            "files": None,
+            "steps": [],
+        }
+        tic = time.time()
+        try:
+            switch_logging(logfile=recipe.log_file)
+            if recipe.pid_protect():
+                if self.has_prometheus:
+                    from prometheus_client import CollectorRegistry, Gauge, pushadd_to_gateway
+                    registry = CollectorRegistry()
+                summary["status"] = "incomplete"
+                recipe.stats.reset()
+                if self.memprofile:
+                    recipe.memprofiler = MemProfiler(recipe.name)
+                try:
+                    # parallel datasources are read in threads
+                    with recipe.stats.measure("recipe", recipe.name, "collect", recipe.count_objects, threads=True):
+                        collected = recipe.collect()
+                    self.memory_snapshot(recipe, "collect")
+                    if collected:
+                        with recipe.stats.measure("recipe", recipe.name, "assemble", recipe.count_objects):
+                            recipe.assemble()
+                        self.memory_snapshot(recipe, "assemble")
+                        # stream_output writes the files in a thread
+                        with recipe.stats.measure("recipe", recipe.name, "render", threads=True):
+                            recipe.render()
+                        self.memory_snapshot(recipe, "render")
+                        with recipe.stats.measure("recipe", recipe.name, "output"):
+                            recipe.output()
+                        self.memory_snapshot(recipe, "output")
+                        summary["status"] = "ok"
+                        summary["objects"] = dict([(objtype, len(recipe.objects[objtype])) for objtype in recipe.objects.keys()])
+                        summary["files"] = recipe.output_stats()
+                        if self.has_prometheus:
                             g = Gauge("coshsh_recipe_last_generated",
                                 "The timestamp when a configuration was generated",
                                 registry=registry)
@@ -87,29 +272,83 @@ class Generator(object):
                                 "The duration of a recipe",
                                 registry=registry)
                             g.set(time.time() - tic)
-                    if has_prometheus:
+                            if recipe.render_cache:
+                                g = Gauge("coshsh_recipe_render_cache",
+                                    "The number of rendered files found in the render cache or rendered", ['result'],
+                                    registry=registry)
+                                g.labels(result='hit').set(recipe.render_cache.hits)
+                                g.labels(result='miss').set(recipe.render_cache.misses)
+                            recipe.stats.push(registry)
+                            if summary["files"]:
+                                g = Gauge("coshsh_recipe_output_files",
+                                    "The number of files written, left unchanged or deleted", ['action'],
+                                    registry=registry)
+                                for action, number in summary["files"].items():
+                                    g.labels(action=action).set(number)
+                    if self.has_prometheus:
                         g = Gauge("coshsh_recipe_last_success",
                             "The timestamp when the recipe successfully ran last time",
                             registry=registry)
                         g.set_to_current_time()
                         try:
                             pushadd_to_gateway(self.pg_address, grouping_key={
-                                'hostname': hostname,
-                                'username': coshshuser,
-                                'cookbook': cookbook,
+                                'hostname': self.pg_hostname,
+                                'username': self.pg_coshshuser,
+                                'cookbook': self.pg_cookbook,
                                 'recipe': recipe.name
-                            }, job=self.pg_job, registry=registry, handler=pg_auth_handler)
+                            }, job=self.pg_job, registry=registry, handler=self.pg_auth_handler)
                         except Exception, e:
                             logger.warning("could not write to pushgateway "+self.pg_address+": "+str(e))
+                except BaseException:
+                    summary["status"] = "failed"
+                    raise
+                finally:
+                    # a failed run is the one where the numbers matter
+                    recipe.stats.log()
+                    summary["steps"] = recipe.stats.records
+                    self.stop_memprofiler(recipe)
                     recipe.pid_remove()
-            except coshsh.recipe.RecipePidAlreadyRunning:
-                logger.info("skipping recipe %s. already running" % (recipe.name))
-            except coshsh.recipe.RecipePidNotWritable:
-                logger.error("skipping recipe %s. cannot write pid file to %s" % (recipe.name, recipe.pid_dir))
-            except coshsh.recipe.RecipePidGarbage:
-                logger.error("skipping recipe %s. pid file %s contains garbage" % (recipe.name, recipe.pid_file))
+        except coshsh.recipe.RecipePidAlreadyRunning:
+            logger.info("skipping recipe %s. already running" % (recipe.name))
+        except coshsh.recipe.RecipePidNotWritable:
+            summary["status"] = "failed"
+            logger.error("skipping recipe %s. cannot write pid file to %s" % (recipe.name, recipe.pid_dir))
+        except coshsh.recipe.RecipePidGarbage:
+            summary["status"] = "failed"
+            logger.error("skipping recipe %s. pid file %s contains garbage" % (recipe.name, recipe.pid_file))
+        except Exception, exp:
+            summary["status"] = "failed"
+            logger.error("skipping recipe %s (%s)" % (recipe.name, exp))
+        else:
+            pass
+        restore_logging()
+        summary["duration"] = time.time() - tic
+        return summary
+
+    def stop_memprofiler(self, recipe):
+        if recipe.memprofiler:
+            memprofiler, recipe.memprofiler = recipe.memprofiler, None
+            memprofiler.stop()
+            try:
+                memprofiler.log()
+                memprofiler.write(recipe.memory_profile_path())
             except Exception, exp:
-                logger.error("skipping recipe %s (%s)" % (recipe.name, exp))
-            else:
-                pass
-            restore_logging()
+                logger.error("could not write the memory profile of recipe %s (%s)" % (recipe.name, exp))
+
+    def memory_snapshot(self, recipe, phase):
+        # outside of the measured steps, sizing the objects takes a while
+        if recipe.memprofiler:
+            recipe.memprofiler.snapshot(phase, recipe.objects)
+
+
+_worker_generator = None
+
+def _run_recipe_in_worker(name, sender):
+    # runs in a forked child of Generator.run_parallel, the generator
+    # and its recipes were inherited from the parent process
+    TemplateRegistry.compiles.clear()
+    TemplateRegistry.hits.clear()
+    summary = _worker_generator.run_recipe(_worker_generator.recipes[name])
+    summary["template_stats"] = TemplateRegistry.get_stats()
+    sender.send(summary)
+    sender.close()
@@ -36,9 +36,9 @@ class Host(coshsh.item.Item):
         self.ports = [22] # can be changed with a PORT detail
         super(Host, self).__init__(params)
         self.alias = getattr(self, 'alias', self.host_name)
-        self.fingerprint = lambda s=self:s.__class__.fingerprint(params)
+        self.set_fingerprint(params)
 
-    @classmethod
+    @coshsh.item.fingerprintmethod
     def fingerprint(self, params):
         return "%s" % (params["host_name"], )
 
@@ -10,8 +10,11 @@ import os
 import re
 import locale
 import logging
+import time
 from jinja2 import FileSystemLoader, Environment, TemplateSyntaxError, TemplateNotFound
 from copy import copy, deepcopy
+from coshsh.templateregistry import TemplateRegistry
+from coshsh.stringpool import StringPool
 
 logger = logging.getLogger('coshsh')
 
@@ -19,6 +22,219 @@ class EmptyObject(object):
     pass
 
 
+_slot_names = {}
+
+def slot_names(cls):
+    """
+    The names of the __slots__ of a class and its base classes.
+    """
+    try:
+        return _slot_names[cls]
+    except KeyError:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            for name in slots:
+                if name not in ("__dict__", "__weakref__") and name not in names:
+                    names.append(name)
+        _slot_names[cls] = tuple(names)
+        return _slot_names[cls]
+
+
+class fingerprintmethod(object):
+    """
+    Decorator for the fingerprint(params) of a class, which is called
+    like a classmethod with the row of a new object. On an object,
+    fingerprint() returns the fingerprint which was computed once when
+    the object was created (see Item.set_fingerprint). If the row was
+    incomplete, it is computed from the attributes of the object.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is not None and "_fingerprint" in obj.__dict__:
+            fingerprint = obj.__dict__["_fingerprint"]
+            return lambda: fingerprint
+        elif obj is not None:
+            return lambda: self.func(cls, obj.__dict__)
+        return self.func.__get__(cls, type(cls))
+
+
+def item_attributes(obj):
+    """
+    The attributes of an object as a dict, the ones in the slots
+    and the ones in the __dict__. For a slotted object this does not
+    leave behind an empty __dict__.
+    """
+    names = slot_names(obj.__class__)
+    if not names:
+        return dict(obj.__dict__)
+    attributes = {}
+    for name in names:
+        try:
+            attributes[name] = getattr(obj, name)
+        except AttributeError:
+            pass
+    if hasattr(obj, "__dict__"):
+        if obj.__dict__:
+            attributes.update(obj.__dict__)
+        else:
+            del obj.__dict__
+    return attributes
+
+
+_resolvers = {}
+
+def detail_resolver(cls):
+    """
+    How Item.resolve_monitoring_details attaches the details of a class.
+    Returns (resolver, singular_property), resolver(item, detail, indexes)
+    is chosen once per class by its property, property_type,
+    unique_attribute, property_attr and property_flat.
+    singular_property is the property without the s, if the item may
+    take the first value of the list, e.g. item.port from item.ports.
+    """
+    try:
+        return _resolvers[cls]
+    except KeyError:
+        pass
+    property = cls.property
+    property_type = cls.property_type
+    singular_property = None
+    if property == "generic":
+        if property_type == dict:
+            resolver = _resolve_generic_dict
+        elif property_type == list:
+            resolver = _resolve_generic_list
+        else:
+            resolver = _resolve_generic_attribute
+    elif property_type == list:
+        if hasattr(cls, "unique_attribute"):
+            resolver = _resolve_unique_list
+        elif hasattr(cls, "property_attr"):
+            resolver = _resolve_attr_list
+        else:
+            resolver = _resolve_list
+            if property.endswith('s'):
+                singular_property = property.rstrip('s')
+    elif property_type == dict:
+        resolver = _resolve_dict
+    elif getattr(cls, 'property_flat', False):
+        # ex. MonitoringDetailRole: appl.role == str instead of appl.role.role == str
+        resolver = _resolve_flat
+    else:
+        resolver = _resolve_object
+    _resolvers[cls] = (resolver, singular_property)
+    return _resolvers[cls]
+
+
+def _resolve_generic_dict(item, detail, indexes):
+    _compact_unique_lists(indexes)
+    for key in detail.dictionary:
+        if key:
+            if ":" in key:
+                dictname, key = key.split(":")
+                try:
+                    setattr(getattr(item, dictname), key, detail.dictionary[dictname + ":" + key])
+                except Exception:
+                    setattr(item, dictname, EmptyObject())
+                    setattr(getattr(item, dictname), key, detail.dictionary[dictname + ":" + key])
+            else:
+                setattr(item, key, detail.dictionary[key])
+
+
+def _resolve_generic_list(item, detail, indexes):
+    _compact_unique_lists(indexes)
+    for key in detail.dictionary:
+        if key:
+            try:
+                getattr(item, key).extend(detail.dictionary[key])
+            except Exception:
+                setattr(item, key, detail.dictionary[key])
+
+
+def _resolve_generic_attribute(item, detail, indexes):
+    _compact_unique_lists(indexes)
+    setattr(item, detail.attribute, detail.value)
+
+
+def _property_list(item, property):
+    if not hasattr(item, property):
+        setattr(item, property, [])
+    return getattr(item, property)
+
+
+_replaced = object()
+
+def _compact_unique_lists(indexes):
+    # remove the replaced details, before anyone else looks at the lists
+    for property in [p for p in indexes if indexes[p][3]]:
+        values = indexes.pop(property)[0]
+        values[:] = [o for o in values if o is not _replaced]
+
+
+def _resolve_unique_list(item, detail, indexes):
+    # from the details remove an existing detail
+    # - which is of this class
+    # - which has the same unique_attr
+    # it is marked as _replaced in a copy of the list and removed later.
+    # indexes[property] is [the list, {(class, unique value): [positions]},
+    # the list is a copy, number of _replaced]
+    property = detail.__class__.property
+    values = _property_list(item, property)
+    if property not in indexes or indexes[property][0] is not values:
+        positions = {}
+        for position, o in enumerate(values):
+            if getattr(o.__class__, "unique_attribute", None):
+                positions.setdefault((o.__class__, getattr(o, o.__class__.unique_attribute)), []).append(position)
+        indexes[property] = [values, positions, False, 0]
+    index = indexes[property]
+    key = (detail.__class__, getattr(detail, detail.__class__.unique_attribute))
+    if key in index[1]:
+        if not index[2]:
+            # like before, the item gets a new list
+            index[0] = list(index[0])
+            index[2] = True
+            setattr(item, property, index[0])
+        for position in index[1][key]:
+            index[0][position] = _replaced
+        index[3] += len(index[1][key])
+        index[1][key] = []
+    index[1].setdefault(key, []).append(len(index[0]))
+    index[0].append(detail)
+
+
+def _resolve_attr_list(item, detail, indexes):
+    _property_list(item, detail.__class__.property).append(getattr(detail, detail.__class__.property_attr))
+
+
+def _resolve_list(item, detail, indexes):
+    _property_list(item, detail.__class__.property).append(detail)
+
+
+def _resolve_dict(item, detail, indexes):
+    _compact_unique_lists(indexes)
+    if not hasattr(item, detail.__class__.property):
+        setattr(item, detail.__class__.property, {})
+    if hasattr(detail, "key") and hasattr(detail, "value"):
+        getattr(item, detail.__class__.property)[detail.key] = detail.value
+
+
+def _resolve_flat(item, detail, indexes):
+    _compact_unique_lists(indexes)
+    setattr(item, detail.__class__.property, getattr(detail, detail.__class__.property))
+
+
+def _resolve_object(item, detail, indexes):
+    _compact_unique_lists(indexes)
+    setattr(item, detail.__class__.property, detail)
+
+
 class Item(object):
     template_cache = {}
 
@@ -32,10 +248,14 @@ class Item(object):
         #print "Item.__init__(", self.__class__.__name__
         self.log = logger
 
+        pool = StringPool.active
         for key in params:
             #print "set key", self.__class__.__name__, key
             if isinstance(params[key], basestring):
-                setattr(self, key, params[key].strip())
+                if pool:
+                    setattr(self, key, pool.intern(params[key].strip()))
+                else:
+                    setattr(self, key, params[key].strip())
             else:
                 setattr(self, key, params[key])
 
@@ -46,6 +266,23 @@ class Item(object):
             setattr(self, "monitoring_details", list(self.__class__.monitoring_details))
         self.config_files = {}
 
+    def set_fingerprint(self, params):
+        """
+        Computes the fingerprint of the object from its row once.
+        The row is not referenced afterwards.
+        """
+        try:
+            self._fingerprint = self.__class__.fingerprint(params)
+        except KeyError:
+            # not (yet) a complete object, see fingerprintmethod
+            return
+        for klass in self.__class__.__mro__:
+            if "fingerprint" in klass.__dict__:
+                if not isinstance(klass.__dict__["fingerprint"], fingerprintmethod):
+                    # a class with its own @classmethod fingerprint(params)
+                    self.fingerprint = lambda fingerprint=self._fingerprint: fingerprint
+                break
+
     def write_config(self, target_dir, want_tool=None):
         my_target_dir = os.path.join(target_dir, "hosts", self.host_name)
         if not os.path.exists(my_target_dir):
@@ -59,71 +296,25 @@ class Item(object):
 
     def resolve_monitoring_details(self):
         details = [d for d in self.monitoring_details]
+        # the lists of the details with a unique_attribute, see _resolve_unique_list
+        indexes = {}
+        singular_properties = []
         for detail in details:
-            property = detail.__class__.property
-            if property == "generic":
-                if detail.__class__.property_type == dict:
-                    for key in detail.dictionary:
-                        if key:
-                            if ":" in key:
-                                dictname, key = key.split(":")
-                                try:
-                                    setattr(getattr(self, dictname), key, detail.dictionary[dictname + ":" + key])
-                                except Exception:
-                                    setattr(self, dictname, EmptyObject())
-                                    setattr(getattr(self, dictname), key, detail.dictionary[dictname + ":" + key])
-                            else:
-                                setattr(self, key, detail.dictionary[key])
-                elif detail.__class__.property_type == list:
-                    for key in detail.dictionary:
-                        if key:
-                            try:
-                                getattr(self, key).extend(detail.dictionary[key])
-                            except Exception:
-                                setattr(self, key, detail.dictionary[key])
-                else:
-                    setattr(self, detail.attribute, detail.value)
-            else:
-                if detail.__class__.property_type == list:
-                    if not hasattr(self, property):
-                        setattr(self, property, [])
-                    if hasattr(detail.__class__, "unique_attribute"):
-                        # from the details remove an existing detail
-                        # - which is of this class
-                        # - which has the same unique_attr
-                        if [o for o in getattr(self, property) if o.__class__ == detail.__class__ and getattr(o, detail.__class__.unique_attribute) == getattr(detail, detail.__class__.unique_attribute)]:
-                            old = getattr(self, property)
-                            new = [o for o in old if ((o.__class__ != detail.__class__) or (getattr(o, detail.__class__.unique_attribute) != getattr(detail, detail.__class__.unique_attribute)))]
-                            new.append(detail)
-                            setattr(self, property, new)
-                        #print "res", self.host.host_name, detail.path
-                        else:
-                            getattr(self, property).append(detail)
-                    else:
-                        if hasattr(detail.__class__, "property_attr"):
-                            getattr(self, property).append(getattr(detail, getattr(detail.__class__, "property_attr")))
-                        else:
-                            getattr(self, property).append(detail)
-                elif detail.__class__.property_type == dict:
-                    if not hasattr(self, property):
-                        setattr(self, property, {})
-                    if hasattr(detail, "key") and hasattr(detail, "value"):
-                        getattr(self, property)[detail.key] = detail.value
-                else:
-                    if getattr(detail.__class__, 'property_flat', False):
-                        # ex. MonitoringDetailRole: appl.role == str instead of appl.role.role == str
-                        setattr(self, property, getattr(detail, property))
-                    else:
-                        setattr(self, property, detail)
-            # This detail has been resolved. Maybe we run resolve_monitoring_details
-            # later again, we don't want to repeat ourselves.
-            self.monitoring_details.remove(detail)
+            resolver, singular_property = detail_resolver(detail.__class__)
+            resolver(self, detail, indexes)
+            if singular_property and singular_property not in singular_properties:
+                singular_properties.append(singular_property)
+        _compact_unique_lists(indexes)
+        # These details have been resolved. Maybe we run resolve_monitoring_details
+        # later again, we don't want to repeat ourselves.
+        resolved = set([id(d) for d in details])
+        self.monitoring_details[:] = [d for d in self.monitoring_details if id(d) not in resolved]
         self.wemustrepeat()
         # example: if we have self.ports
         # and self.ports[0] has an inside property ports
         # and self has d default property port (set in __init__)
         # replace the self.port by self.ports[0].port
-        for one_property in [detail.__class__.property.rstrip('s') for detail in details if detail.__class__.property_type == list and not hasattr(detail.__class__, "unique_attribute") and not hasattr(detail.__class__, "property_attr") and detail.__class__.property.endswith('s') and hasattr(self, detail.__class__.property.rstrip('s'))]:
+        for one_property in [p for p in singular_properties if hasattr(self, p)]:
             if hasattr(getattr(self, one_property + 's')[0], one_property):
                 setattr(self, one_property, getattr(getattr(self, one_property + 's')[0], one_property))
 
@@ -178,29 +369,49 @@ class Item(object):
         if hasattr(self, "service_notification_commands"):
             self.service_notification_commands = ",".join(sorted(self.service_notification_commands, cmp=locale.strcoll))
 
+    def sort_lists(self):
+        # leaves the lists like depythonize/pythonize do. only empty
+        # lists (which become ['']) and values with a comma need the
+        # join and split, the others are sorted in place
+        for attr in ["templates", "contactgroups", "contact_groups", "contacts", "hostgroups", "servicegroups", "members", "parents", "host_notification_commands", "service_notification_commands"]:
+            values = getattr(self, attr, None)
+            if not isinstance(values, list):
+                continue
+            if attr != "templates":
+                # the order of the templates matters
+                values.sort(cmp=locale.strcoll)
+            if not values or [v for v in values if "," in v]:
+                setattr(self, attr, ",".join(values).split(","))
+
     def render_cfg_template(self, jinja2, template_cache, name, output_name, suffix, for_tool, **kwargs):
         try:
             if not name in template_cache:
-                template_cache[name] = jinja2.env.get_template(name + ".tpl")
+                template_cache[name] = TemplateRegistry.get_template(jinja2.env, name + ".tpl")
                 logger.info("load template " + name)
         except TemplateSyntaxError as e:
             logger.critical("%s template %s has an error in line %d: %s" % (self.__class__.__name__, name, e.lineno, e.message))
         except TemplateNotFound:
             logger.error("cannot find template " + name)
         except Exception as exp:
-            logger.critical("error in template %s (%s,%s)" (name, exp.__class__.__name__, exp))
+            logger.critical("error in template %s (%s,%s)" % (name, exp.__class__.__name__, exp))
 
         if name in template_cache:
             # transform hostgroups, contacts, etc. from list to string
             self.depythonize()
+            profiler = getattr(jinja2, 'profiler', None)
             try:
                 if not for_tool in self.config_files:
                     self.config_files[for_tool] = {}
+                tic = time.time()
                 if suffix:
-                    self.config_files[for_tool][output_name + "." + suffix] = template_cache[name].render(kwargs).encode('utf-8')
+                    file_name = output_name + "." + suffix
+                    self.config_files[for_tool][file_name] = template_cache[name].render(kwargs).encode('utf-8')
                 else:
                     # files without suffix
-                    self.config_files[for_tool][output_name] = template_cache[name].render(kwargs)
+                    file_name = output_name
+                    self.config_files[for_tool][file_name] = template_cache[name].render(kwargs)
+                if profiler:
+                    profiler.add(name, self, time.time() - tic, len(self.config_files[for_tool][file_name]))
             except Exception as exp:
                 if hasattr(self, "fingerprint"):
                     logger.critical("render exception in template %s for %s %s: %s" % (name, self, self.fingerprint(), exp))
@@ -212,6 +423,11 @@ class Item(object):
     def render(self, template_cache, jinja2, recipe):
         if not hasattr(self, 'template_rules'):
             return
+        render_cache = getattr(recipe, 'render_cache', None)
+        if render_cache:
+            # the item is fully resolved now, its attributes won't change
+            # until the last template was rendered
+            item_digest = render_cache.item_digest(self)
         for rule in self.template_rules:
             render_this = False
             try:
@@ -241,11 +457,36 @@ class Item(object):
 
             if render_this:
                 if rule.unique_config and isinstance(rule.unique_attr, basestring) and hasattr(self, rule.unique_attr):
-                    self.render_cfg_template(jinja2, template_cache, rule.template, rule.unique_config % getattr(self, rule.unique_attr), rule.suffix, rule.for_tool, **dict([(rule.self_name, self), ("recipe", recipe)]))
+                    output_name = rule.unique_config % getattr(self, rule.unique_attr)
                 elif rule.unique_config and isinstance(rule.unique_attr, list) and reduce(lambda x, y: x and y, [hasattr(self, ua) for ua in rule.unique_attr]):
-                    self.render_cfg_template(jinja2, template_cache, rule.template, rule.unique_config % tuple([getattr(self, a) for a in rule.unique_attr]), rule.suffix, rule.for_tool, **dict([(rule.self_name, self), ("recipe", recipe)]))
+                    output_name = rule.unique_config % tuple([getattr(self, a) for a in rule.unique_attr])
+                else:
+                    output_name = rule.template
+                if render_cache:
+                    self.render_cfg_template_cached(render_cache, item_digest, jinja2, template_cache, rule.template, output_name, rule.suffix, rule.for_tool, **dict([(rule.self_name, self), ("recipe", recipe)]))
                 else:
-                    self.render_cfg_template(jinja2, template_cache, rule.template, rule.template, rule.suffix, rule.for_tool, **dict([(rule.self_name, self), ("recipe", recipe)]))
+                    self.render_cfg_template(jinja2, template_cache, rule.template, output_name, rule.suffix, rule.for_tool, **dict([(rule.self_name, self), ("recipe", recipe)]))
+
+    def render_cfg_template_cached(self, render_cache, item_digest, jinja2, template_cache, name, output_name, suffix, for_tool, **kwargs):
+        template_digest = render_cache.template_digest(jinja2.env, name + ".tpl")
+        if template_digest is None:
+            # unknown template or dynamic includes
+            self.render_cfg_template(jinja2, template_cache, name, output_name, suffix, for_tool, **kwargs)
+            return
+        file_name = output_name + "." + suffix if suffix else output_name
+        key = render_cache.key(item_digest, template_digest, name, file_name, for_tool, kwargs.keys())
+        content = render_cache.get(key)
+        if content is None:
+            self.render_cfg_template(jinja2, template_cache, name, output_name, suffix, for_tool, **kwargs)
+            if for_tool in self.config_files and file_name in self.config_files[for_tool]:
+                render_cache.put(key, self.config_files[for_tool][file_name])
+        else:
+            # a real rendering leaves the lists sorted, do the same
+            self.depythonize()
+            self.pythonize()
+            if not for_tool in self.config_files:
+                self.config_files[for_tool] = {}
+            self.config_files[for_tool][file_name] = content
 
     def fingerprint(self):
         try:
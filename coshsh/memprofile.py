@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import sys
+import os
+import gc
+import json
+import logging
+from collections import Counter
+from coshsh.item import Item, EmptyObject, slot_names
+from coshsh.runstats import rusage
+try:
+    # python 3 or a python 2 with the pytracemalloc patch
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+logger = logging.getLogger('coshsh')
+
+CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def deep_size(obj, seen):
+    """
+    The size of obj and everything it contains. Only containers and the
+    attributes of items are followed, classes, loggers, templates etc.
+    are counted with their shallow size. Objects in seen are skipped,
+    so a host which is referenced by its applications is counted once.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        try:
+            size += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, CONTAINERS):
+            stack.extend(o)
+        elif isinstance(o, (Item, EmptyObject)):
+            for name in slot_names(o.__class__):
+                if hasattr(o, name):
+                    stack.append(getattr(o, name))
+            if o.__dict__ or not slot_names(o.__class__):
+                stack.append(o.__dict__)
+            else:
+                # do not leave an empty __dict__ behind
+                del o.__dict__
+    return size
+
+
+class MemProfiler(object):
+    """
+    Snapshots of the memory of a recipe after its phases.
+    Every snapshot has the max. rss, the number and the approximate deep
+    size of the recipe.objects per type, the size of the rendered
+    config_files and the top allocation sites (tracemalloc) or, if
+    tracemalloc is not available, the types with the most instances.
+    The objects which a datasource created are sized after its read.
+    """
+
+    def __init__(self, name, top=10):
+        self.name = name
+        self.top = top
+        self.snapshots = []
+        self.datasources = {}
+        self.last_trace = None
+        if tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # the growth of the first snapshot is counted from here
+        self.last_counts = None if tracemalloc else self.type_counts()
+
+    def stop(self):
+        if tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def snapshot(self, phase, objects):
+        seen = set()
+        rendered = 0
+        for objs in objects.values():
+            for obj in objs.values():
+                config_files = getattr(obj, "config_files", None)
+                if config_files:
+                    rendered += deep_size(config_files, seen)
+        types = {}
+        # hosts first, the applications refer to them
+        for objtype in sorted(objects.keys(), key=lambda t: (t != "hosts", t)):
+            types[objtype] = {
+                "count": len(objects[objtype]),
+                "bytes": deep_size(objects[objtype], seen),
+            }
+        self.snapshots.append({
+            "phase": phase,
+            "maxrss": rusage()[2],
+            "types": types,
+            "config_files": rendered,
+            "allocations": self.allocations(),
+        })
+
+    def datasource(self, name, objs):
+        self.datasources[name] = {
+            "count": len(objs),
+            "bytes": deep_size(objs, set()),
+        }
+
+    def allocations(self):
+        """
+        Returns a list of (site, bytes, count, growth since the last snapshot)
+        """
+        if tracemalloc and tracemalloc.is_tracing():
+            trace = tracemalloc.take_snapshot()
+            if self.last_trace:
+                stats = trace.compare_to(self.last_trace, "lineno")
+                sites = [(str(s.traceback), s.size, s.count, s.size_diff) for s in stats[:self.top]]
+            else:
+                stats = trace.statistics("lineno")
+                sites = [(str(s.traceback), s.size, s.count, s.size) for s in stats[:self.top]]
+            self.last_trace = trace
+            return sites
+        counts = self.type_counts()
+        last = self.last_counts or {}
+        self.last_counts = counts
+        return [(name, None, count, count - last.get(name, 0)) for name, count in counts.most_common(self.top)]
+
+    def type_counts(self):
+        return Counter([type(o).__name__ for o in gc.get_objects()])
+
+    def data(self):
+        return {"snapshots": self.snapshots, "datasources": self.datasources}
+
+    def log(self):
+        for name, ds in sorted(self.datasources.items()):
+            logger.info("recipe %s memory datasource %-24s %8d objects %10d kB" % (self.name, name, ds["count"], ds["bytes"] / 1024))
+        for snapshot in self.snapshots:
+            logger.info("recipe %s memory after %s maxrss %d kB, config_files %d kB" % (self.name, snapshot["phase"], snapshot["maxrss"] / 1024, snapshot["config_files"] / 1024))
+            for objtype, entry in sorted(snapshot["types"].items(), key=lambda e: e[1]["bytes"], reverse=True):
+                if entry["count"]:
+                    logger.info("recipe %s memory %-13s %8d objects %10d kB" % (self.name, objtype, entry["count"], entry["bytes"] / 1024))
+            for site, size, count, growth in snapshot["allocations"]:
+                if size is None:
+                    logger.info("recipe %s memory %10d %-20s %+d" % (self.name, count, site, growth))
+                else:
+                    logger.info("recipe %s memory %10d kB %8d blocks %+d kB %s" % (self.name, size / 1024, count, growth / 1024, site))
+
+    def write(self, path):
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data(), f, sort_keys=True, indent=1)
+            os.rename(tmp_path, path)
+            logger.info("memory profile written to %s" % path)
+        except Exception, exp:
+            logger.error("could not write memory profile %s (%s)" % (path, exp))
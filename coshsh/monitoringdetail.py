@@ -13,7 +13,9 @@ import inspect
 import logging
 from urlparse import urlparse
 import coshsh
+from coshsh.classregistry import ClassRegistry
 from coshsh.item import Item
+from coshsh.stringpool import StringPool
 from coshsh.application import Application
 
 logger = logging.getLogger('coshsh')
@@ -23,37 +25,64 @@ class MonitoringDetailNotImplemented(Exception):
 
 
 class MonitoringDetail(coshsh.item.Item):
+    """
+    A detail class which declares __slots__ itself is a compact one.
+    Its instances get no log, monitoring_details and config_files of
+    their own (details are never rendered) and if the columns of the
+    row and the attributes set in __init__ are all in the slots, they
+    get no __dict__ either. row_slots are the columns of a detail row.
+    """
 
     class_factory = []
+    # the params which the ident functions look at, see ClassRegistry.dispatch
+    ident_params = ["monitoring_type"]
     lower_columns = ['name', 'type', 'application_name', 'application_type']
+    row_slots = ("host_name", "application_name", "application_type", "monitoring_type") + tuple(["monitoring_%d" % i for i in range(10)])
+    log = logger
+    monitoring_details = ()
+
+    def __new__(cls, params={}):
+        # the class is found before the object is created, because
+        # the __class__ of an object can not become a slotted one
+        if cls is not MonitoringDetail:
+            return super(MonitoringDetail, cls).__new__(cls)
+        #print "Detail init", cls, cls.__name__, len(cls.class_factory)
+        for c in cls.lower_columns:
+            try:
+                params[c] = params[c].lower()
+            except Exception:
+                if c in params:
+                    params[c] = None
+        # name, type is preferred, because a detail can also be a host detail
+        # application_name, application_type is ok too. in any case these will be internally used
+        if 'name' in params:
+            params['application_name'] = params['name']
+            del params['name']
+        if 'type' in params:
+            params['application_type'] = params['type']
+            del params['type']
+        newcls = cls.get_class(params)
+        if not newcls:
+            logger.info("monitoring detail of type %s for host %s / appl %s had a problem" % (params["monitoring_type"], params.get("host_name", "unkn. host"), params.get("application_name", "unkn. application")))
+            raise MonitoringDetailNotImplemented
+        detail = super(MonitoringDetail, cls).__new__(newcls)
+        if "__slots__" in newcls.__dict__:
+            pool = StringPool.active
+            for key in params:
+                if isinstance(params[key], basestring):
+                    if pool:
+                        setattr(detail, key, pool.intern(params[key].strip()))
+                    else:
+                        setattr(detail, key, params[key].strip())
+                else:
+                    setattr(detail, key, params[key])
+        else:
+            super(MonitoringDetail, detail).__init__(params)
+        # python calls newcls.__init__(params) next
+        return detail
 
     def __init__(self, params):
-        #print "Detail init", self.__class__, self.__class__.__name__, len(self.__class__.class_factory)
-        if self.__class__.__name__ == "MonitoringDetail":
-            for c in self.__class__.lower_columns:
-                try:
-                    params[c] = params[c].lower()
-                except Exception:
-                    if c in params:
-                        params[c] = None
-            # name, type is preferred, because a detail can also be a host detail
-            # application_name, application_type is ok too. in any case these will be internally used
-            if 'name' in params:
-                params['application_name'] = params['name']
-                del params['name']
-            if 'type' in params:
-                params['application_type'] = params['type']
-                del params['type']
-            newcls = self.__class__.get_class(params)
-            if newcls:
-                self.__class__ = newcls
-                super(MonitoringDetail, self).__init__(params)
-                self.__init__(params)
-            else:
-                logger.info("monitoring detail of type %s for host %s / appl %s had a problem" % (params["monitoring_type"], params.get("host_name", "unkn. host"), params.get("application_name", "unkn. application")))
-                raise MonitoringDetailNotImplemented
-        else:
-            pass
+        pass
 
     def fingerprint(self):
         # it does not make sense to construct an id from the random attributes
@@ -68,38 +97,17 @@ class MonitoringDetail(coshsh.item.Item):
         raise "impossible fingerprint"
 
     @classmethod
-    def init_classes(cls, classpath):
+    def init_classes(cls, classpath, cache_dir=None):
         sys.dont_write_bytecode = True
-        for p in [p for p in reversed(classpath) if os.path.exists(p) and os.path.isdir(p)]:
-            for module, path in [(item, p) for item in os.listdir(p) if item[-3:] == ".py" and item.startswith('detail_')]:
-                try:
-                    path = os.path.abspath(path)
-                    fp, filename, data = imp.find_module(module.replace('.py', ''), [path])
-                    toplevel = imp.load_source(module.replace(".py", ""), filename)
-                    for cl in inspect.getmembers(toplevel, inspect.isfunction):
-                        if cl[0] ==  "__detail_ident__":
-                            cls.class_factory.append([path, module, cl[1]])
-                except Exception, e:
-                    print e
-                finally:
-                    if fp:
-                        fp.close()
+        cls.class_factory = ClassRegistry.class_factory(classpath, lambda item: item.startswith('detail_'), '__detail_ident__', cache_dir)
 
 
     @classmethod
     def get_class(cls, params={}):
-        #print "getclass from cache", cls, cls.__name__, len(cls.class_factory)
-        for path, module, class_func in reversed(cls.class_factory):
-            try:
-                #print "get_class trys", path, module, class_func
-                newcls = class_func(params)
-                #print "get_class says", newcls
-                if newcls:
-                    return newcls
-            except Exception:
-                pass
-        logger.debug("found no matching class for this monitoring detail %s" % params)
-        return None
+        newcls = ClassRegistry.dispatch(cls, params)
+        if not newcls:
+            logger.debug("found no matching class for this monitoring detail %s" % params)
+        return newcls
 
     def __eq__(self, other):
         return ((self.monitoring_type, str(self.monitoring_0)) == (other.monitoring_type, str(other.monitoring_0)))
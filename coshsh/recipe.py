@@ -13,7 +13,13 @@ import inspect
 import time
 import logging
 import errno
-from jinja2 import FileSystemLoader, Environment, TemplateSyntaxError, TemplateNotFound
+import threading
+import Queue
+import multiprocessing
+import hashlib
+import imp
+import jinja2
+from jinja2 import FileSystemLoader, Environment, FileSystemBytecodeCache, TemplateSyntaxError, TemplateNotFound
 import coshsh
 from coshsh.jinja2_extensions import is_re_match, filter_re_sub, filter_re_escape, filter_host, filter_service, filter_contact, filter_custom_macros, filter_rfc3986, global_environ
 from coshsh.item import Item
@@ -23,7 +29,13 @@ from coshsh.hostgroup import HostGroup
 from coshsh.monitoringdetail import MonitoringDetail
 from coshsh.datasource import Datasource, DatasourceCorrupt, DatasourceNotReady, DatasourceNotAvailable, DatasourceNotCurrent
 from coshsh.datarecipient import Datarecipient, DatarecipientCorrupt, DatarecipientNotReady, DatarecipientNotAvailable, DatarecipientNotCurrent
-from coshsh.util import compare_attr, substenv, switch_logging
+from coshsh.rendercache import RenderCache
+from coshsh.templateregistry import TemplateRegistry
+from coshsh.classregistry import ClassRegistry
+from coshsh.stringpool import StringPool
+from coshsh.runstats import RunStats
+from coshsh.templateprofiler import TemplateProfiler
+from coshsh.util import compare_attr, substenv, switch_logging, setup_logging
 
 logger = logging.getLogger('coshsh')
 
@@ -46,12 +58,7 @@ class RecipePidGarbage(Exception):
 
 class Recipe(object):
 
-    attributes_for_adapters = ["name", "force", "safe_output", "pid_dir", "pid_file", "templates_dir", "classes_dir", "objects_dir", "max_delta", "max_delta_action", "classes_path", "templates_path", "filter", "git_init"]
-
-    def __del__(self):
-        pass
-        # sys.path is invisible here, so this will fail
-        #self.unset_recipe_sys_path()
+    attributes_for_adapters = ["name", "force", "safe_output", "pid_dir", "pid_file", "templates_dir", "classes_dir", "objects_dir", "max_delta", "max_delta_action", "classes_path", "templates_path", "filter", "git_init", "diff_output", "staged_output", "fsync"]
 
     def __init__(self, **kwargs):
         os.environ['RECIPE_NAME'] = kwargs["name"]
@@ -67,6 +74,9 @@ class Recipe(object):
         self.backup_count = kwargs.get("backup_count", None)
         self.force = kwargs.get("force")
         self.safe_output = kwargs.get("safe_output")
+        self.diff_output = kwargs.get("diff_output", "no") == "yes"
+        self.staged_output = kwargs.get("staged_output")
+        self.fsync = kwargs.get("fsync")
         self.pid_dir = kwargs.get("pid_dir")
         if not self.pid_dir:
             if 'OMD_ROOT' in os.environ:
@@ -90,6 +100,15 @@ class Recipe(object):
                 self.max_delta = tuple(map(int, (self.max_delta, self.max_delta)))
         self.my_jinja2_extensions = kwargs.get("my_jinja2_extensions", None)
         self.git_init = False if kwargs.get("git_init", "yes") == "no" else True
+        self.collect_workers = int(kwargs.get("collect_workers", 1))
+        self.intern_strings = kwargs.get("intern_strings", "no") == "yes"
+        self.string_pool_stats = None
+        self.render_workers = int(kwargs.get("render_workers", 1))
+        # seconds between two runs in daemon mode, 0 is the generator's default
+        self.interval = int(kwargs.get("interval", 0))
+        self.stream_output = kwargs.get("stream_output", "no") == "yes"
+        self.stream_queue_size = int(kwargs.get("stream_queue_size", 100))
+        self.streaming = False
 
         if 'OMD_ROOT' in os.environ:
             self.classes_path = [os.path.join(os.environ['OMD_ROOT'], 'share/coshsh/recipes/default/classes')]
@@ -108,10 +127,12 @@ class Recipe(object):
         logger.info("recipe %s classes_dir %s" % (self.name, ','.join([os.path.abspath(p) for p in self.classes_path])))
         logger.info("recipe %s templates_dir %s" % (self.name, ','.join([os.path.abspath(p) for p in self.templates_path])))
 
+        self.template_cache_dir = kwargs.get("template_cache_dir", None)
+        self.class_cache_dir = kwargs.get("class_cache_dir", None)
         self.jinja2 = EmptyObject()
         setattr(self.jinja2, 'loader', FileSystemLoader(self.templates_path))
-        setattr(self.jinja2, 'env', Environment(loader=self.jinja2.loader, extensions=['jinja2.ext.do']))
-        self.jinja2.env.trim_blocks = True
+        setattr(self.jinja2, 'env', Environment(loader=self.jinja2.loader, extensions=['jinja2.ext.do'], trim_blocks=True))
+        self.jinja2.env.bytecode_cache = self.init_bytecode_cache(self.jinja2.env)
         self.jinja2.env.tests['re_match'] = is_re_match
         self.jinja2.env.filters['re_sub'] = filter_re_sub
         self.jinja2.env.filters['re_escape'] = filter_re_escape
@@ -122,6 +143,12 @@ class Recipe(object):
         self.jinja2.env.filters['rfc3986'] = filter_rfc3986
         self.jinja2.env.globals['environ'] = global_environ
 
+        # profile_templates = yes measures every rendering
+        if kwargs.get("profile_templates", "no") == "yes":
+            self.jinja2.profiler = TemplateProfiler(int(kwargs.get("profile_templates_top", 10)))
+        else:
+            self.jinja2.profiler = None
+
         if self.my_jinja2_extensions:
             for extension in [e.strip() for e in self.my_jinja2_extensions.split(",")]:
                 imported = getattr(__import__("my_jinja2_extensions", fromlist=[extension]), extension)
@@ -134,29 +161,38 @@ class Recipe(object):
             
         self.datasources = []
         self.datarecipients = []
+        # to create them again after their classes were reloaded
+        self.datasource_params = []
+        self.datarecipient_params = []
+
+        self.reset_objects()
+        self.stats = RunStats(self.name)
+        # set by the generator in --memprofile mode
+        self.memprofiler = None
 
-        self.objects = {
-            'hosts': {},
-            'hostgroups': {},
-            'applications': {},
-            'details': {},
-            'contacts': {},
-            'contactgroups': {},
-            'commands': {},
-            'timeperiods': {},
-            'dependencies': {},
-            'bps': {},
-        }
-        
         self.old_objects = (0, 0)
         self.new_objects = (0, 0)
 
+        self.init_class_cache_dir()
         self.init_class_cache()
 
         if kwargs.get("datasources"):
             self.datasource_names = [ds.lower().strip() for ds in kwargs.get("datasources").split(",")]
         else:
             self.datasource_names = []
+        self.render_cache = None
+        if kwargs.get("render_cache", "no") == "yes" or kwargs.get("render_cache_file"):
+            # objects_dir/dynamic may be wiped out before every output,
+            # so the cache lives next to objects_dir
+            if kwargs.get("render_cache_file"):
+                self.render_cache = RenderCache(kwargs["render_cache_file"])
+            elif kwargs.get("objects_dir"):
+                self.render_cache = RenderCache(kwargs["objects_dir"].rstrip("/") + ".render_cache")
+            else:
+                logger.error("recipe %s has no objects_dir, set render_cache_file" % self.name)
+            if self.render_cache:
+                logger.info("recipe %s render_cache %s" % (self.name, os.path.abspath(self.render_cache.path)))
+
         if kwargs.get("objects_dir") and not kwargs.get("datarecipients"):
             self.objects_dir = kwargs["objects_dir"]
             logger.info("recipe %s objects_dir %s" % (self.name, os.path.abspath(self.objects_dir)))
@@ -193,46 +229,237 @@ class Recipe(object):
                 if rule[1].lower() in self.datasource_names:
                     self.datasource_filters[rule[1].lower()] = rule[2]
 
+    def reset_objects(self):
+        self.objects = {
+            'hosts': {},
+            'hostgroups': {},
+            'applications': {},
+            'details': {},
+            'contacts': {},
+            'contactgroups': {},
+            'commands': {},
+            'timeperiods': {},
+            'dependencies': {},
+            'bps': {},
+        }
+
+    def count_objects(self, objects=None):
+        objects = self.objects if objects is None else objects
+        return sum([len(objects[objtype]) for objtype in objects], 0)
+
+    def init_bytecode_cache(self, env):
+        if not self.template_cache_dir:
+            return None
+        try:
+            if not os.path.exists(self.template_cache_dir):
+                os.makedirs(self.template_cache_dir)
+        except Exception, exp:
+            logger.error("recipe %s cannot create template_cache_dir %s (%s)" % (self.name, self.template_cache_dir, exp))
+            return None
+        logger.info("recipe %s template_cache_dir %s" % (self.name, os.path.abspath(self.template_cache_dir)))
+        # the cache file names already depend on the template file and
+        # jinja2 compares the checksum of the source before it uses one.
+        # the options which change the generated code must be part of
+        # the name too, then the directory can be shared with other recipes
+        options = hashlib.sha1(repr((
+            jinja2.__version__,
+            env.block_start_string, env.block_end_string,
+            env.variable_start_string, env.variable_end_string,
+            env.comment_start_string, env.comment_end_string,
+            env.line_statement_prefix, env.line_comment_prefix,
+            env.trim_blocks, env.lstrip_blocks,
+            env.newline_sequence, env.keep_trailing_newline,
+            env.optimized, env.autoescape,
+            sorted(env.extensions.keys()),
+        ))).hexdigest()[:8]
+        return FileSystemBytecodeCache(self.template_cache_dir, "__coshsh_%s_" + options + ".cache")
+
+    def init_class_cache_dir(self):
+        if not self.class_cache_dir:
+            return
+        try:
+            if not os.path.exists(self.class_cache_dir):
+                os.makedirs(self.class_cache_dir)
+        except Exception, exp:
+            logger.error("recipe %s cannot create class_cache_dir %s (%s)" % (self.name, self.class_cache_dir, exp))
+            self.class_cache_dir = None
+            return
+        # the file names depend on the path of the class file, so the
+        # directory can be shared with other recipes
+        self.class_cache_dir = os.path.abspath(self.class_cache_dir)
+        logger.info("recipe %s class_cache_dir %s" % (self.name, self.class_cache_dir))
+
+    def compile_templates(self):
+        compiled = 0
+        for name in self.jinja2.env.list_templates(extensions=["tpl"]):
+            try:
+                # get_template writes the bytecode cache file
+                self.jinja2.env.get_template(name)
+                compiled += 1
+            except TemplateSyntaxError as e:
+                logger.critical("template %s has an error in line %d: %s" % (name, e.lineno, e.message))
+            except Exception as exp:
+                logger.critical("error in template %s (%s,%s)" % (name, exp.__class__.__name__, exp))
+        logger.info("recipe %s compiled %d templates" % (self.name, compiled))
+        return compiled
+
     def set_recipe_sys_path(self):
-        sys.path[0:0] = self.classes_path
+        # sys.path is left alone, the class registry looks up imports in
+        # the classes_path of the active recipe
+        ClassRegistry.activate(self.classes_path)
 
     def unset_recipe_sys_path(self):
-        for p in [p for p in self.classes_path if os.path.exists(p) and os.path.isdir(p)]:
-            sys.path.pop(0)
+        if ClassRegistry.active_scope() is ClassRegistry.scope(self.classes_path):
+            ClassRegistry.activate(None)
 
     def collect(self):
-        data_valid = True
+        self.activate_class_cache()
+        if not self.intern_strings:
+            return self.collect_datasources()
+        pool = StringPool()
+        previous = StringPool.activate(pool)
+        try:
+            return self.collect_datasources()
+        finally:
+            StringPool.activate(previous)
+            self.string_pool_stats = pool.get_stats()
+            logger.info("recipe %s interned %d strings, replaced %d duplicates, saved %d bytes" % (self.name, self.string_pool_stats["strings"], self.string_pool_stats["duplicates"], self.string_pool_stats["saved"]))
+
+    def collect_datasources(self):
+        for parallel, datasources in self.collect_groups():
+            if parallel:
+                collected = self.collect_parallel(datasources)
+            else:
+                collected = self.collect_sequential(datasources)
+            if not collected:
+                logger.info("aborting collection phase")
+                return False
+        return True
+
+    def collect_groups(self):
+        """
+        Returns the datasources as a list of (parallel, datasources).
+        Only datasources with parallel = yes can be read by threads (with
+        collect_workers > 1), they promise not to look up the objects of
+        the datasources which are read at the same time. Consecutive ones
+        form a group, every other datasource is read alone, after all
+        the datasources before it, like in a sequential collect.
+        """
+        groups = []
         for ds in self.datasources:
-            filter = self.datasource_filters.get(ds.name)
+            parallel = self.collect_workers > 1 and ds.parallel
+            if parallel and groups and groups[-1][0]:
+                groups[-1][1].append(ds)
+            else:
+                groups.append((parallel, [ds]))
+        return [(parallel and len(datasources) > 1, datasources) for parallel, datasources in groups]
+
+    def collect_sequential(self, datasources):
+        for ds in datasources:
             try:
-                ds.open()
-                pre_count = dict([(key, len(self.objects[key].keys())) for key in self.objects.keys()])
-                pre_detail_count = sum([(len(obj.monitoring_details) if hasattr(obj, 'monitoring_details') else 99) for objs in [self.objects[key].values() for key in self.objects.keys()] for obj in objs], 0)
-                ds.read(filter=filter, objects=self.objects, force=self.force)
-                post_count = dict([(key, len(self.objects[key].keys())) for key in self.objects.keys()])
-                post_detail_count = sum([(len(obj.monitoring_details) if hasattr(obj, 'monitoring_details') else 99) for objs in [self.objects[key].values() for key in self.objects.keys()] for obj in objs], 0)
-                pre_count['details'] = pre_detail_count
-                post_count['details'] = post_detail_count
-                pre_count.update(dict.fromkeys([k for k in post_count if not k in pre_count], 0))
-                chg_keys = [(key, post_count[key] - pre_count[key]) for key in set(pre_count.keys() + post_count.keys()) if post_count[key] != pre_count[key]]
-                logger.info("recipe %s read from datasource %s %s" % (self.name, ds.name, ", ".join(["%d %s" % (k[1], k[0]) for k in chg_keys])))
-                ds.close()
-            except DatasourceNotCurrent:
-                data_valid = False
-                logger.info("datasource %s is is not current" % ds.name, exc_info=False)
-            except DatasourceNotReady:
-                data_valid = False
-                logger.info("datasource %s is busy" % ds.name, exc_info=False)
-            except DatasourceNotAvailable:
-                data_valid = False
-                logger.info("datasource %s is not available" % ds.name, exc_info=False)
-            except Exception, exp:
-                data_valid = False
-                logger.critical("datasource %s returns bad data (%s)" % (ds.name, exp), exc_info=True)
-            if not data_valid:
-                logger.info("aborting collection phase") 
+                self.read_datasource(ds, self.objects)
+            except Exception:
+                self.datasource_failed(ds, sys.exc_info())
                 return False
-        return data_valid
+        return True
+
+    def collect_parallel(self, datasources):
+        # every datasource reads into a private object store, which starts
+        # with the objects of the datasources before the group. afterwards
+        # the changes are merged in the order of the datasources list,
+        # so a later datasource overwrites objects of an earlier one
+        # exactly like in the sequential collect. what a datasource
+        # removed from its store is removed here too.
+        pending = Queue.Queue()
+        for ds in datasources:
+            pending.put(ds)
+        results = Queue.Queue()
+        cancelled = threading.Event()
+        def reader():
+            while not cancelled.is_set():
+                try:
+                    ds = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                objects = dict([(key, dict(objs)) for key, objs in self.objects.items()])
+                try:
+                    self.read_datasource(ds, objects, cancelled)
+                    results.put((ds, objects, None))
+                except Exception:
+                    results.put((ds, None, sys.exc_info()))
+        workers = min(self.collect_workers, len(datasources))
+        logger.info("recipe %s reads %d datasources with %d threads" % (self.name, len(datasources), workers))
+        threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=reader, name="collect-%s-%d" % (self.name, i))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        stores = {}
+        for i in range(len(datasources)):
+            # a get() with timeout can be interrupted by signals
+            ds, objects, exc_info = results.get(True, sys.maxint)
+            if exc_info:
+                # datasources which have not yet been opened are skipped,
+                # the running ones stop after their current step (a read
+                # can not be interrupted) and their results are thrown away
+                cancelled.set()
+                self.datasource_failed(ds, exc_info)
+                for thread in threads:
+                    thread.join()
+                return False
+            stores[ds] = objects
+        # what the stores started with
+        base = dict([(objtype, dict(objs)) for objtype, objs in self.objects.items()])
+        for ds in datasources:
+            store = stores[ds]
+            for objtype, objs in base.items():
+                kept = store.get(objtype, {})
+                for fingerprint in [f for f in objs if f not in kept]:
+                    self.objects[objtype].pop(fingerprint, None)
+            for objtype, objs in store.items():
+                known = self.objects.setdefault(objtype, {})
+                old = base.get(objtype, {})
+                for fingerprint, obj in objs.iteritems():
+                    if old.get(fingerprint) is not obj:
+                        known[fingerprint] = obj
+        return True
+
+    def read_datasource(self, ds, objects, cancelled=None):
+        filter = self.datasource_filters.get(ds.name)
+        with self.stats.measure("datasource", ds.name, "open"):
+            ds.open()
+        if cancelled and cancelled.is_set():
+            ds.close()
+            return
+        pre_count = dict([(key, len(objects[key].keys())) for key in objects.keys()])
+        pre_detail_count = sum([(len(obj.monitoring_details) if hasattr(obj, 'monitoring_details') else 99) for objs in [objects[key].values() for key in objects.keys()] for obj in objs], 0)
+        if self.memprofiler:
+            pre_ids = set([id(obj) for objs in objects.values() for obj in objs.values()])
+        with self.stats.measure("datasource", ds.name, "read", lambda: self.count_objects(objects)):
+            ds.read(filter=filter, objects=objects, force=self.force)
+        if self.memprofiler:
+            self.memprofiler.datasource(ds.name, [obj for objs in objects.values() for obj in objs.values() if id(obj) not in pre_ids])
+        post_count = dict([(key, len(objects[key].keys())) for key in objects.keys()])
+        post_detail_count = sum([(len(obj.monitoring_details) if hasattr(obj, 'monitoring_details') else 99) for objs in [objects[key].values() for key in objects.keys()] for obj in objs], 0)
+        pre_count['details'] = pre_detail_count
+        post_count['details'] = post_detail_count
+        pre_count.update(dict.fromkeys([k for k in post_count if not k in pre_count], 0))
+        chg_keys = [(key, post_count[key] - pre_count[key]) for key in set(pre_count.keys() + post_count.keys()) if post_count[key] != pre_count[key]]
+        logger.info("recipe %s read from datasource %s %s" % (self.name, ds.name, ", ".join(["%d %s" % (k[1], k[0]) for k in chg_keys])))
+        with self.stats.measure("datasource", ds.name, "close"):
+            ds.close()
+
+    def datasource_failed(self, ds, exc_info):
+        exp = exc_info[1]
+        if isinstance(exp, DatasourceNotCurrent):
+            logger.info("datasource %s is is not current" % ds.name, exc_info=False)
+        elif isinstance(exp, DatasourceNotReady):
+            logger.info("datasource %s is busy" % ds.name, exc_info=False)
+        elif isinstance(exp, DatasourceNotAvailable):
+            logger.info("datasource %s is not available" % ds.name, exc_info=False)
+        else:
+            logger.critical("datasource %s returns bad data (%s)" % (ds.name, exp), exc_info=exc_info)
 
     def assemble(self):
         generic_details = []
@@ -246,16 +473,8 @@ class Recipe(object):
                 generic_details.append(detail)
             else:
                 logger.info("found a %s detail %s for an unknown application %s" % (detail.__class__.__name__, detail, fingerprint))
-        for detail in generic_details:
-            dfingerprint = detail.application_fingerprint()
-            if dfingerprint == '*':
-                for host in self.objects['hosts'].values():
-                    host.monitoring_details.insert(0, detail)
-            else:
-                for app in self.objects['applications'].values():
-                    afingerprint = app.fingerprint()
-                    if dfingerprint[1:] == afingerprint[afingerprint.index('+'):]:
-                        app.monitoring_details.insert(0, detail)
+        if generic_details:
+            self.attach_generic_details(generic_details)
 
 
         for host in self.objects['hosts'].values():
@@ -301,30 +520,204 @@ class Recipe(object):
 
         return True
  
+    def attach_generic_details(self, generic_details):
+        # a * detail belongs to every host, a *+name+type detail to every
+        # application with this name and type. the applications are looked
+        # up by the +name+type part of their fingerprint.
+        hosts = self.objects['hosts'].values()
+        applications = {}
+        for app in self.objects['applications'].values():
+            afingerprint = app.fingerprint()
+            if '+' in afingerprint:
+                applications.setdefault(afingerprint[afingerprint.index('+'):], []).append(app)
+        for detail in generic_details:
+            dfingerprint = detail.application_fingerprint()
+            if dfingerprint == '*':
+                for host in hosts:
+                    host.monitoring_details.insert(0, detail)
+            else:
+                for app in applications.get(dfingerprint[1:], []):
+                    app.monitoring_details.insert(0, detail)
+
     def render(self):
         template_cache = {}
-        for host in self.objects['hosts'].values():
-            host.render(template_cache, self.jinja2, self)
-        for app in self.objects['applications'].values():
-            # because of this __new__ construct the Item.searchpath is
-            # not inherited. Needs to be done explicitely
-            app.render(template_cache, self.jinja2, self)
-        for cg in self.objects['contactgroups'].values():
-            cg.render(template_cache, self.jinja2, self)
-        for c in self.objects['contacts'].values():
-            c.render(template_cache, self.jinja2, self)
-        for hg in self.objects['hostgroups'].values():
-            hg.render(template_cache, self.jinja2, self)
+        if self.render_cache:
+            self.render_cache.load()
+            self.render_cache.set_context(self.name, self.additional_recipe_fields, dict([(attr, getattr(self, attr, None)) for attr in self.attributes_for_adapters]))
+        if self.jinja2.profiler:
+            self.jinja2.profiler.reset()
+        queue = self.start_streaming() if self.stream_output else None
+        if queue and self.render_cache:
+            # the written files must not stay in memory via the cache
+            self.render_cache.open_journal()
+        try:
+            if self.render_workers > 1 and hasattr(os, "fork"):
+                self.render_parallel(queue)
+            else:
+                self.render_sequential(template_cache, queue)
+        except BaseException:
+            if self.render_cache:
+                self.render_cache.discard()
+            raise
+        finally:
+            if queue:
+                error = self.stop_streaming()
+        if queue and error:
+            if self.render_cache:
+                self.render_cache.discard()
+            raise error[0], error[1], error[2]
+        if self.render_cache:
+            logger.info("recipe %s render cache %d hits, %d misses" % (self.name, self.render_cache.hits, self.render_cache.misses))
+            self.render_cache.save()
+        if self.jinja2.profiler:
+            self.jinja2.profiler.report(self.name)
+            self.jinja2.profiler.write(self.template_profile_path())
+
+    def profile_path(self, kind):
+        # next to the log file
+        logfile = self.log_file or setup_logging.logfile
+        if os.path.isabs(logfile):
+            logdir = os.path.dirname(logfile)
+        else:
+            logdir = os.path.dirname(os.path.join(self.log_dir or setup_logging.logdir, logfile))
+        return os.path.join(logdir, "coshsh_%s_profile_%s.json" % (kind, re.sub('[/\\\.]', '_', self.name)))
+
+    def template_profile_path(self):
+        return self.profile_path("template")
+
+    def memory_profile_path(self):
+        return self.profile_path("memory")
+
+    def start_streaming(self):
+        """
+        Prepares the target dirs and starts a thread which writes the
+        items while the next ones are rendered. Returns the queue where
+        rendered items are put or None if a datarecipient needs the
+        complete objects in output().
+        """
+        self.streaming = False
+        for datarecipient in self.datarecipients:
+            datarecipient.streamed = False
+        not_streamable = [dr.name for dr in self.datarecipients if not dr.streamable]
+        if not_streamable:
+            logger.info("recipe %s can not stream output to %s" % (self.name, ', '.join(not_streamable)))
+            return None
+        cleaned_dirs = []
+        for datarecipient in self.datarecipients:
+            # a streamed datarecipient writes into a staging dir, the
+            # previous output stays untouched until output() publishes
+            # the new one. if the rendering fails, it is never published.
+            datarecipient.streamed = True
+            datarecipient.count_before_objects()
+            datarecipient.load(None, self.objects)
+            if hasattr(datarecipient, 'dynamic_dir') and datarecipient.dynamic_dir not in cleaned_dirs:
+                with self.stats.measure("datarecipient", datarecipient.name, "cleanup"):
+                    datarecipient.cleanup_target_dir()
+                cleaned_dirs.append(datarecipient.dynamic_dir)
+            with self.stats.measure("datarecipient", datarecipient.name, "prepare"):
+                datarecipient.prepare_target_dir()
+        self.streaming = True
+        self.stream_error = None
+        self.stream_queue = Queue.Queue(self.stream_queue_size)
+        self.stream_writer = threading.Thread(target=self.write_streamed_items, name="writer-%s" % self.name)
+        self.stream_writer.daemon = True
+        self.stream_writer.start()
+        logger.debug("recipe %s streams output through a queue of %d items" % (self.name, self.stream_queue_size))
+        return self.stream_queue
+
+    def stop_streaming(self):
+        self.stream_queue.put(None)
+        self.stream_writer.join()
+        self.stream_queue = None
+        self.stream_writer = None
+        return self.stream_error
+
+    def write_streamed_items(self):
+        while True:
+            entry = self.stream_queue.get()
+            if entry is None:
+                break
+            if self.stream_error:
+                # keep on reading, otherwise the renderer blocks forever
+                continue
+            itype, item = entry
+            try:
+                written = [dr.stream_item(itype, item) for dr in self.datarecipients]
+                if True in written:
+                    # the text is in the files now
+                    item.config_files = {}
+            except Exception:
+                logger.error("recipe %s could not write %s" % (self.name, itype))
+                self.stream_error = sys.exc_info()
+
+    def render_items(self):
+        for itype in ['hosts', 'applications', 'contactgroups', 'contacts', 'hostgroups']:
+            # because of the __new__ construct in applications the
+            # Item.searchpath is not inherited. Needs to be done explicitely
+            for key, item in self.objects[itype].items():
+                yield (itype, key, item)
         # you can put anything in objects (Item class with own templaterules)
-        for item in sum([self.objects[itype].values() for itype in self.objects if itype not in ['hosts', 'applications', 'details', 'contactgroups', 'contacts', 'hostgroups']], []):
-            # first check hasattr, because somebody may accidentially
-            # add objects which are not a subclass of Item.
-            # (And such a stupid mistake crashes coshsh-cook)
-            if hasattr(item, 'config_files') and not item.config_files:
-                # has not been populated with content in the datasource
-                # (like bmw appmon timeperiods)
-                item.render(template_cache, self.jinja2, self)
-            
+        for itype in [itype for itype in self.objects if itype not in ['hosts', 'applications', 'details', 'contactgroups', 'contacts', 'hostgroups']]:
+            for key, item in self.objects[itype].items():
+                # first check hasattr, because somebody may accidentially
+                # add objects which are not a subclass of Item.
+                # (And such a stupid mistake crashes coshsh-cook)
+                if hasattr(item, 'config_files') and not item.config_files:
+                    # has not been populated with content in the datasource
+                    # (like bmw appmon timeperiods)
+                    yield (itype, key, item)
+
+    def render_sequential(self, template_cache, queue=None):
+        for itype, key, item in self.render_items():
+            item.render(template_cache, self.jinja2, self)
+            if queue:
+                queue.put((itype, item))
+
+    def render_parallel(self, queue=None):
+        global _render_recipe
+        items = [(itype, key) for itype, key, item in self.render_items()]
+        # more chunks than workers, so a slow chunk does not leave
+        # the other workers idle
+        chunksize = max(1, len(items) / (self.render_workers * 4))
+        chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+        logger.info("recipe %s renders %d items with %d workers" % (self.name, len(items), self.render_workers))
+        for itype, key in items:
+            # in a sequential render a template finds the hosts etc.
+            # already rendered, which leaves their lists sorted. here a
+            # worker may see an item which was rendered by another one.
+            # nothing else is needed, the items are not pickled.
+            if hasattr(self.objects[itype][key], 'sort_lists'):
+                self.objects[itype][key].sort_lists()
+        # the workers are forked now, they get the assembled objects
+        # copy-on-write and send back only the rendered config_files.
+        # what a template changes in the objects (e.g. with a do tag)
+        # stays in its worker, such templates need render_workers = 1.
+        _render_recipe = self
+        pool = multiprocessing.Pool(self.render_workers)
+        try:
+            # chunks come back in order, so they can be written while
+            # the workers render the next ones
+            results = pool.imap(_render_chunk, chunks)
+            for chunk in chunks:
+                # with a timeout, otherwise a ctrl-c is not seen
+                rendered, cache_stats, template_stats, profile = results.next(sys.maxint)
+                for itype, key, config_files in rendered:
+                    self.objects[itype][key].config_files = config_files
+                    if queue:
+                        queue.put((itype, self.objects[itype][key]))
+                if self.render_cache:
+                    self.render_cache.merge(*cache_stats)
+                TemplateRegistry.merge_stats(template_stats)
+                if profile:
+                    self.jinja2.profiler.merge(profile)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _render_recipe = None
+
     def count_before_objects(self):
         for datarecipient in self.datarecipients:
             datarecipient.count_before_objects()
@@ -344,36 +737,110 @@ class Recipe(object):
             datarecipient.prepare_target_dir()
 
     def output(self):
+        if self.streaming:
+            # the files are already written, this is for the counting,
+            # delta checks, git etc.
+            for datarecipient in self.datarecipients:
+                with self.stats.measure("datarecipient", datarecipient.name, "output"):
+                    datarecipient.output()
+            return
         cleaned_dirs = []
         for datarecipient in self.datarecipients:
             datarecipient.count_before_objects()
             datarecipient.load(None, self.objects)
             if hasattr(datarecipient, 'dynamic_dir') and datarecipient.dynamic_dir not in cleaned_dirs:
                 # do not clean a target dir where another datarecipient already wrote it's files
-                datarecipient.cleanup_target_dir()
+                with self.stats.measure("datarecipient", datarecipient.name, "cleanup"):
+                    datarecipient.cleanup_target_dir()
                 cleaned_dirs.append(datarecipient.dynamic_dir)
-            datarecipient.prepare_target_dir()
-            datarecipient.output()
+            with self.stats.measure("datarecipient", datarecipient.name, "prepare"):
+                datarecipient.prepare_target_dir()
+            with self.stats.measure("datarecipient", datarecipient.name, "output"):
+                datarecipient.output()
+
+    def output_stats(self):
+        # how many files the datarecipients with a manifest touched
+        stats = [dr.output_stats() for dr in self.datarecipients]
+        stats = [s for s in stats if s]
+        if not stats:
+            return None
+        return dict([(action, sum([s[action] for s in stats], 0)) for action in ["written", "skipped", "deleted"]])
 
     def read(self):
         return self.objects
 
 
     def init_class_cache(self):
-        Datasource.init_classes(self.classes_path)
-        logger.debug("init Datasource classes (%d)" % len(Datasource.class_factory))
-        Datarecipient.init_classes(self.classes_path)
-        logger.debug("init Datarecipient classes (%d)" % len(Datarecipient.class_factory))
-        Application.init_classes(self.classes_path)
-        logger.debug("init Application classes (%d)" % len(Application.class_factory))
-        MonitoringDetail.init_classes(self.classes_path)
-        logger.debug("init MonitoringDetail classes (%d)" % len(MonitoringDetail.class_factory))
-        Contact.init_classes(self.classes_path)
-        logger.debug("init Contact classes (%d)" % len(Contact.class_factory))
+        # the modules come from the process-wide ClassRegistry, the
+        # recipe keeps its own ordering of their ident functions
+        self.class_factories = {}
+        for cls in [Datasource, Datarecipient, Application, MonitoringDetail, Contact]:
+            cls.init_classes(self.classes_path, self.class_cache_dir)
+            self.class_factories[cls] = cls.class_factory
+            logger.debug("init %s classes (%d)" % (cls.__name__, len(cls.class_factory)))
+
+    def activate_class_cache(self):
+        # another recipe may have been initialized after this one
+        for cls, class_factory in self.class_factories.items():
+            cls.class_factory = class_factory
+        ClassRegistry.activate(self.classes_path)
+
+    def watched_files(self):
+        """
+        Returns the mtimes of the files which are the input of the recipe,
+        the classes, the templates and the files in a datasource's dir.
+        Generated files are no input, dotfiles (indexes, editor swap
+        files), compiled python files and the cache dirs are skipped.
+        """
+        files = {}
+        dirs = self.classes_path + self.templates_path + [ds.dir for ds in self.datasources if isinstance(getattr(ds, 'dir', None), basestring)]
+        cache_dirs = [os.path.abspath(d) for d in [self.class_cache_dir, self.template_cache_dir] if d]
+        for top in [d for d in dirs if os.path.isdir(d)]:
+            for root, subdirs, names in os.walk(top):
+                subdirs[:] = [d for d in subdirs if not d.startswith(".") and d != "__pycache__" and os.path.abspath(os.path.join(root, d)) not in cache_dirs]
+                for name in [n for n in names if not n.startswith(".") and not n.endswith(".pyc") and not n.endswith(".pyo")]:
+                    path = os.path.abspath(os.path.join(root, name))
+                    try:
+                        files[path] = os.path.getmtime(path)
+                    except OSError:
+                        pass
+        return files
+
+    def reload_classes(self, filenames):
+        """
+        Loads the class files among filenames again and replaces their
+        ident functions in the class factories. Returns True if classes
+        were reloaded.
+        """
+        classes_path = [os.path.abspath(p) for p in self.classes_path]
+        filenames = [f for f in filenames if f.endswith(".py") and os.path.dirname(f) in classes_path]
+        if not filenames:
+            return False
+        for filename in filenames:
+            if os.path.exists(filename):
+                logger.info("recipe %s reloads classes from %s" % (self.name, filename))
+            else:
+                logger.info("recipe %s forgets classes from %s" % (self.name, filename))
+                ClassRegistry.forget(filename)
+        # the classes remembered by get_class and the old ident functions
+        # in the class_factory lists of this recipe are obsolete
+        ClassRegistry.clear_dispatch_caches(filenames, self.class_factories.values())
+        # the registry imports the files with a new mtime again
+        self.init_class_cache()
+        # datasources and datarecipients are instances of the old classes
+        datasource_params, self.datasource_params, self.datasources = self.datasource_params, [], []
+        for params in datasource_params:
+            self.add_datasource(**params)
+        datarecipient_params, self.datarecipient_params, self.datarecipients = self.datarecipient_params, [], []
+        for params in datarecipient_params:
+            self.add_datarecipient(**params)
+        return True
 
     def add_datasource(self, **kwargs):
+        self.datasource_params.append(dict(kwargs))
         for key in [k for k in kwargs.iterkeys() if isinstance(kwargs[k], str)]:
             kwargs[key] = re.sub('%.*?%', substenv, kwargs[key])
+        self.activate_class_cache()
         newcls = Datasource.get_class(kwargs)
         if newcls:
             for key in [attr for attr in self.attributes_for_adapters if hasattr(self, attr)]:
@@ -381,11 +848,15 @@ class Recipe(object):
             for key, value in self.additional_recipe_fields.iteritems():
                 kwargs['recipe_'+key] = value
             datasource = newcls(**kwargs)
+            if "parallel" in kwargs:
+                datasource.parallel = kwargs["parallel"] == "yes"
             self.datasources.append(datasource)
 
     def add_datarecipient(self, **kwargs):
+        self.datarecipient_params.append(dict(kwargs))
         for key in [k for k in kwargs.iterkeys() if isinstance(kwargs[k], str)]:
             kwargs[key] = re.sub('%.*?%', substenv, kwargs[key])
+        self.activate_class_cache()
         newcls = Datarecipient.get_class(kwargs)
         if newcls:
             for key in [attr for attr in self.attributes_for_adapters if hasattr(self, attr)]:
@@ -435,3 +906,31 @@ class Recipe(object):
         except Exception:
             pass
 
+
+_render_recipe = None
+
+def _render_chunk(chunk):
+    # runs in a forked child of Recipe.render_parallel. a child renders
+    # several chunks, only the counters of this chunk are sent back.
+    TemplateRegistry.compiles.clear()
+    TemplateRegistry.hits.clear()
+    if _render_recipe.render_cache:
+        # the parent writes the journal, the entries go back with the chunk
+        _render_recipe.render_cache.journal = None
+        _render_recipe.render_cache.used = {}
+        _render_recipe.render_cache.hits = 0
+        _render_recipe.render_cache.misses = 0
+    if _render_recipe.jinja2.profiler:
+        _render_recipe.jinja2.profiler.reset()
+    template_cache = {}
+    rendered = []
+    for itype, key in chunk:
+        item = _render_recipe.objects[itype][key]
+        item.render(template_cache, _render_recipe.jinja2, _render_recipe)
+        rendered.append((itype, key, item.config_files))
+    if _render_recipe.render_cache:
+        cache_stats = (_render_recipe.render_cache.used, _render_recipe.render_cache.hits, _render_recipe.render_cache.misses)
+    else:
+        cache_stats = None
+    profile = _render_recipe.jinja2.profiler.data() if _render_recipe.jinja2.profiler else None
+    return (rendered, cache_stats, TemplateRegistry.get_stats(), profile)
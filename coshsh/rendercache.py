@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import os
+import types
+import hashlib
+import logging
+import cPickle
+from jinja2 import meta, nodes
+from coshsh.item import slot_names, item_attributes
+
+logger = logging.getLogger('coshsh')
+
+
+class RenderCache(object):
+    """
+    Remembers the rendered config files of the last run.
+    An entry is found with a digest of the resolved item (all its
+    attributes including the objects it refers to), the template
+    source (including the templates it includes/extends/imports and
+    the environment variables they read with environ("NAME")), the
+    recipe attributes and the name of the resulting file. If nothing
+    of these changed, the item does not need to go through jinja2
+    again. Globals and filters from my_jinja2_extensions are not part
+    of the key, if they read something else than their arguments, the
+    recipe must not use render_cache.
+    The file is a sequence of pickled (key, content) records. With
+    stream_output the records of this run are appended to the new file
+    while rendering (see open_journal), only the keys stay in memory.
+    """
+
+    # these attributes are the result of rendering or are not data
+    skip_attributes = ['config_files', 'log', 'fingerprint', '_fingerprint']
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.used = {}
+        self.journal = None
+        self.template_digests = {}
+        self.context_digest = ''
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.path, 'rb') as f:
+                while True:
+                    try:
+                        record = cPickle.load(f)
+                    except EOFError:
+                        break
+                    if isinstance(record, dict):
+                        # a file of an older version
+                        self.entries.update(record)
+                    else:
+                        self.entries[record[0]] = record[1]
+            logger.debug("render cache %s has %d entries" % (self.path, len(self.entries)))
+        except IOError:
+            self.entries = {}
+        except Exception, exp:
+            logger.info("render cache %s is unusable (%s)" % (self.path, exp))
+            self.entries = {}
+        self.used = {}
+        self.template_digests = {}
+        self.hits = 0
+        self.misses = 0
+
+    def open_journal(self):
+        """
+        From now on the entries of this run are written to the new file
+        immediately, used only remembers their keys. Otherwise all the
+        rendered files would be kept until save().
+        """
+        try:
+            if not os.path.exists(os.path.dirname(os.path.abspath(self.path))):
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+            self.journal = open(self.path + ".tmp", 'wb')
+        except Exception, exp:
+            logger.error("could not write render cache %s (%s)" % (self.path, exp))
+            self.journal = None
+
+    def discard(self):
+        # a failed run, the file of the last run stays
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+            try:
+                os.remove(self.path + ".tmp")
+            except OSError:
+                pass
+
+    def save(self):
+        # only the entries of this run survive, so the file does not
+        # grow with every item which ever existed
+        tmp_path = self.path + ".tmp"
+        try:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+            else:
+                if not os.path.exists(os.path.dirname(os.path.abspath(self.path))):
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+                with open(tmp_path, 'wb') as f:
+                    for key, content in self.used.iteritems():
+                        cPickle.dump((key, content), f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.path)
+        except Exception, exp:
+            logger.error("could not write render cache %s (%s)" % (self.path, exp))
+
+    def get(self, key):
+        try:
+            content = self.entries[key]
+            self.use(key, content)
+            self.hits += 1
+            return content
+        except KeyError:
+            self.misses += 1
+            return None
+
+    def put(self, key, content):
+        self.use(key, content)
+
+    def use(self, key, content):
+        if self.journal:
+            if key not in self.used:
+                cPickle.dump((key, content), self.journal, cPickle.HIGHEST_PROTOCOL)
+                self.used[key] = None
+        else:
+            self.used[key] = content
+
+    def key(self, item_digest, template_digest, name, file_name, for_tool, variables):
+        key = u"\0".join([self.context_digest, item_digest, template_digest, name, file_name, for_tool] + sorted(variables))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def set_context(self, *args):
+        # everything else a template can see, like recipe attributes
+        # (%VAR% in the recipe's settings is already substituted there)
+        digest = hashlib.sha1()
+        self._feed(digest, args, {})
+        self.context_digest = digest.hexdigest()
+
+    def merge(self, used, hits, misses):
+        # counters and new entries which were produced in another process
+        for key, content in used.iteritems():
+            self.use(key, content)
+        self.hits += hits
+        self.misses += misses
+
+    def template_digest(self, env, name):
+        """
+        Returns the digest of a template and all the templates it
+        references or None if a reference or the name of a variable
+        in environ() is not a constant string.
+        """
+        key = (id(env), name)
+        if key not in self.template_digests:
+            self.template_digests[key] = self._template_digest(env, name, [])
+        return self.template_digests[key]
+
+    def _template_digest(self, env, name, seen):
+        if name in seen:
+            return ''
+        seen.append(name)
+        try:
+            source, filename, uptodate = env.loader.get_source(env, name)
+            ast = env.parse(source)
+            references = list(meta.find_referenced_templates(ast))
+        except Exception:
+            return None
+        variables = set()
+        for call in ast.find_all(nodes.Call):
+            if isinstance(call.node, nodes.Name) and call.node.name == 'environ':
+                if not call.args or not isinstance(call.args[0], nodes.Const):
+                    return None
+                variables.add(call.args[0].value)
+        digest = hashlib.sha1()
+        digest.update(filename)
+        digest.update(source.encode('utf-8') if isinstance(source, unicode) else source)
+        for variable in sorted(variables):
+            digest.update(repr((variable, os.environ.get(variable))))
+        for reference in references:
+            if reference is None:
+                # dynamic include, can't know what it is
+                return None
+            ref_digest = self._template_digest(env, reference, seen)
+            if ref_digest is None:
+                return None
+            digest.update(ref_digest)
+        return digest.hexdigest()
+
+    def item_digest(self, item):
+        digest = hashlib.sha1()
+        self._feed(digest, item, {})
+        return digest.hexdigest()
+
+    def _feed(self, digest, value, seen):
+        if isinstance(value, (basestring, int, long, float, bool, types.NoneType)):
+            digest.update(repr(value))
+        elif isinstance(value, (list, tuple)):
+            digest.update('[')
+            for elem in value:
+                self._feed(digest, elem, seen)
+                digest.update(',')
+            digest.update(']')
+        elif isinstance(value, dict):
+            digest.update('{')
+            for key in sorted(value.keys()):
+                self._feed(digest, key, seen)
+                digest.update(':')
+                self._feed(digest, value[key], seen)
+                digest.update(',')
+            digest.update('}')
+        elif isinstance(value, (set, frozenset)):
+            self._feed(digest, sorted(value), seen)
+        elif callable(value):
+            digest.update('<callable>')
+        elif slot_names(value.__class__) or hasattr(value, '__dict__'):
+            if id(value) in seen:
+                # a reference back to an object we are already walking
+                digest.update('<%s %d>' % (value.__class__.__name__, seen[id(value)]))
+                return
+            seen[id(value)] = len(seen)
+            digest.update('<%s.%s ' % (value.__class__.__module__, value.__class__.__name__))
+            self._feed(digest, dict([(k, v) for k, v in item_attributes(value).items() if k not in self.skip_attributes]), seen)
+            digest.update('>')
+        else:
+            # if the repr contains an address, this is simply a miss
+            digest.update(repr(value))
+
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import sys
+import time
+import logging
+from contextlib import contextmanager
+try:
+    import resource
+    # per thread cpu time, datasources may be read in parallel threads
+    RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1 if sys.platform.startswith('linux') else resource.RUSAGE_SELF)
+    # ru_maxrss is kB on linux, bytes on darwin
+    MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+except ImportError:
+    resource = None
+
+logger = logging.getLogger('coshsh')
+
+
+def rusage(threads=False):
+    """
+    threads=True counts the cpu time of the whole process, for steps
+    which start threads of their own. Otherwise only the calling thread
+    is counted, so that datasources read in parallel threads do not
+    see the cpu time of each other.
+    """
+    if not resource:
+        return (time.clock(), 0.0, 0)
+    if threads:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+    else:
+        try:
+            own = resource.getrusage(RUSAGE_THREAD)
+        except (ValueError, resource.error):
+            own = resource.getrusage(resource.RUSAGE_SELF)
+    # finished render workers are accounted here
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+    return (own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime, maxrss)
+
+
+class RunStats(object):
+    """
+    Wall time, cpu time, growth of the max. rss and number of objects
+    of the phases of a recipe, of every datasource's open/read/close and
+    every datarecipient's cleanup/prepare/output.
+    A record is a tuple (component, name, step, wall, cpu, maxrss_delta, objects)
+    where component is recipe, datasource or datarecipient.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.records = []
+
+    def reset(self):
+        self.records = []
+
+    @contextmanager
+    def measure(self, component, name, step, objects=None, threads=False):
+        """
+        objects is a function which counts the objects after the step.
+        threads must be set if the step runs code in other threads.
+        """
+        wall = time.time()
+        cpu, children_cpu, maxrss = rusage(threads)
+        try:
+            yield
+        finally:
+            end_cpu, end_children_cpu, end_maxrss = rusage(threads)
+            self.records.append((component, name, step,
+                time.time() - wall,
+                (end_cpu - cpu) + (end_children_cpu - children_cpu),
+                end_maxrss - maxrss,
+                objects() if objects else None))
+
+    def log(self):
+        if not self.records:
+            return
+        logger.info("recipe %s %-13s %-30s %-8s %9s %9s %10s %8s" % (self.name, "", "", "step", "wall s", "cpu s", "rss+ kB", "objects"))
+        for component, name, step, wall, cpu, maxrss, objects in self.records:
+            logger.info("recipe %s %-13s %-30s %-8s %9.3f %9.3f %10d %8s" % (self.name, component, name[:30], step, wall, cpu, maxrss / 1024, "" if objects is None else objects))
+
+    def push(self, registry):
+        from prometheus_client import Gauge
+        labels = ['component', 'name', 'step']
+        wall_g = Gauge("coshsh_recipe_step_seconds", "The wall clock time of a step", labels, registry=registry)
+        cpu_g = Gauge("coshsh_recipe_step_cpu_seconds", "The cpu time of a step", labels, registry=registry)
+        rss_g = Gauge("coshsh_recipe_step_maxrss_bytes", "How much a step increased the max. rss", labels, registry=registry)
+        objects_g = Gauge("coshsh_recipe_step_objects", "The number of objects after a step", labels, registry=registry)
+        for component, name, step, wall, cpu, maxrss, objects in self.records:
+            wall_g.labels(component=component, name=name, step=step).set(wall)
+            cpu_g.labels(component=component, name=name, step=step).set(cpu)
+            rss_g.labels(component=component, name=name, step=step).set(maxrss)
+            if objects is not None:
+                objects_g.labels(component=component, name=name, step=step).set(objects)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import sys
+import logging
+
+logger = logging.getLogger('coshsh')
+
+
+class StringPool(object):
+    """
+    Deduplicates the strings of the inventory during the collect phase.
+    A recipe with intern_strings = yes activates a pool before it reads
+    its datasources, Item.__init__ and the datasources then store the
+    pooled string instead of their own copy of an equal one. After the
+    collect phase the pool is dropped, the objects keep the strings.
+    saved is the size of the duplicates which were replaced, it is an
+    estimate, a duplicate can still be referenced by someone else.
+    """
+
+    # the pool of the recipe which is collecting (the threads of a
+    # parallel collect share it)
+    active = None
+
+    def __init__(self):
+        # "1" == u"1", so str and unicode get separate pools
+        self.strings = {str: {}, unicode: {}}
+        self.lookups = 0
+        self.duplicates = 0
+        self.saved = 0
+
+    @classmethod
+    def activate(cls, pool):
+        """
+        Makes pool the active one (None switches interning off).
+        Returns the pool which was active before.
+        """
+        previous = cls.active
+        cls.active = pool
+        return previous
+
+    @classmethod
+    def intern_values(cls, row):
+        """
+        Replaces the string values of a dict by the pooled ones, if a
+        pool is active.
+        """
+        pool = cls.active
+        if pool:
+            for key in row:
+                row[key] = pool.intern(row[key])
+        return row
+
+    @classmethod
+    def intern_list(cls, values):
+        """
+        Returns a list of the pooled strings, if a pool is active.
+        """
+        pool = cls.active
+        if pool:
+            return [pool.intern(value) for value in values]
+        return values
+
+    def intern(self, value):
+        try:
+            strings = self.strings[type(value)]
+        except KeyError:
+            # subclasses of str and anything else are left alone
+            return value
+        # setdefault is atomic, the counters are not, they are statistics
+        pooled = strings.setdefault(value, value)
+        self.lookups += 1
+        if pooled is not value:
+            self.duplicates += 1
+            self.saved += sys.getsizeof(value)
+        return pooled
+
+    def get_stats(self):
+        return {
+            "strings": sum([len(strings) for strings in self.strings.values()]),
+            "lookups": self.lookups,
+            "duplicates": self.duplicates,
+            "saved": self.saved,
+        }
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import os
+import json
+import logging
+
+logger = logging.getLogger('coshsh')
+
+
+class TemplateProfiler(object):
+    """
+    Counts calls, total and max. render time and the size of the output
+    per template, per item class and per item (by fingerprint).
+    Every entry is [calls, seconds, max_seconds, bytes].
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.reset()
+
+    def reset(self):
+        self.templates = {}
+        self.classes = {}
+        self.items = {}
+
+    def add(self, template, item, seconds, size):
+        try:
+            fingerprint = item.fingerprint()
+        except Exception:
+            fingerprint = repr(item)
+        for table, key in [(self.templates, template), (self.classes, item.__class__.__name__), (self.items, fingerprint)]:
+            entry = table.get(key)
+            if entry is None:
+                table[key] = [1, seconds, seconds, size]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+                entry[3] += size
+
+    def data(self):
+        return {"templates": self.templates, "classes": self.classes, "items": self.items}
+
+    def merge(self, data):
+        # the numbers of a render worker
+        for name in ["templates", "classes", "items"]:
+            table = getattr(self, name)
+            for key, (calls, seconds, max_seconds, size) in data[name].items():
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = [calls, seconds, max_seconds, size]
+                else:
+                    entry[0] += calls
+                    entry[1] += seconds
+                    entry[2] = max(entry[2], max_seconds)
+                    entry[3] += size
+
+    def ranking(self, table):
+        return sorted(table.items(), key=lambda e: e[1][1], reverse=True)[:self.top]
+
+    def report(self, name):
+        total = sum([e[1] for e in self.templates.values()], 0.0)
+        if not total:
+            return
+        for title, table in [("templates", self.templates), ("item classes", self.classes), ("items", self.items)]:
+            logger.info("recipe %s top %d %s by render time" % (name, self.top, title))
+            for key, (calls, seconds, max_seconds, size) in self.ranking(table):
+                logger.info("recipe %s %9.1fms %5.1f%% %6d calls max %7.1fms %9d bytes %s" % (name, 1000 * seconds, 100.0 * seconds / total, calls, 1000 * max_seconds, size, key))
+
+    def write(self, path):
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data(), f, sort_keys=True, indent=1)
+            os.rename(tmp_path, path)
+            logger.info("template profile written to %s" % path)
+        except Exception, exp:
+            logger.error("could not write template profile %s (%s)" % (path, exp))
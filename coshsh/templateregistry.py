@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+#
+# This file belongs to coshsh.
+# Copyright Gerhard Lausser.
+# This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+import os
+import logging
+from jinja2 import FileSystemLoader, TemplateNotFound
+from jinja2.loaders import split_template_path
+
+logger = logging.getLogger('coshsh')
+
+
+class TemplateRegistry(object):
+    """
+    Compiled templates shared by all the recipes of a process.
+    Only the code is shared. It is found with the file it was compiled
+    from, the mtime of this file, the name and the options of the
+    environment which change the generated code. Every environment
+    builds its own Template from the code, so filters, globals and the
+    included/extended/imported templates are those of the recipe which
+    renders. Two recipes whose templates_path lead to the same host.tpl
+    compile it only once.
+    """
+
+    codes = {}
+    compiles = {}
+    hits = {}
+
+    @classmethod
+    def get_template(cls, env, name):
+        if not isinstance(env.loader, FileSystemLoader):
+            return env.get_template(name)
+        filename = cls.resolve(env.loader, name)
+        if not filename:
+            raise TemplateNotFound(name)
+        mtime = os.path.getmtime(filename)
+        if not hasattr(env, 'coshsh_templates'):
+            env.coshsh_templates = {}
+        if (filename, name) in env.coshsh_templates:
+            template_mtime, template = env.coshsh_templates[(filename, name)]
+            if template_mtime == mtime:
+                return template
+        key = (filename, mtime, name, cls.signature(env))
+        if key in cls.codes:
+            cls.hits[filename] = cls.hits.get(filename, 0) + 1
+        else:
+            cls.evict(filename, mtime)
+            cls.codes[key] = cls.compile(env, name)
+            cls.compiles[filename] = cls.compiles.get(filename, 0) + 1
+        uptodate = lambda: os.path.exists(filename) and os.path.getmtime(filename) == mtime
+        template = env.template_class.from_code(env, cls.codes[key], env.make_globals(None), uptodate)
+        env.coshsh_templates[(filename, name)] = (mtime, template)
+        return template
+
+    @classmethod
+    def compile(cls, env, name):
+        # like jinja2's BaseLoader.load, but without the Template.
+        # the loader's filename (not the absolute one) is part of the
+        # bytecode cache key, so env.get_template finds the same file
+        source, loader_filename, uptodate = env.loader.get_source(env, name)
+        bucket = None
+        if env.bytecode_cache is not None:
+            bucket = env.bytecode_cache.get_bucket(env, name, loader_filename, source)
+            if bucket.code is not None:
+                return bucket.code
+        code = env.compile(source, name, loader_filename)
+        if bucket is not None:
+            bucket.code = code
+            env.bytecode_cache.set_bucket(bucket)
+        return code
+
+    @classmethod
+    def evict(cls, filename, mtime):
+        # the code of older versions of the file is never used again
+        for key in [k for k in cls.codes if k[0] == filename and k[1] != mtime]:
+            del cls.codes[key]
+
+    @classmethod
+    def resolve(cls, loader, name):
+        pieces = split_template_path(name)
+        for searchpath in loader.searchpath:
+            filename = os.path.abspath(os.path.join(searchpath, *pieces))
+            if os.path.isfile(filename):
+                return filename
+        return None
+
+    @classmethod
+    def signature(cls, env):
+        # everything which makes a difference when a template is
+        # compiled. the names of filters and tests are checked by the
+        # compiler, the functions are looked up when the template is
+        # rendered. extensions are kept as classes, a different class
+        # behind the same import path must not find this code.
+        # filters etc. are added after the Environment was created,
+        # so this must be called late.
+        if not hasattr(env, 'coshsh_signature'):
+            env.coshsh_signature = (
+                env.block_start_string, env.block_end_string,
+                env.variable_start_string, env.variable_end_string,
+                env.comment_start_string, env.comment_end_string,
+                env.line_statement_prefix, env.line_comment_prefix,
+                env.trim_blocks, env.lstrip_blocks,
+                env.newline_sequence, env.keep_trailing_newline,
+                env.optimized, env.autoescape,
+                tuple([(k, type(env.extensions[k])) for k in sorted(env.extensions.keys())]),
+                tuple(sorted(env.filters.keys())),
+                tuple(sorted(env.tests.keys())),
+            )
+        return env.coshsh_signature
+
+    @classmethod
+    def get_stats(cls):
+        return dict([(filename, (cls.compiles.get(filename, 0), cls.hits.get(filename, 0))) for filename in set(cls.compiles.keys() + cls.hits.keys())])
+
+    @classmethod
+    def merge_stats(cls, stats):
+        # counters from a worker process
+        for filename, (compiles, hits) in stats.items():
+            cls.compiles[filename] = cls.compiles.get(filename, 0) + compiles
+            cls.hits[filename] = cls.hits.get(filename, 0) + hits
+
+    @classmethod
+    def log_stats(cls):
+        stats = cls.get_stats()
+        if not stats:
+            return
+        for filename in sorted(stats.keys()):
+            logger.debug("template %s compiled %d times, reused %d times" % (filename, stats[filename][0], stats[filename][1]))
+        compiles = sum([s[0] for s in stats.values()], 0)
+        hits = sum([s[1] for s in stats.values()], 0)
+        logger.info("template registry: %d templates compiled %d times, %d reused (hit ratio %.1f%%)" % (len(stats), compiles, hits, 100.0 * hits / (compiles + hits)))
+
@@ -180,3 +180,31 @@ def restore_logging():
 def get_logger(self, name="coshsh"):
     return logging.getLogger(name)
 
+
+def fsync_path(path):
+    # works for files and directories
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sync_filesystem(path):
+    # one syncfs(2) for the filesystem where path is, a global
+    # sync(2) where syncfs is not available
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if libc.syncfs(fd) == 0:
+                return
+        finally:
+            os.close(fd)
+    except (ImportError, OSError, AttributeError):
+        pass
+    if hasattr(os, "sync"):
+        os.sync()
+    else:
+        import subprocess
+        subprocess.call(["sync"])
@@ -15,6 +15,7 @@ def __mi_ident__(params={}):
         return ContactSMS
     elif coshsh.util.is_attr("type", params, "PHONE"):
         return ContactPhone
+__mi_ident__.ident_match = {"type": "^(WEBREADWRITE|WEBREADONLY|MAIL|SMS|PHONE)$"}
 
 
 class ContactWeb(coshsh.contact.Contact):
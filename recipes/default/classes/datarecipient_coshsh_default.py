@@ -8,12 +8,13 @@
 import os
 import re
 import shutil
+import glob
 import logging
 import time
 from subprocess import Popen, PIPE, STDOUT
 import coshsh
 from coshsh.datarecipient import Datarecipient
-from coshsh.util import compare_attr
+from coshsh.util import compare_attr, fsync_path, sync_filesystem
 
 logger = logging.getLogger('coshsh')
 
@@ -23,6 +24,9 @@ def __dr_ident__(params={}):
 
 
 class DatarecipientCoshshDefault(coshsh.datarecipient.Datarecipient):
+    streamable = True
+    want_tool = "nagios"
+
     def __init__(self, **kwargs):
         super(self.__class__, self).__init__(**kwargs)
         self.name = kwargs["name"]
@@ -30,11 +34,34 @@ class DatarecipientCoshshDefault(coshsh.datarecipient.Datarecipient):
         self.max_delta = kwargs.get("max_delta", kwargs.get("recipe_max_delta", ()))
         self.max_delta_action = kwargs.get("max_delta_action", kwargs.get("recipe_max_delta_action", None))
         self.safe_output = kwargs.get("safe_output", kwargs.get("recipe_safe_output", False))
+        self.diff_output = kwargs.get("diff_output", kwargs.get("recipe_diff_output", False)) in [True, "yes"]
         self.static_dir = os.path.join(self.objects_dir, 'static')
         if self.objects_dir.endswith("//"):
             self.dynamic_dir = self.objects_dir.rstrip("//")
         else:
             self.dynamic_dir = os.path.join(self.objects_dir, 'dynamic')
+        # staged_output = yes|symlink writes into a new dir next to
+        # dynamic_dir. dynamic_dir is a symlink which is switched to
+        # the new dir at the end
+        self.staged_output = kwargs.get("staged_output", kwargs.get("recipe_staged_output", None))
+        if self.staged_output == "rename":
+            # two renames leave a moment without any dynamic_dir
+            logger.warning("recipe %s staged_output = rename is not atomic and no longer supported, using symlink" % self.name)
+            self.staged_output = "symlink"
+        if self.staged_output in ["yes", "symlink"]:
+            self.staged_output = "symlink"
+        else:
+            self.staged_output = None
+        self.fsync = kwargs.get("fsync", kwargs.get("recipe_fsync", None))
+        if self.fsync not in ["file", "dir", "syncfs"]:
+            self.fsync = None
+        self.published_dir = self.dynamic_dir.rstrip("/")
+
+    def count_before_objects(self):
+        # a run which failed before publishing leaves dynamic_dir
+        # pointing to its staging dir
+        self.dynamic_dir = self.published_dir
+        super(self.__class__, self).count_before_objects()
 
     def prepare_target_dir(self):
         logger.info("recipient %s dynamic_dir %s" % (self.name, self.dynamic_dir))
@@ -50,6 +77,28 @@ class DatarecipientCoshshDefault(coshsh.datarecipient.Datarecipient):
             pass
 
     def cleanup_target_dir(self):
+        if self.staged_output or self.streamed:
+            # streamed output is always staged, a failed rendering must
+            # not leave a half written dynamic_dir
+            self.cleanup_staging_dirs()
+            stage_dir = self.published_dir + ".stage." + time.strftime("%Y%m%d%H%M%S") + ".%d" % os.getpid()
+            self.dynamic_dir = stage_dir
+            serial = 0
+            while os.path.lexists(self.dynamic_dir):
+                # the published one from a run in the same second
+                serial += 1
+                self.dynamic_dir = stage_dir + ".%d" % serial
+            logger.info("recipe %s writes to staging dir %s" % (self.name, self.dynamic_dir))
+            if self.diff_output:
+                self.load_manifest(self.published_dir)
+            return
+        if self.diff_output and os.path.exists(os.path.join(self.dynamic_dir, self.manifest_file)):
+            logger.info("recipe %s keeps dynamic_dir %s, only changes will be written" % (self.name, self.dynamic_dir))
+            self.load_manifest()
+            return
+        elif self.diff_output:
+            # the first run with a manifest starts with an empty dir
+            self.load_manifest()
         if os.path.isdir(self.dynamic_dir):
             try:
                 if os.path.exists(self.dynamic_dir + "/.git"):
@@ -67,10 +116,19 @@ class DatarecipientCoshshDefault(coshsh.datarecipient.Datarecipient):
             logger.info("recipe %s dynamic_dir %s does not exist" % (self.name, self.dynamic_dir))
 
     def output(self, filter=None):
-        super(self.__class__, self).output(filter, "nagios")
+        super(self.__class__, self).output(filter, self.want_tool)
+        self.finish_manifest()
+        # a staging dir is counted before it is published
         self.count_after_objects()
         logger.info("number of files before: %d hosts, %d applications" % self.old_objects)
         logger.info("number of files after:  %d hosts, %d applications" % self.new_objects)
+        if self.dynamic_dir != self.published_dir:
+            if self.safe_output and self.too_much_delta():
+                self.discard_target_dir()
+                return
+            self.publish_target_dir()
+        elif self.fsync:
+            self.sync_target_dir()
         if self.safe_output and self.too_much_delta() and os.path.exists(self.dynamic_dir + '/.git'):
             save_dir = os.getcwd()
             os.chdir(self.dynamic_dir)
@@ -176,6 +234,73 @@ class DatarecipientCoshshDefault(coshsh.datarecipient.Datarecipient):
             self.analyze_output(output)
 
 
+    def cleanup_staging_dirs(self):
+        # left behind by runs which crashed
+        current = os.path.realpath(self.published_dir)
+        for stage_dir in glob.glob(self.published_dir + ".stage.*"):
+            if os.path.realpath(stage_dir) != current and not os.path.islink(stage_dir):
+                logger.info("recipe %s remove old staging dir %s" % (self.name, stage_dir))
+                shutil.rmtree(stage_dir, True)
+
+    def publish_target_dir(self):
+        """
+        Replaces published_dir with the staging dir. published_dir is a
+        symlink and the switch is a single rename of a new symlink over
+        it. Only the first time, when published_dir is still a directory,
+        it has to be moved away to make room for the symlink.
+        """
+        staging_dir = self.dynamic_dir
+        parent_dir = os.path.dirname(os.path.abspath(self.published_dir))
+        self.sync_target_dir()
+        old_dir = None
+        if os.path.islink(self.published_dir):
+            old_dir = os.path.realpath(self.published_dir)
+        elif os.path.isdir(self.published_dir):
+            old_dir = self.published_dir + ".stage.old"
+            shutil.rmtree(old_dir, True)
+            logger.info("recipe %s replaces the directory %s by a symlink" % (self.name, self.published_dir))
+            os.rename(self.published_dir, old_dir)
+        tmp_link = self.published_dir + ".stage.link"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.basename(staging_dir), tmp_link)
+        os.rename(tmp_link, self.published_dir)
+        if old_dir and os.path.exists(os.path.join(old_dir, ".git")):
+            # the history goes on in the new dir, but only after the
+            # switch, the live dir keeps its .git until then
+            os.rename(os.path.join(old_dir, ".git"), os.path.join(staging_dir, ".git"))
+        if self.fsync:
+            fsync_path(parent_dir)
+        logger.info("recipe %s published %s" % (self.name, self.published_dir))
+        if old_dir:
+            shutil.rmtree(old_dir, True)
+        self.dynamic_dir = self.published_dir
+
+    def sync_target_dir(self):
+        """
+        Flushes dynamic_dir to the disk. file: the files were synced when
+        they were written, only the directories are left. dir: the files
+        of a directory, then the directory. syncfs: the whole filesystem.
+        """
+        if self.fsync in ["file", "dir"]:
+            for root, dirs, files in os.walk(self.dynamic_dir, topdown=False):
+                if self.fsync == "dir":
+                    for name in files:
+                        path = os.path.join(root, name)
+                        if os.path.isfile(path) and not os.path.islink(path):
+                            fsync_path(path)
+                fsync_path(root)
+        elif self.fsync == "syncfs":
+            sync_filesystem(self.dynamic_dir)
+
+    def discard_target_dir(self):
+        # safe_output and too many changes, the published dir stays as it is
+        logger.error("number of hosts changed by %.2f percent" % self.delta_hosts)
+        logger.error("number of applications changed by %.2f percent" % self.delta_services)
+        logger.error("recipe %s does not publish %s, please check your datasource" % (self.name, self.dynamic_dir))
+        shutil.rmtree(self.dynamic_dir, True)
+        self.dynamic_dir = self.published_dir
+
     def analyze_output(self, output):
         add_hosts = []
         del_hosts = []
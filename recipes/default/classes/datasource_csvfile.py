@@ -17,6 +17,7 @@ from coshsh.application import Application
 from coshsh.contactgroup import ContactGroup
 from coshsh.contact import Contact
 from coshsh.monitoringdetail import MonitoringDetail
+from coshsh.stringpool import StringPool
 from coshsh.util import compare_attr, substenv
 
 logger = logging.getLogger('coshsh')
@@ -99,6 +100,8 @@ class CsvFile(coshsh.datasource.Datasource):
                     row[attr] = row[attr].lower()
                 except Exception:
                     pass
+            # the copies of a row share its strings
+            StringPool.intern_values(row)
             if '[' in row['host_name'] or '*' in row['host_name']:
                 # hostnames can be regular expressions
                 matching_hosts = [h for h in self.objects['hosts'].keys() if re.match('^('+row['host_name']+')', h)]
@@ -120,6 +123,7 @@ class CsvFile(coshsh.datasource.Datasource):
         resolvedrows = []
         # host_name,name,type,monitoring_type,monitoring_0,monitoring_1,monitoring_2,monitoring_3,monitoring_4,monitoring_5
         for row in appdetailreader:
+            StringPool.intern_values(row)
             if '[' in row['host_name'] or '*' in row['host_name']:
                 # hostnames can be regular expressions
                 matching_hosts = [h for h in self.objects['hosts'].keys() if re.match('^('+row['host_name']+')', h)]
@@ -154,7 +158,7 @@ class CsvFile(coshsh.datasource.Datasource):
                 resolvedrows.append(copy(row))
         for row in resolvedrows:
             application_id = "%s+%s+%s" % (row["host_name"], row["name"], row["type"])
-            for group in row["groups"].split(":"):
+            for group in StringPool.intern_list(row["groups"].split(":")):
                 if not self.find('contactgroups', group):
                     self.add('contactgroups', coshsh.contactgroup.ContactGroup({ 'contactgroup_name' : group }))
                 if self.find('applications', application_id) and row["name"] == "os":
@@ -185,7 +189,7 @@ class CsvFile(coshsh.datasource.Datasource):
         for row in contactreader:
             c = coshsh.contact.Contact(row)
             if not self.find('contacts', c.fingerprint()):
-                c.contactgroups.extend(row["groups"].split(":"))
+                c.contactgroups.extend(StringPool.intern_list(row["groups"].split(":")))
                 self.add('contacts', c)
 
 
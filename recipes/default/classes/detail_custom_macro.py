@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "CUSTOMMACRO":
         return MonitoringDetailCustomMacro
+__detail_ident__.ident_match = {"monitoring_type": "^CUSTOMMACRO$"}
 
 
 class MonitoringDetailCustomMacro(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailCustomMacro(coshsh.monitoringdetail.MonitoringDetail):
     property = "custom_macros"
     property_type = dict
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("key", "value")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.key = params["monitoring_0"]
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "DEPTH":
         return MonitoringDetailDepth
+__detail_ident__.ident_match = {"monitoring_type": "^DEPTH$"}
 
 
 class MonitoringDetailDepth(coshsh.monitoringdetail.MonitoringDetail):
@@ -15,6 +16,8 @@ class MonitoringDetailDepth(coshsh.monitoringdetail.MonitoringDetail):
     property_type = int
     property_flat = True
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("monitoring_depth",)
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.monitoring_depth = int(params.get("monitoring_0", 1))
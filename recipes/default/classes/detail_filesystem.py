@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "FILESYSTEM":
         return MonitoringDetailFilesystem
+__detail_ident__.ident_match = {"monitoring_type": "^FILESYSTEM$"}
 
 
 class MonitoringDetailFilesystem(coshsh.monitoringdetail.MonitoringDetail):
@@ -13,6 +14,8 @@ class MonitoringDetailFilesystem(coshsh.monitoringdetail.MonitoringDetail):
     property_type = list
     unique_attribute = "path"
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("path", "warning", "critical", "units", "optional", "iwarning", "icritical")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         if "monitoring_0" in params:
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "INTERFACE":
         return MonitoringDetailInterface
+__detail_ident__.ident_match = {"monitoring_type": "^INTERFACE$"}
 
 
 class MonitoringDetailInterface(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailInterface(coshsh.monitoringdetail.MonitoringDetail):
     property = "interfaces"
     property_type = list
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("name",)
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.name = params.get("monitoring_0", None)
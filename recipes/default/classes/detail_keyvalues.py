@@ -6,6 +6,7 @@ def __detail_ident__(params={}):
         return MonitoringDetailKeyvalues
     elif params["monitoring_type"] == "KEYVALUESARRAY":
         return MonitoringDetailKeyvaluesArray
+__detail_ident__.ident_match = {"monitoring_type": "^(KEYVALUES|KEYVALUESARRAY)$"}
 
 
 class MonitoringDetailKeyvalues(coshsh.monitoringdetail.MonitoringDetail):
@@ -14,6 +15,8 @@ class MonitoringDetailKeyvalues(coshsh.monitoringdetail.MonitoringDetail):
     property = "generic"
     property_type = dict
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("dictionary",)
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.dictionary = { }
@@ -42,6 +45,8 @@ class MonitoringDetailKeyvaluesArray(coshsh.monitoringdetail.MonitoringDetail):
     property = "generic"
     property_type = list
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("dictionary",)
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.dictionary = { }
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "LOGIN":
         return MonitoringDetailLogin
+__detail_ident__.ident_match = {"monitoring_type": "^LOGIN$"}
 
 
 class MonitoringDetailLogin(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailLogin(coshsh.monitoringdetail.MonitoringDetail):
     property = "login"
     property_type = str
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("username", "password")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.username = params["monitoring_0"]
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "LOGINSNMPV2":
         return MonitoringDetailLoginSNMPV2
+__detail_ident__.ident_match = {"monitoring_type": "^LOGINSNMPV2$"}
 
 
 class MonitoringDetailLoginSNMPV2(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailLoginSNMPV2(coshsh.monitoringdetail.MonitoringDetail):
     property = "loginsnmpv2"
     property_type = str
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("community", "protocol")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.community = params.get("monitoring_0", "public") or "_none_"
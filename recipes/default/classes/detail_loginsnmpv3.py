@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "LOGINSNMPV3":
         return MonitoringDetailLoginSNMPV3
+__detail_ident__.ident_match = {"monitoring_type": "^LOGINSNMPV3$"}
 
 
 class MonitoringDetailLoginSNMPV3(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailLoginSNMPV3(coshsh.monitoringdetail.MonitoringDetail):
     property = "loginsnmpv3"
     property_type = str
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("securityname", "authprotocol", "authkey", "privprotocol", "privkey", "context", "securitylevel")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.securityname = params.get("monitoring_0", None)
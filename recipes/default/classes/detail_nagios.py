@@ -4,12 +4,15 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "NAGIOS":
         return MonitoringDetailNagios
+__detail_ident__.ident_match = {"monitoring_type": "^NAGIOS$"}
 
 
 class MonitoringDetailNagios(coshsh.monitoringdetail.MonitoringDetail):
     property = "generic"
     property_type = str
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("attribute", "value")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.attribute = params.get("monitoring_0", None)
@@ -4,12 +4,15 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "NAGIOSCONF":
         return MonitoringDetailNagiosConf
+__detail_ident__.ident_match = {"monitoring_type": "^NAGIOSCONF$"}
 
 
 class MonitoringDetailNagiosConf(coshsh.monitoringdetail.MonitoringDetail):
     property = "generic"
     property_type = str
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("name", "attribute", "value")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         # modify an attribute of service "name"
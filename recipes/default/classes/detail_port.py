@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "PORT":
         return MonitoringDetailPort
+__detail_ident__.ident_match = {"monitoring_type": "^PORT$"}
 
 
 class MonitoringDetailPort(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailPort(coshsh.monitoringdetail.MonitoringDetail):
     property = "ports"
     property_type = list
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("port", "warning", "critical")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.port = params["monitoring_0"]
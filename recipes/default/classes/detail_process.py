@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}): 
     if params["monitoring_type"] == "PROCESS":
         return MonitoringDetailProcess
+__detail_ident__.ident_match = {"monitoring_type": "^PROCESS$"}
 
 
 class MonitoringDetailProcess(coshsh.monitoringdetail.MonitoringDetail):
@@ -13,6 +14,8 @@ class MonitoringDetailProcess(coshsh.monitoringdetail.MonitoringDetail):
     property_type = list
     mandatory_fields = ["monitoring_0"]
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("name", "warning", "critical", "alias")
+
     def __init__(self, params):
         try:
             self.monitoring_type = params["monitoring_type"]
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "ROLE":
         return MonitoringDetailRole
+__detail_ident__.ident_match = {"monitoring_type": "^ROLE$"}
 
 
 class MonitoringDetailRole(coshsh.monitoringdetail.MonitoringDetail):
@@ -13,6 +14,8 @@ class MonitoringDetailRole(coshsh.monitoringdetail.MonitoringDetail):
     property_type = str
     property_flat = True
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("role",)
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.role = params["monitoring_0"]
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "SOCKET":
         return MonitoringDetailSocket
+__detail_ident__.ident_match = {"monitoring_type": "^SOCKET$"}
 
 
 class MonitoringDetailSocket(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailSocket(coshsh.monitoringdetail.MonitoringDetail):
     property = "socket"
     property_type = str
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("socket", "warning", "critical")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.socket = params["monitoring_0"]
@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "TAG":
         return MonitoringDetailTag
+__detail_ident__.ident_match = {"monitoring_type": "^TAG$"}
 
 
 class MonitoringDetailTag(coshsh.monitoringdetail.MonitoringDetail):
@@ -14,6 +15,8 @@ class MonitoringDetailTag(coshsh.monitoringdetail.MonitoringDetail):
     property_flat = True
     property_attr = "tag" # application.tags will be a list of property.tag
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("tag",)
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.tag = params["monitoring_0"]
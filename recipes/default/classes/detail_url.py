@@ -5,12 +5,15 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}):
     if params["monitoring_type"] == "URL":
         return MonitoringDetailUrl
+__detail_ident__.ident_match = {"monitoring_type": "^URL$"}
 
 
 class MonitoringDetailUrl(coshsh.monitoringdetail.MonitoringDetail):
     property = "urls"
     property_type = list
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("url", "warning", "critical", "url_expect", "scheme", "netloc", "path", "params", "query", "fragment", "username", "password", "hostname", "port")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.url = params.get("monitoring_0", None)
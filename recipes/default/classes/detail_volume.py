@@ -4,6 +4,7 @@ from coshsh.monitoringdetail import MonitoringDetail
 def __detail_ident__(params={}): 
     if params["monitoring_type"] == "VOLUME":
         return MonitoringDetailVolume
+__detail_ident__.ident_match = {"monitoring_type": "^VOLUME$"}
 
 
 class MonitoringDetailVolume(coshsh.monitoringdetail.MonitoringDetail):
@@ -12,6 +13,8 @@ class MonitoringDetailVolume(coshsh.monitoringdetail.MonitoringDetail):
     property = "volumes"
     property_type = list
 
+    __slots__ = coshsh.monitoringdetail.MonitoringDetail.row_slots + ("name", "warning", "critical", "units")
+
     def __init__(self, params):
         self.monitoring_type = params["monitoring_type"]
         self.name = params["monitoring_0"]
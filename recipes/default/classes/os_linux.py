@@ -7,6 +7,7 @@ from coshsh.util import compare_attr, is_attr
 def __mi_ident__(params={}):
     if coshsh.util.is_attr("name", params, "os") and coshsh.util.compare_attr("type", params, ".*red\s*hat.*|.*rhel.*|.*sles.*|.*linux.*|.*limux.*|.*debian.*|.*ubuntu.*|.*centos.*"):
         return Linux
+__mi_ident__.ident_match = {"name": "^os$", "type": ".*red\s*hat.*|.*rhel.*|.*sles.*|.*linux.*|.*limux.*|.*debian.*|.*ubuntu.*|.*centos.*"}
 
 
 class Linux(coshsh.application.Application):
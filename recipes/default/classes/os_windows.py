@@ -6,6 +6,7 @@ from coshsh.util import compare_attr, is_attr
 def __mi_ident__(params={}):
     if coshsh.util.is_attr("name", params, "os") and coshsh.util.compare_attr("type", params, ".*windows.*"):
         return Windows
+__mi_ident__.ident_match = {"name": "^os$", "type": ".*windows.*"}
 
 
 class Windows(Application):
@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+import shutil
+import string
+import logging
+import copy
+
+
+sys.dont_write_bytecode = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import coshsh
+from coshsh.util import setup_logging
+from inventory import write_inventory
+from cook import run_benchmark, compare
+import micro
+import details
+
+class CoshshTest(unittest.TestCase):
+    def print_header(self):
+        print "#" * 80 + "\n" + "#" + " " * 78 + "#"
+        print "#" + string.center(self.id(), 78) + "#"
+        print "#" + " " * 78 + "#\n" + "#" * 80 + "\n"
+
+    def setUp(self):
+        shutil.rmtree("./var/bench", True)
+        setup_logging()
+
+    def tearDown(self):
+        shutil.rmtree("./var/bench", True)
+
+    def test_inventory(self):
+        self.print_header()
+        counts = write_inventory("./var/bench/data", "bench", hosts=20, apps=2, filesystems=2, ports=1, urls=1, keyvalues=1, sites=4)
+        self.assert_(counts["hosts"] == 20)
+        self.assert_(counts["applications"] == 20 * 3)
+        self.assert_(counts["applicationdetails"] == 20 * (2 + 1) + 20 * 2 * 2)
+        self.assert_(os.path.exists("./var/bench/data/bench_contactgroups.csv"))
+        self.assert_("bench_s3_host_.*" in open("./var/bench/data/bench_contactgroups.csv").read())
+
+    def test_benchmark(self):
+        self.print_header()
+        result = run_benchmark(os.path.abspath("./var/bench"), 20)
+        self.assert_(result["objects"]["hosts"] == 20)
+        self.assert_(result["objects"]["applications"] == 40)
+        self.assert_(result["objects"]["contactgroups"] > 0)
+        for phase in ["collect", "assemble", "render", "output"]:
+            self.assert_(phase in result["phases"])
+        self.assert_(result["objects_per_second"] > 0)
+        self.assert_(os.path.exists("./var/bench/objects/dynamic/hosts/bench_s1_host_000001/host.cfg"))
+        self.assert_([n for n in os.listdir("./var/bench/objects/dynamic/hosts/bench_s1_host_000001") if n.startswith("app_bench_")])
+        self.assert_([r for r in compare(result, result, 10) if r[4]] == [])
+        slower = copy.deepcopy(result)
+        slower["phases"]["render"]["wall"] = result["phases"]["render"]["wall"] * 2 + 1
+        slower["objects_per_second"] = result["objects_per_second"] / 2
+        regressions = [r[0] for r in compare(slower, result, 10) if r[4]]
+        self.assert_(regressions == ["render wall", "objects/s"])
+    def test_micro(self):
+        self.print_header()
+        results = micro.run(number=20, repeat=1)
+        self.assert_(sorted(results.keys()) == sorted([b[0] for b in micro.BENCHMARKS]))
+        for name in results:
+            self.assert_(results[name]["ns_per_op"] > 0)
+        baseline = copy.deepcopy(results)
+        baseline["detail_sort"]["ns_per_op"] = results["detail_sort"]["ns_per_op"] / 2
+        self.assert_([r[0] for r in micro.compare(results, baseline, 20) if r[4]] == ["detail_sort"])
+        results = micro.run("get_class", number=20, repeat=1)
+        self.assert_(sorted(results.keys()) == ["application_get_class", "detail_get_class"])
+
+
+    def test_details(self):
+        self.print_header()
+        results = details.run(number=200)
+        for variant in details.VARIANTS:
+            self.assert_(results[variant]["number"] == 200)
+            self.assert_(results[variant]["bytes_per_detail"] > 0)
+        self.assert_(results["compact"]["classes"] == results["classic"]["classes"])
+        self.assert_("MonitoringDetailFilesystem" in results["compact"]["classes"])
+        self.assert_(results["compact"]["bytes_per_detail"] < results["classic"]["bytes_per_detail"])
+
+if __name__ == '__main__':
+    unittest.main()
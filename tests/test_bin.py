@@ -34,6 +34,7 @@ class CoshshTest(unittest.TestCase):
     def tearDown(self):
         shutil.rmtree("./var/objects/test1", True)
         shutil.rmtree("./var/objects/test1_mod", True)
+        shutil.rmtree("./var/template_cache", True)
         pass 
 
 
@@ -47,6 +48,37 @@ class CoshshTest(unittest.TestCase):
         self.assert_('os_windows_default_check_unittest' in os_windows_default_cfg)
 
 
+    def test_coshsh_cook_compile_templates(self):
+        self.print_header()
+        shutil.rmtree("./var/template_cache", True)
+        subprocess.call("../bin/coshsh-cook --cookbook etc/coshsh.cfg --recipe test4bc --compile-templates", shell=True)
+        # only compiled, not cooked
+        self.assert_(not os.path.exists("var/objects/test1/dynamic/hosts"))
+        cached = os.listdir("var/template_cache")
+        templates = [t for p in ["recipes/test4/templates", "../recipes/default/templates"] for t in os.listdir(p) if t.endswith(".tpl")]
+        # a template in the recipe dir hides the default one
+        self.assert_(len(cached) == len(set(templates)))
+        subprocess.call("../bin/coshsh-cook --cookbook etc/coshsh.cfg --recipe test4bc", shell=True)
+        self.assert_(os.path.exists("var/objects/test1/dynamic/hosts/test_host_0/os_windows_default.cfg"))
+        self.assert_(sorted(os.listdir("var/template_cache")) == sorted(cached))
+
+    def test_template_cache_options(self):
+        self.print_header()
+        shutil.rmtree("./var/template_cache", True)
+        self.generator.add_recipe(name='bc1', objects_dir="./var/objects/test1", template_cache_dir="./var/template_cache")
+        self.generator.add_recipe(name='bc2', objects_dir="./var/objects/test1", template_cache_dir="./var/template_cache")
+        env1 = self.generator.recipes['bc1'].jinja2.env
+        env2 = self.generator.recipes['bc2'].jinja2.env
+        # recipes with the same options share the cache files
+        self.assert_(env1.bytecode_cache.pattern == env2.bytecode_cache.pattern)
+        # code which was generated with other options is not used
+        env2.lstrip_blocks = True
+        self.assert_(self.generator.recipes['bc2'].init_bytecode_cache(env2).pattern != env1.bytecode_cache.pattern)
+        env2.lstrip_blocks = False
+        env2.add_extension('jinja2.ext.loopcontrols')
+        self.assert_(self.generator.recipes['bc2'].init_bytecode_cache(env2).pattern != env1.bytecode_cache.pattern)
+        shutil.rmtree("./var/template_cache", True)
+
     def test_create_template_tree(self):
         self.print_header()
         os.makedirs("./var/objects/test1/static")
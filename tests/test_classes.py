@@ -190,6 +190,242 @@ class CoshshTest(unittest.TestCase):
         self.assert_(coll_success == False)
         self.generator.recipes['test8'].assemble()
 
+    def test_class_registry(self):
+        self.print_header()
+        from coshsh.classregistry import ClassRegistry
+        from coshsh.application import Application
+        self.generator.add_recipe(name='test1', **dict(self.config.items('recipe_TEST1')))
+        factory = len(Application.class_factory)
+        registered = ClassRegistry.get_stats()["registered"]
+        duplicates = ClassRegistry.get_stats()["duplicates"]
+        for i in range(5):
+            self.generator.add_recipe(name='test1_%d' % i, **dict(self.config.items('recipe_TEST1')))
+        # the same class files, no additional imports and ident functions
+        self.assert_(len(Application.class_factory) == factory)
+        self.assert_(ClassRegistry.get_stats()["registered"] == registered)
+        self.assert_(ClassRegistry.get_stats()["duplicates"] > duplicates)
+        # a recipe with own classes gets its own view
+        self.generator.add_recipe(name='test4', **dict(self.config.items('recipe_TEST4')))
+        self.assert_(len(Application.class_factory) > factory)
+        # indexed, but imported only when get_class needs them
+        self.assert_(os.path.abspath('./recipes/test4/classes') in ClassRegistry.indexes)
+        self.generator.recipes['test1'].activate_class_cache()
+        self.assert_(len(Application.class_factory) == factory)
+        self.assert_(Application.class_factory is self.generator.recipes['test1'].class_factories[Application])
+        self.generator.recipes['test4'].activate_class_cache()
+        self.assert_([e for e in Application.class_factory if e[0] == os.path.abspath('./recipes/test4/classes')])
+
+    def test_class_dispatch(self):
+        self.print_header()
+        from coshsh.classregistry import ClassRegistry
+        from coshsh.application import Application
+        shutil.rmtree("./var/dispatch", True)
+        os.makedirs("./var/dispatch/classes")
+        with open("./var/dispatch/classes/app_versioned.py", "w") as f:
+            f.write("""import coshsh
+from coshsh.application import Application
+
+calls = []
+
+def __mi_ident__(params={}):
+    calls.append(params.get("version"))
+    if params["version"].startswith("2") and params["type"] == "versioned":
+        return Versioned2
+    elif params["type"] == "versioned":
+        return Versioned
+__mi_ident__.ident_params = ["version"]
+
+class Versioned(Application):
+    pass
+
+class Versioned2(Application):
+    pass
+""")
+        self.generator.add_recipe(name='dispatch', objects_dir="./var/objects/test1", classes_dir="./var/dispatch/classes")
+        ClassRegistry.dispatch_stats.clear()
+        for version in ["1.0", "2.0", "1.0", "2.0", "2.0"]:
+            newcls = Application.get_class({"name": "app", "type": "versioned", "version": version})
+            self.assert_(newcls.__name__ == ("Versioned2" if version == "2.0" else "Versioned"))
+        # no version, app_versioned raises a KeyError, os_linux matches
+        self.assert_(Application.get_class({"name": "os", "type": "red hat"}).__name__ == "Linux")
+        self.assert_(Application.get_class({"name": "os", "type": "red hat"}).__name__ == "Linux")
+        self.assert_(Application.get_class({"name": "app", "type": "unknown"}) is None)
+        hits, misses, exceptions = ClassRegistry.get_stats()["dispatch"]["Application"]
+        self.assert_((hits, misses) == (4, 4))
+        self.assert_(exceptions >= 1)
+        # an ident function which depends on everything switches off the cache
+        Application.class_factory[-1][2].ident_params = None
+        self.generator.recipes['dispatch'].init_class_cache()
+        ClassRegistry.dispatch_stats.clear()
+        Application.get_class({"name": "app", "type": "versioned", "version": "2.0"})
+        Application.get_class({"name": "app", "type": "versioned", "version": "2.0"})
+        self.assert_(ClassRegistry.get_stats()["dispatch"]["Application"][0:2] == (0, 2))
+        # so does one which declares nothing, it might read any param
+        Application.class_factory[-1][2].ident_params = ["version"]
+        with open("./var/dispatch/classes/app_undeclared.py", "w") as f:
+            f.write("""def __mi_ident__(params={}):
+    return None
+""")
+        self.generator.recipes['dispatch'].init_class_cache()
+        ClassRegistry.dispatch_stats.clear()
+        Application.get_class({"name": "app", "type": "versioned", "version": "2.0"})
+        Application.get_class({"name": "app", "type": "versioned", "version": "2.0"})
+        self.assert_(ClassRegistry.get_stats()["dispatch"]["Application"][0:2] == (0, 2))
+        self.assert_(os.path.join(os.path.abspath("./var/dispatch/classes"), "app_undeclared.py") in ClassRegistry.undeclared)
+        # but only the undeclared one is called every time, the results
+        # of the declared ones are still remembered
+        calls = [m for n, m in sys.modules.items() if n.startswith("app_versioned_") and m][0].calls
+        del calls[:]
+        for version in ["1.0", "2.0", "1.0", "2.0", "2.0"]:
+            newcls = Application.get_class({"name": "app", "type": "versioned", "version": version})
+            self.assert_(newcls.__name__ == ("Versioned2" if version == "2.0" else "Versioned"))
+        self.assert_(calls == ["1.0"])
+        shutil.rmtree("./var/dispatch", True)
+
+    def test_plugin_index(self):
+        self.print_header()
+        from coshsh.classregistry import ClassRegistry, LazyIdent
+        from coshsh.application import Application
+        from coshsh.monitoringdetail import MonitoringDetail
+        shutil.rmtree("./var/lazy", True)
+        os.makedirs("./var/lazy/classes")
+        with open("./var/lazy/classes/app_lazy.py", "w") as f:
+            f.write("""import coshsh
+from coshsh.application import Application
+
+def __mi_ident__(params={}):
+    if params["type"] == "lazy":
+        return Lazy
+__mi_ident__.ident_match = {"type": "^lazy$"}
+__mi_ident__.ident_params = ["type"]
+
+class Lazy(Application):
+    pass
+""")
+        with open("./var/lazy/classes/app_broken.py", "w") as f:
+            f.write("def __mi_ident__(params={}):\n    return Broken(\n")
+        lazy_file = os.path.abspath("./var/lazy/classes/app_lazy.py")
+        self.generator.add_recipe(name='lazy', objects_dir="./var/objects/test1", classes_dir="./var/lazy/classes")
+        self.generator.recipes['lazy'].activate_class_cache()
+        # indexed with its declarations, but not imported. nothing is
+        # written into the classes dir
+        self.assert_(sorted(os.listdir("./var/lazy/classes")) == ["app_broken.py", "app_lazy.py"])
+        index = ClassRegistry.index(os.path.abspath("./var/lazy/classes"))
+        self.assert_(index["app_lazy.py"]["idents"]["__mi_ident__"] == {"ident_match": {"type": "^lazy$"}, "ident_params": ["type"]})
+        self.assert_("error" in index["app_broken.py"])
+        self.assert_(not ClassRegistry.is_loaded(lazy_file))
+        entry = [e for e in Application.class_factory if e[1] == "app_lazy.py"][0]
+        self.assert_(isinstance(entry[2], LazyIdent))
+        # ident_match says no, still not imported
+        prefiltered = ClassRegistry.get_stats()["prefiltered"]
+        self.assert_(Application.get_class({"name": "os", "type": "red hat"}).__name__ == "Linux")
+        self.assert_(ClassRegistry.get_stats()["prefiltered"] > prefiltered)
+        self.assert_(not ClassRegistry.is_loaded(lazy_file))
+        # the first match imports it and replaces the placeholder
+        self.assert_(Application.get_class({"name": "app", "type": "lazy"}).__name__ == "Lazy")
+        self.assert_(ClassRegistry.is_loaded(lazy_file))
+        self.assert_(not isinstance(entry[2], LazyIdent))
+        self.assert_(entry[2].func_globals["Lazy"].__name__ == "Lazy")
+        # the index file in a cache_dir is used again
+        os.makedirs("./var/lazy/cache")
+        ClassRegistry.indexes.clear()
+        ClassRegistry.index(os.path.abspath("./var/lazy/classes"), "./var/lazy/cache")
+        self.assert_(len(os.listdir("./var/lazy/cache")) == 1)
+        ClassRegistry.indexes.clear()
+        self.assert_(ClassRegistry.read_index(os.path.abspath("./var/lazy/classes"), "./var/lazy/cache") == index)
+        self.assert_(ClassRegistry.index(os.path.abspath("./var/lazy/classes"), "./var/lazy/cache") == index)
+        self.assert_(sorted(os.listdir("./var/lazy/classes")) == ["app_broken.py", "app_lazy.py"])
+        # details which never show up are never imported
+        details = [e for e in MonitoringDetail.class_factory if e[1] == "detail_volume.py"]
+        self.assert_(details)
+        self.assert_(isinstance(details[0][2], LazyIdent) or details[0][2].ident_match == {"monitoring_type": "^VOLUME$"})
+        shutil.rmtree("./var/lazy", True)
+
+    def test_class_code_cache(self):
+        self.print_header()
+        from coshsh.classregistry import ClassRegistry
+        shutil.rmtree("./var/class_cache", True)
+        def cook(name):
+            # as if it were a new process
+            ClassRegistry.modules.clear()
+            ClassRegistry.indexes.clear()
+            ClassRegistry.scopes.clear()
+            self.generator.add_recipe(name=name, **dict(self.config.items('recipe_TEST4CC')))
+            self.config.set("datasource_SIMPLESAMPLE", "name", "simplesample")
+            self.generator.recipes[name].add_datasource(**dict(self.config.items("datasource_SIMPLESAMPLE")))
+            self.generator.recipes[name].collect()
+            self.generator.recipes[name].assemble()
+            self.generator.recipes[name].render()
+            self.assert_('os_linux_default.cfg' in self.generator.recipes[name].objects['applications']['test_host_0+os+red hat'].config_files['nagios'])
+            # the simplesample of test4
+            self.assert_(hasattr(self.generator.recipes[name].datasources[0], 'only_the_test_simplesample'))
+        compiled = ClassRegistry.get_stats()["load_times"]["compiled"][0]
+        cached = ClassRegistry.get_stats()["load_times"]["cached"][0]
+        cook('test4cc_cold')
+        self.assert_(ClassRegistry.get_stats()["load_times"]["compiled"][0] > compiled)
+        self.assert_(ClassRegistry.get_stats()["load_times"]["cached"][0] == cached)
+        files = os.listdir("./var/class_cache")
+        self.assert_([f for f in files if f.startswith("os_linux_") and f.endswith(".code")])
+        self.assert_([f for f in files if f.startswith("plugin_index_")])
+        compiled = ClassRegistry.get_stats()["load_times"]["compiled"][0]
+        cook('test4cc_warm')
+        self.assert_(ClassRegistry.get_stats()["load_times"]["compiled"][0] == compiled)
+        self.assert_(ClassRegistry.get_stats()["load_times"]["cached"][0] > cached)
+        # a changed class file is compiled again
+        os.utime("./recipes/test4/classes/os_linux.py", None)
+        self.generator.add_recipe(name='test4cc_changed', **dict(self.config.items('recipe_TEST4CC')))
+        coshsh.application.Application.get_class({"name": "os", "type": "red hat"})
+        self.assert_(ClassRegistry.get_stats()["load_times"]["compiled"][0] > compiled)
+        ClassRegistry.log_stats()
+        shutil.rmtree("./var/class_cache", True)
+
+    def test_class_scopes(self):
+        self.print_header()
+        from coshsh.classregistry import ClassRegistry
+        from coshsh.application import Application
+        shutil.rmtree("./var/scopes", True)
+        for scope in ["a", "b"]:
+            os.makedirs("./var/scopes/%s/classes" % scope)
+            with open("./var/scopes/%s/classes/scopehelper.py" % scope, "w") as f:
+                f.write("SCOPE = '%s'\n" % scope)
+            with open("./var/scopes/%s/classes/app_scoped.py" % scope, "w") as f:
+                f.write("""import scopehelper
+from coshsh.application import Application
+
+def __mi_ident__(params={}):
+    if params["type"] == "scoped":
+        return Scoped
+
+class Scoped(Application):
+    scope = scopehelper.SCOPE
+""")
+        sys_path = list(sys.path)
+        for i in range(3):
+            for scope in ["a", "b"]:
+                self.generator.add_recipe(name='scope_%s_%d' % (scope, i), objects_dir="./var/objects/test1", classes_dir="./var/scopes/%s/classes" % scope)
+        self.assert_(sys.path == sys_path)
+        classes = {}
+        for scope in ["a", "b"]:
+            self.generator.recipes['scope_%s_0' % scope].activate_class_cache()
+            classes[scope] = Application.get_class({"name": "app", "type": "scoped"})
+            self.assert_(classes[scope].scope == scope)
+            # the same classes_path, the same module
+            self.generator.recipes['scope_%s_2' % scope].activate_class_cache()
+            self.assert_(Application.get_class({"name": "app", "type": "scoped"}) is classes[scope])
+        self.assert_(classes["a"].__module__ != classes["b"].__module__)
+        self.assert_("app_scoped" not in sys.modules)
+        self.assert_("scopehelper" not in sys.modules)
+        # os_linux of test4 and of mycorp+test4 do not replace each other
+        self.generator.add_recipe(name='test4', **dict(self.config.items('recipe_TEST4')))
+        self.generator.add_recipe(name='test4a', **dict(self.config.items('recipe_TEST4A')))
+        linux = {}
+        for name in ["test4", "test4a", "test4"]:
+            self.generator.recipes[name].activate_class_cache()
+            newcls = Application.get_class({"name": "os", "type": "red hat"})
+            self.assert_(linux.setdefault(name, newcls) is newcls)
+        self.assert_(linux["test4"] is not linux["test4a"])
+        shutil.rmtree("./var/scopes", True)
+
     def xtest_rebless_class(self):
         self.print_header()
         self.generator.add_recipe(name='test1', **dict(self.config.items('recipe_TEST1')))
@@ -0,0 +1,114 @@
+import unittest
+import os
+import sys
+import shutil
+import string
+import logging
+import time
+
+
+sys.dont_write_bytecode = True
+
+import coshsh
+from coshsh.generator import Generator
+from coshsh.configparser import CoshshConfigParser
+from coshsh.util import setup_logging
+
+class CoshshTest(unittest.TestCase):
+    def print_header(self):
+        print "#" * 80 + "\n" + "#" + " " * 78 + "#"
+        print "#" + string.center(self.id(), 78) + "#"
+        print "#" + " " * 78 + "#\n" + "#" * 80 + "\n"
+
+    def setUp(self):
+        shutil.rmtree("./var/objects/test10", True)
+        shutil.rmtree("./var/daemon", True)
+        shutil.copytree("./recipes/test10/data", "./var/daemon/data")
+        shutil.copytree("./recipes/test10/classes", "./var/daemon/classes")
+        self.config = coshsh.configparser.CoshshConfigParser()
+        self.config.read('etc/coshsh.cfg')
+        for ds in ["1", "2", "3"]:
+            self.config.set("datasource_CSV10." + ds, "name", "csv" + ds)
+            self.config.set("datasource_CSV10." + ds, "dir", "./var/daemon/data")
+        self.config.set("recipe_TEST10nogit", "classes_dir", "./var/daemon/classes")
+        self.config.set("recipe_TEST10nogit", "interval", "3600")
+        self.generator = coshsh.generator.Generator()
+        setup_logging()
+
+    def tearDown(self):
+        shutil.rmtree("./var/objects/test10", True)
+        shutil.rmtree("./var/daemon", True)
+
+    def touch(self, path):
+        # mtimes may have a resolution of one second
+        os.utime(path, (time.time() + 10, time.time() + 10))
+
+    def test_daemon(self):
+        self.print_header()
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10nogit')))
+        recipe = self.generator.recipes['test10']
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            recipe.add_datasource(**dict(self.config.items(ds)))
+        self.assert_(recipe.interval == 3600)
+        self.generator.poll_interval = 0
+        runs = []
+        def sleep(seconds):
+            runs.append(self.generator.daemon_runs['test10'])
+            if len(runs) == 2:
+                with open("./var/daemon/data/csv1_hosts.csv", "a") as f:
+                    f.write("test_host_9,127.0.0.9,server,,Proliant DL380 G6,ps,7x24,rack1,versandverpackung\n")
+                self.touch("./var/daemon/data/csv1_hosts.csv")
+            elif len(runs) == 4:
+                with open("./var/daemon/classes/app_db_mysql.py", "a") as f:
+                    f.write("\nRELOADED = True\n")
+                self.touch("./var/daemon/classes/app_db_mysql.py")
+        self.generator.sleep = sleep
+        self.generator.run_daemon(cycles=5)
+        # due at start, nothing, csv changed, nothing, class changed
+        self.assert_(runs == [1, 1, 2, 2])
+        self.assert_(self.generator.daemon_runs['test10'] == 3)
+        self.assert_(os.path.exists("./var/objects/test10/dynamic/hosts/test_host_9/host.cfg"))
+        reloaded = [entry for entry in coshsh.application.Application.class_factory if entry[1] == 'app_db_mysql.py' and os.path.abspath(entry[0]) == os.path.abspath("./var/daemon/classes")]
+        self.assert_(reloaded)
+        self.assert_(reloaded[0][2].func_globals.get('RELOADED') == True)
+        # the datasources were created again from the new classes
+        self.assert_(len(recipe.datasources) == 3)
+        self.assert_(len(recipe.datarecipients) == 1)
+        self.assert_(len(recipe.objects['hosts']) == 7)
+
+    def test_watched_files(self):
+        self.print_header()
+        self.config.set("recipe_TEST10nogit", "class_cache_dir", "./var/daemon/classes/cache")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10nogit')))
+        recipe = self.generator.recipes['test10']
+        os.makedirs("./var/daemon/classes/__pycache__")
+        os.makedirs("./var/daemon/classes/.git")
+        for name in ["app_db_mysql.pyc", ".app_db_mysql.py.swp", ".coshsh_plugin_index.json", "__pycache__/app_db_mysql.pyc", ".git/index"]:
+            with open("./var/daemon/classes/" + name, "w") as f:
+                f.write("")
+        watched = [os.path.relpath(f, os.path.abspath("./var/daemon/classes")) for f in recipe.watched_files() if f.startswith(os.path.abspath("./var/daemon/classes"))]
+        self.assert_(sorted(watched) == sorted([f for f in os.listdir("./var/daemon/classes") if f.endswith(".py")]))
+
+    def test_reload_clears_dispatch(self):
+        self.print_header()
+        from coshsh.classregistry import ClassRegistry
+        from coshsh.application import Application
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10nogit')))
+        recipe = self.generator.recipes['test10']
+        recipe.activate_class_cache()
+        params = {"name": "mysql", "type": "mysql"}
+        self.assert_(Application.get_class(params).__name__ == "MySQL")
+        old_class_factory = Application.class_factory
+        self.assert_(id(old_class_factory) in ClassRegistry.dispatch_caches)
+        with open("./var/daemon/classes/app_db_mysql.py", "a") as f:
+            f.write("\nRELOADED = True\n")
+        self.touch("./var/daemon/classes/app_db_mysql.py")
+        self.assert_(recipe.reload_classes([os.path.abspath("./var/daemon/classes/app_db_mysql.py")]))
+        # nothing keeps the old list and its ident functions
+        self.assert_(not [c for c in ClassRegistry.dispatch_caches.values() if c.class_factory is old_class_factory])
+        recipe.activate_class_cache()
+        newcls = Application.get_class(params)
+        self.assert_(sys.modules[newcls.__module__].__dict__.get("RELOADED") == True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import string
 from optparse import OptionParser
 import ConfigParser
 import logging
+import gc
 from logging import INFO, DEBUG
 
 logger = logging.getLogger('coshsh')
@@ -18,6 +19,8 @@ from coshsh.datasource import Datasource
 from coshsh.application import Application
 from coshsh.monitoringdetail import MonitoringDetail
 from coshsh.util import setup_logging
+from coshsh.item import item_attributes
+from coshsh.rendercache import RenderCache
 
 
 class CoshshTest(unittest.TestCase):
@@ -135,6 +138,83 @@ class CoshshTest(unittest.TestCase):
         self.assert_(hasattr(opsys, 'ram'))
         self.assert_(opsys.ram.warning == '80')
 
+    def test_compact_details(self):
+        self.print_header()
+        coshsh.monitoringdetail.MonitoringDetail.init_classes([
+            os.path.join(os.path.dirname(__file__), '../recipes/default/classes')])
+        fs = coshsh.monitoringdetail.MonitoringDetail({'host_name': 'test_host_0',
+            'name': 'os',
+            'type': 'red hat 6.1',
+            'monitoring_type': 'FILESYSTEM',
+            'monitoring_0': '/var',
+            'monitoring_1': '20',
+            'monitoring_2': '10',
+        })
+        self.assert_(fs.__class__.__name__ == 'MonitoringDetailFilesystem')
+        self.assert_('__slots__' in fs.__class__.__dict__)
+        self.assert_(fs.path == '/var' and fs.warning == '20' and fs.units == '%')
+        self.assert_(fs.application_name == 'os' and fs.application_type == 'red hat 6.1')
+        self.assert_(fs.monitoring_details == ())
+        # all the attributes are in the slots, there is no __dict__
+        self.assert_(not [r for r in gc.get_referents(fs) if isinstance(r, dict)])
+        attributes = item_attributes(fs)
+        self.assert_(attributes['path'] == '/var')
+        self.assert_(attributes['host_name'] == 'test_host_0')
+        self.assert_('log' not in attributes and 'config_files' not in attributes)
+        self.assert_(not [r for r in gc.get_referents(fs) if isinstance(r, dict)])
+        # an attribute which is not in the slots
+        fs.comment = 'huhu'
+        self.assert_(item_attributes(fs)['comment'] == 'huhu')
+        fs2 = coshsh.monitoringdetail.MonitoringDetail({'host_name': 'test_host_0',
+            'name': 'os',
+            'type': 'red hat 6.1',
+            'monitoring_type': 'FILESYSTEM',
+            'monitoring_0': '/var',
+            'monitoring_1': '20',
+            'monitoring_2': '10',
+        })
+        fs3 = coshsh.monitoringdetail.MonitoringDetail({'host_name': 'test_host_0',
+            'name': 'os',
+            'type': 'red hat 6.1',
+            'monitoring_type': 'FILESYSTEM',
+            'monitoring_0': '/var',
+            'monitoring_1': '30',
+            'monitoring_2': '10',
+        })
+        cache = RenderCache('./var/objects/test6/render_cache')
+        self.assert_(cache.item_digest(fs2) != cache.item_digest(fs3))
+        fs3.warning = fs3.monitoring_1 = '20'
+        self.assert_(cache.item_digest(fs2) == cache.item_digest(fs3))
+
+    def test_resolve_unique_details(self):
+        self.print_header()
+        coshsh.application.Application.init_classes([
+            os.path.join(os.path.dirname(__file__), '../recipes/default/classes')])
+        coshsh.monitoringdetail.MonitoringDetail.init_classes([
+            os.path.join(os.path.dirname(__file__), '../recipes/default/classes')])
+        shop = coshsh.application.Application({'host_name': 'test_host_0', 'name': 'shop', 'type': 'webshop'})
+        def detail(monitoring_type, monitoring_0, monitoring_1='10'):
+            return coshsh.monitoringdetail.MonitoringDetail({'host_name': 'test_host_0',
+                'name': 'shop', 'type': 'webshop',
+                'monitoring_type': monitoring_type,
+                'monitoring_0': monitoring_0,
+                'monitoring_1': monitoring_1,
+            })
+        for args in [('FILESYSTEM', '/'), ('FILESYSTEM', '/var'), ('PORT', '22'), ('FILESYSTEM', '/', '20'), ('FILESYSTEM', '/data'), ('TAG', 'web'), ('FILESYSTEM', '/var', '30'), ('FILESYSTEM', '/', '40')]:
+            shop.monitoring_details.append(detail(*args))
+        filesystems = shop.filesystems = []
+        shop.resolve_monitoring_details()
+        # the last detail of a path wins and goes to the end
+        self.assert_([(f.path, f.warning) for f in shop.filesystems] == [('/data', '10'), ('/var', '30'), ('/', '40')])
+        self.assert_(shop.filesystems is not filesystems)
+        self.assert_([p.port for p in shop.ports] == ['22'])
+        self.assert_(shop.tags == ['web'])
+        self.assert_(shop.monitoring_details == [])
+        # a second round replaces the resolved ones
+        shop.monitoring_details.append(detail('FILESYSTEM', '/data', '50'))
+        shop.resolve_monitoring_details()
+        self.assert_([(f.path, f.warning) for f in shop.filesystems] == [('/var', '30'), ('/', '40'), ('/data', '50')])
+
     def test_detail_2url(self):
         self.print_header()
         cfg = self.config.items("datasource_CSVDETAILS")
@@ -0,0 +1,84 @@
+import unittest
+import os
+import sys
+import shutil
+import string
+import logging
+
+
+sys.dont_write_bytecode = True
+
+import coshsh
+from coshsh.generator import Generator
+from coshsh.configparser import CoshshConfigParser
+from coshsh.util import setup_logging
+
+class CoshshTest(unittest.TestCase):
+    def print_header(self):
+        print "#" * 80 + "\n" + "#" + " " * 78 + "#"
+        print "#" + string.center(self.id(), 78) + "#"
+        print "#" + " " * 78 + "#\n" + "#" * 80 + "\n"
+
+    def setUp(self):
+        shutil.rmtree("./var/objects/test10", True)
+        self.config = coshsh.configparser.CoshshConfigParser()
+        self.config.read('etc/coshsh.cfg')
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        setup_logging()
+
+    def tearDown(self):
+        shutil.rmtree("./var/objects/test10", True)
+
+    def cook(self, modify=None):
+        generator = coshsh.generator.Generator()
+        generator.add_recipe(name='test10diff', **dict(self.config.items('recipe_TEST10diff')))
+        recipe = generator.recipes['test10diff']
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            recipe.add_datasource(**dict(self.config.items(ds)))
+        recipe.collect()
+        recipe.assemble()
+        if modify:
+            modify(recipe)
+        recipe.render()
+        recipe.output()
+        return recipe
+
+    def read_output(self):
+        files = {}
+        for root, dirs, names in os.walk("var/objects/test10/dynamic"):
+            for name in names:
+                files[os.path.join(root, name)] = (open(os.path.join(root, name)).read(), os.stat(os.path.join(root, name)).st_mtime)
+        return files
+
+    def test_diff_output(self):
+        self.print_header()
+        recipe = self.cook()
+        self.assert_(os.path.exists("var/objects/test10/dynamic/.coshsh_manifest"))
+        stats = recipe.output_stats()
+        self.assert_(stats["written"] > 0)
+        self.assert_(stats["skipped"] == 0)
+        self.assert_(stats["deleted"] == 0)
+        first_output = self.read_output()
+
+        recipe = self.cook()
+        self.assert_(recipe.output_stats() == {"written": 0, "skipped": stats["written"], "deleted": 0})
+        # not even touched
+        self.assert_(self.read_output() == first_output)
+
+        def modify(recipe):
+            recipe.objects['hosts']['test_host_2'].address = '127.0.0.2'
+            del recipe.objects['hosts']['test_host_0']
+            for key in [k for k in recipe.objects['applications'] if k.startswith('test_host_0+')]:
+                del recipe.objects['applications'][key]
+        recipe = self.cook(modify)
+        # only the host.cfg of test_host_2 has a new content
+        self.assert_(recipe.output_stats()["written"] == 1)
+        self.assert_(recipe.output_stats()["deleted"] > 0)
+        self.assert_('127.0.0.2' in open("var/objects/test10/dynamic/hosts/test_host_2/host.cfg").read())
+        self.assert_(not os.path.exists("var/objects/test10/dynamic/hosts/test_host_0"))
+        self.assert_(os.path.exists("var/objects/test10/dynamic/hosts/test_host_1/host.cfg"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -89,6 +89,22 @@ class CoshshTest(unittest.TestCase):
         print self.application.fingerprint()
         print self.application.__class__.__name__
 
+    def test_fingerprint(self):
+        self.print_header()
+        row = {"host_name": "test", "name": "shop", "type": "apache"}
+        refs = sys.getrefcount(row)
+        application = coshsh.application.Application(row)
+        self.assert_(application.fingerprint() == "test+shop+apache")
+        self.assert_(coshsh.application.Application.fingerprint(row) == "test+shop+apache")
+        # the row is not kept alive by the object
+        self.assert_(sys.getrefcount(row) == refs)
+        self.assert_(application._fingerprint == "test+shop+apache")
+        host = coshsh.host.Host({"host_name": "test"})
+        self.assert_(host.fingerprint() == "test")
+        contactgroup = coshsh.contactgroup.ContactGroup()
+        contactgroup.contactgroup_name = "admins"
+        self.assert_(contactgroup.fingerprint() == "admins")
+
 if __name__ == '__main__':
     unittest.main()
 
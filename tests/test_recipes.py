@@ -2,7 +2,11 @@ import unittest
 import os
 import sys
 import shutil
+import json
+import glob
 import string
+import threading
+import time
 from optparse import OptionParser
 import logging
 
@@ -13,7 +17,11 @@ import coshsh
 from coshsh.generator import Generator
 from coshsh.datasource import Datasource
 from coshsh.application import Application
+from coshsh.monitoringdetail import MonitoringDetail
 from coshsh.configparser import CoshshConfigParser
+from coshsh.templateregistry import TemplateRegistry
+from coshsh.stringpool import StringPool
+from coshsh.runstats import RunStats
 from coshsh.util import setup_logging
 
 class CoshshTest(unittest.TestCase):
@@ -30,6 +38,8 @@ class CoshshTest(unittest.TestCase):
 
     def tearDown(self):
         shutil.rmtree("./var/objects/test10", True)
+        shutil.rmtree("./var/objects/test6", True)
+        shutil.rmtree("./var/objects/test10stream", True)
         pass
 
     def test_recipe_max_deltas_default(self):
@@ -118,6 +128,513 @@ class CoshshTest(unittest.TestCase):
         # git_init is yes by default
         self.assert_(not os.path.exists("var/objects/test10/dynamic/.git"))
 
+    def test_create_recipes_parallel_jobs(self):
+        self.print_header()
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            self.generator.recipes['test10nogit'].add_datasource(**dict(self.config.items(ds)))
+        self.generator.add_recipe(name='test6', **dict(self.config.items('recipe_TEST6')))
+        self.config.set("datasource_CSVDETAILS", "name", "test6")
+        self.generator.recipes['test6'].add_datasource(**dict(self.config.items("datasource_CSVDETAILS")))
+        self.generator.jobs = 2
+        summaries = self.generator.run()
+        self.assert_([s["name"] for s in summaries] == ['test10nogit', 'test6'])
+        self.assert_([s["status"] for s in summaries] == ['ok', 'ok'])
+        # the recipes were cooked in forked worker processes
+        self.assert_(os.getpid() not in [s["pid"] for s in summaries])
+        self.assert_(summaries[0]["objects"]["hosts"] == 6)
+        self.assert_(os.path.exists("var/objects/test10/dynamic/hosts/test_host_1/os_windows_default.cfg"))
+        self.assert_(os.path.exists("var/objects/test6/dynamic/hosts"))
+        # the pid files were removed by the workers
+        self.assert_(not os.path.exists(self.generator.recipes['test10nogit'].pid_file))
+        self.assert_(not os.path.exists(self.generator.recipes['test6'].pid_file))
+
+    def test_create_recipes_parallel_jobs_render_workers(self):
+        self.print_header()
+        # a --jobs worker can fork render workers of its own
+        def read_tree(top):
+            files = {}
+            for root, dirs, names in os.walk(top):
+                for name in names:
+                    files[os.path.relpath(os.path.join(root, name), top)] = open(os.path.join(root, name)).read()
+            return files
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            self.generator.recipes['test10nogit'].add_datasource(**dict(self.config.items(ds)))
+        self.generator.run()
+        written = read_tree("./var/objects/test10/dynamic")
+        shutil.rmtree("./var/objects/test10", True)
+        generator = coshsh.generator.Generator()
+        generator.add_recipe(name='test10workers', **dict(self.config.items('recipe_TEST10workers')))
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            generator.recipes['test10workers'].add_datasource(**dict(self.config.items(ds)))
+        generator.add_recipe(name='test6', **dict(self.config.items('recipe_TEST6')))
+        self.config.set("datasource_CSVDETAILS", "name", "test6")
+        generator.recipes['test6'].add_datasource(**dict(self.config.items("datasource_CSVDETAILS")))
+        generator.jobs = 2
+        summaries = generator.run()
+        self.assert_([s["status"] for s in summaries] == ['ok', 'ok'])
+        self.assert_(generator.recipes['test10workers'].render_workers == 3)
+        self.assert_(read_tree("./var/objects/test10/dynamic") == written)
+
+    def test_create_recipes_parallel_jobs_killed(self):
+        self.print_header()
+        import signal
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.generator.recipes['test10nogit'].add_datasource(**dict(self.config.items("datasource_CSV10.1")))
+        self.generator.add_recipe(name='test6', **dict(self.config.items('recipe_TEST6')))
+        self.config.set("datasource_CSVDETAILS", "name", "test6")
+        self.generator.recipes['test6'].add_datasource(**dict(self.config.items("datasource_CSVDETAILS")))
+        # the worker of test10nogit is killed while it collects
+        self.generator.recipes['test10nogit'].collect = lambda: os.kill(os.getpid(), signal.SIGKILL)
+        self.generator.jobs = 2
+        summaries = self.generator.run()
+        self.assert_([s["name"] for s in summaries] == ['test10nogit', 'test6'])
+        self.assert_([s["status"] for s in summaries] == ['failed', 'ok'])
+        self.assert_(summaries[0]["exitcode"] == -signal.SIGKILL)
+        os.remove(self.generator.recipes['test10nogit'].pid_file)
+
+    def test_create_recipe_step_stats(self):
+        self.print_header()
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            self.generator.recipes['test10nogit'].add_datasource(**dict(self.config.items(ds)))
+        summaries = self.generator.run()
+        steps = dict([((s[0], s[1], s[2]), s[3:]) for s in summaries[0]["steps"]])
+        for step in ["collect", "assemble", "render", "output"]:
+            self.assert_(("recipe", "test10nogit", step) in steps)
+        for ds in ["csv1", "csv2", "csv3"]:
+            for step in ["open", "read", "close"]:
+                self.assert_(("datasource", ds, step) in steps)
+        for step in ["cleanup", "prepare", "output"]:
+            self.assert_(("datarecipient", "datarecipient_coshsh_default", step) in steps)
+        wall, cpu, maxrss, objects = steps[("recipe", "test10nogit", "collect")]
+        self.assert_(wall >= 0 and cpu >= 0 and maxrss >= 0)
+        self.assert_(objects == sum(summaries[0]["objects"].values()))
+        # csv1 comes first and is counted after its read
+        self.assert_(steps[("datasource", "csv1", "read")][3] < objects)
+        self.assert_(steps[("datasource", "csv3", "read")][3] == objects)
+
+    def test_create_recipe_memprofile(self):
+        self.print_header()
+        self.generator.memprofile = True
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            self.generator.recipes['test10nogit'].add_datasource(**dict(self.config.items(ds)))
+        summaries = self.generator.run()
+        self.assert_(summaries[0]["status"] == "ok")
+        self.assert_(self.generator.recipes['test10nogit'].memprofiler is None)
+        path = self.generator.recipes['test10nogit'].memory_profile_path()
+        self.assert_(os.path.exists(path))
+        data = json.load(open(path))
+        os.remove(path)
+        self.assert_([s["phase"] for s in data["snapshots"]] == ["collect", "assemble", "render", "output"])
+        for snapshot in data["snapshots"]:
+            self.assert_(snapshot["maxrss"] > 0)
+            self.assert_(snapshot["types"]["hosts"]["count"] == summaries[0]["objects"]["hosts"])
+            self.assert_(snapshot["types"]["hosts"]["bytes"] > 0)
+            self.assert_(len(snapshot["allocations"]) > 0)
+        # nothing is rendered before the render phase
+        self.assert_(data["snapshots"][1]["config_files"] == 0)
+        self.assert_(data["snapshots"][2]["config_files"] > 0)
+        self.assert_(sorted(data["datasources"].keys()) == ["csv1", "csv2", "csv3"])
+        self.assert_(data["datasources"]["csv1"]["count"] > 0)
+
+    def test_create_recipe_memprofile_failed(self):
+        self.print_header()
+        self.generator.memprofile = True
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        recipe = self.generator.recipes['test10nogit']
+        recipe.add_datasource(**dict(self.config.items("datasource_CSV10.1")))
+        def render():
+            raise IOError("disk full")
+        recipe.render = render
+        summaries = self.generator.run()
+        self.assert_(summaries[0]["status"] == "failed")
+        # the numbers of the failed run were not lost
+        self.assert_(recipe.memprofiler is None)
+        self.assert_([step[2] for step in summaries[0]["steps"]] == ["open", "read", "close", "collect", "assemble", "render"])
+        path = recipe.memory_profile_path()
+        self.assert_(os.path.exists(path))
+        data = json.load(open(path))
+        os.remove(path)
+        self.assert_([s["phase"] for s in data["snapshots"]] == ["collect", "assemble"])
+
+    def test_create_recipe_parallel_collect(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10')))
+        self.generator.add_recipe(name='test10parallel', **dict(self.config.items('recipe_TEST10parallel')))
+        for recipe in ['test10', 'test10parallel']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.config.set(ds, "parallel", "yes")
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+            self.assert_(self.generator.recipes[recipe].collect())
+            self.generator.recipes[recipe].assemble()
+        self.assert_(self.generator.recipes['test10parallel'].collect_workers == 3)
+        self.assert_(self.generator.recipes['test10'].collect_groups() == [(False, [ds]) for ds in self.generator.recipes['test10'].datasources])
+        self.assert_(self.generator.recipes['test10parallel'].collect_groups() == [(True, self.generator.recipes['test10parallel'].datasources)])
+        sequential = self.generator.recipes['test10'].objects
+        parallel = self.generator.recipes['test10parallel'].objects
+        for objtype in sequential:
+            # details are keyed by id()
+            self.assert_(len(sequential[objtype]) == len(parallel[objtype]))
+            if objtype != 'details':
+                self.assert_(sorted(sequential[objtype].keys()) == sorted(parallel[objtype].keys()))
+        self.assert_([f.path for f in parallel['applications']['test_host_1+os+windows2k8r2'].filesystems] == ['C', 'D', 'F', 'G', 'Z'])
+        # the datasource which was read last wins
+        self.assert_(parallel['applications']['test_host_0+os+red hat'].version == sequential['applications']['test_host_0+os+red hat'].version)
+
+    def test_intern_strings(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10')))
+        self.generator.add_recipe(name='test10intern', **dict(self.config.items('recipe_TEST10intern')))
+        for recipe in ['test10', 'test10intern']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+            self.assert_(self.generator.recipes[recipe].collect())
+            self.generator.recipes[recipe].assemble()
+        self.assert_(self.generator.recipes['test10'].string_pool_stats == None)
+        stats = self.generator.recipes['test10intern'].string_pool_stats
+        self.assert_(stats["duplicates"] > 0 and stats["saved"] > 0)
+        self.assert_(StringPool.active == None)
+        plain = self.generator.recipes['test10'].objects
+        interned = self.generator.recipes['test10intern'].objects
+        for objtype in ['hosts', 'applications', 'contactgroups', 'contacts']:
+            self.assert_(sorted(plain[objtype].keys()) == sorted(interned[objtype].keys()))
+            for fingerprint in plain[objtype]:
+                self.assert_(plain[objtype][fingerprint].__dict__.keys() == interned[objtype][fingerprint].__dict__.keys())
+        apps = interned['applications'].values()
+        self.assert_([a for a in apps if a.name == 'os'])
+        # equal values are the same string
+        self.assert_(len(set([id(a.name) for a in apps if a.name == 'os'])) == 1)
+        plain_apps = plain['applications'].values()
+        self.assert_(len(set([id(a.name) for a in plain_apps if a.name == 'os'])) > 1)
+
+    def test_generic_details(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10')))
+        recipe = self.generator.recipes['test10']
+        recipe.add_datasource(**dict(self.config.items("datasource_CSV10.1")))
+        self.assert_(recipe.collect())
+        recipe.activate_class_cache()
+        fs1 = MonitoringDetail({'host_name': '*', 'name': 'os', 'type': 'red hat', 'monitoring_type': 'FILESYSTEM', 'monitoring_0': '/wild1'})
+        fs2 = MonitoringDetail({'host_name': '*', 'name': 'os', 'type': 'red hat', 'monitoring_type': 'FILESYSTEM', 'monitoring_0': '/wild2'})
+        fs3 = MonitoringDetail({'host_name': '*', 'name': 'os', 'type': 'unknown', 'monitoring_type': 'FILESYSTEM', 'monitoring_0': '/wild3'})
+        port = MonitoringDetail({'host_name': '*', 'monitoring_type': 'PORT', 'monitoring_0': '4711'})
+        self.assert_(port.application_fingerprint() == '*')
+        apps = recipe.objects['applications']
+        redhat = [a for a in apps.values() if a.fingerprint().endswith('+os+red hat')]
+        others = [a for a in apps.values() if not a.fingerprint().endswith('+os+red hat')]
+        self.assert_(redhat and others)
+        before = dict([(a.fingerprint(), list(a.monitoring_details)) for a in apps.values()])
+        recipe.attach_generic_details([fs1, fs2, fs3, port])
+        for app in redhat:
+            # like monitoring_details.insert(0, ...) for every detail
+            self.assert_(map(id, app.monitoring_details) == map(id, [fs2, fs1] + before[app.fingerprint()]))
+        for app in others:
+            self.assert_(map(id, app.monitoring_details) == map(id, before[app.fingerprint()]))
+        for host in recipe.objects['hosts'].values():
+            self.assert_(host.monitoring_details[0] is port)
+
+    def test_create_recipe_parallel_collect_abort(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSVMISSING", "name", "csvmissing")
+        self.config.set("datasource_CSV10.1", "parallel", "yes")
+        self.config.set("datasource_CSVMISSING", "parallel", "yes")
+        self.generator.add_recipe(name='test10parallel', **dict(self.config.items('recipe_TEST10parallel')))
+        self.generator.recipes['test10parallel'].add_datasource(**dict(self.config.items("datasource_CSV10.1")))
+        self.generator.recipes['test10parallel'].add_datasource(**dict(self.config.items("datasource_CSVMISSING")))
+        self.assert_(not self.generator.recipes['test10parallel'].collect())
+        self.assert_(self.generator.recipes['test10parallel'].objects['hosts'] == {})
+        # no reader is left running after a failure
+        self.assert_(not [t for t in threading.enumerate() if t.name.startswith("collect-test10parallel")])
+
+    def test_runstats_threads(self):
+        self.print_header()
+        def burn():
+            end = time.time() + 0.3
+            while time.time() < end:
+                pass
+        stats = RunStats("threads")
+        for threads in [False, True]:
+            with stats.measure("recipe", "threads", "collect", threads=threads):
+                reader = threading.Thread(target=burn)
+                reader.start()
+                reader.join()
+        # only the process wide usage sees the cpu time of the thread
+        self.assert_(stats.records[0][4] < 0.1)
+        self.assert_(stats.records[1][4] > 0.2)
+
+    def test_create_recipe_parallel_collect_groups(self):
+        self.print_header()
+        # only datasources with parallel = yes are read by threads, the
+        # others see everything which was read before them
+        for ds in ["1", "2", "3"]:
+            self.config.set("datasource_CSV10." + ds, "name", "csv" + ds)
+        self.config.set("datasource_CSV10.1", "parallel", "yes")
+        self.config.set("datasource_CSV10.2", "parallel", "yes")
+        self.generator.add_recipe(name='test10parallel', **dict(self.config.items('recipe_TEST10parallel')))
+        recipe = self.generator.recipes['test10parallel']
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            recipe.add_datasource(**dict(self.config.items(ds)))
+        self.assert_(recipe.collect_groups() == [(True, recipe.datasources[0:2]), (False, recipe.datasources[2:3])])
+        seen = []
+        read_datasource = recipe.read_datasource
+        def read(ds, objects, cancelled=None):
+            seen.append((ds.name, len(objects['hosts'])))
+            read_datasource(ds, objects, cancelled)
+        recipe.read_datasource = read
+        self.assert_(recipe.collect())
+        self.assert_(sorted(seen[0:2]) == [("csv1", 0), ("csv2", 0)])
+        self.assert_(seen[2][0] == "csv3" and seen[2][1] > 0)
+
+    def test_create_recipe_parallel_collect_removals(self):
+        self.print_header()
+        # a parallel datasource which removes and replaces objects of
+        # an earlier one gives the same result as without threads
+        for ds in ["1", "2", "3"]:
+            self.config.set("datasource_CSV10." + ds, "name", "csv" + ds)
+        self.config.set("datasource_CSV10.2", "parallel", "yes")
+        self.config.set("datasource_CSV10.3", "parallel", "yes")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10')))
+        self.generator.add_recipe(name='test10parallel', **dict(self.config.items('recipe_TEST10parallel')))
+        hosts = {}
+        for name in ['test10', 'test10parallel']:
+            recipe = self.generator.recipes[name]
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                recipe.add_datasource(**dict(self.config.items(ds)))
+            def cleanup(read):
+                def cleanup_read(filter=None, objects={}, force=False, **kwargs):
+                    read(filter=filter, objects=objects, force=force, **kwargs)
+                    # test_host_0 and test_host_1 come from csv1
+                    del objects['hosts']['test_host_0']
+                    replaced = coshsh.host.Host({'host_name': 'test_host_1', 'address': '10.0.0.1'})
+                    objects['hosts']['test_host_1'] = replaced
+                return cleanup_read
+            recipe.datasources[2].read = cleanup(recipe.datasources[2].read)
+            self.assert_(recipe.collect())
+            hosts[name] = recipe.objects['hosts']
+        self.assert_(self.generator.recipes['test10parallel'].collect_groups()[1] == (True, self.generator.recipes['test10parallel'].datasources[1:3]))
+        self.assert_(sorted(hosts['test10'].keys()) == sorted(hosts['test10parallel'].keys()))
+        self.assert_('test_host_0' not in hosts['test10parallel'])
+        self.assert_(hosts['test10parallel']['test_host_1'].address == '10.0.0.1')
+
+    def test_shared_template_registry(self):
+        self.print_header()
+        TemplateRegistry.codes.clear()
+        TemplateRegistry.compiles.clear()
+        TemplateRegistry.hits.clear()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10')))
+        self.generator.add_recipe(name='test10nogit', **dict(self.config.items('recipe_TEST10nogit')))
+        for recipe in ['test10', 'test10nogit']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+            self.generator.recipes[recipe].collect()
+            self.generator.recipes[recipe].assemble()
+            self.generator.recipes[recipe].render()
+        host_tpl = os.path.abspath("../recipes/default/templates/host.tpl")
+        # the second recipe found the compiled template of the first one
+        self.assert_(TemplateRegistry.get_stats()[host_tpl] == (1, 1))
+        self.assert_(self.generator.recipes['test10'].objects['hosts']['test_host_0'].config_files['nagios']['host.cfg'] == self.generator.recipes['test10nogit'].objects['hosts']['test_host_0'].config_files['nagios']['host.cfg'])
+
+    def test_shared_template_per_env(self):
+        self.print_header()
+        import jinja2
+        TemplateRegistry.codes.clear()
+        TemplateRegistry.compiles.clear()
+        TemplateRegistry.hits.clear()
+        shutil.rmtree("./var/templates_per_env", True)
+        for subdir in ["shared", "a", "b"]:
+            os.makedirs("./var/templates_per_env/" + subdir)
+        with open("./var/templates_per_env/shared/main.tpl", "w") as f:
+            f.write("{% include 'part.tpl' %}|{{ name|tag }}")
+        for subdir in ["a", "b"]:
+            with open("./var/templates_per_env/%s/part.tpl" % subdir, "w") as f:
+                f.write("part " + subdir)
+        envs = {}
+        for subdir in ["a", "b"]:
+            envs[subdir] = jinja2.Environment(loader=jinja2.FileSystemLoader(["./var/templates_per_env/" + subdir, "./var/templates_per_env/shared"]))
+            envs[subdir].filters["tag"] = lambda value, subdir=subdir: "%s_%s" % (subdir, value)
+        rendered = dict([(subdir, TemplateRegistry.get_template(envs[subdir], "main.tpl").render(name="x")) for subdir in ["a", "b"]])
+        main_tpl = os.path.abspath("./var/templates_per_env/shared/main.tpl")
+        # one compile, but every recipe renders with its own includes and filters
+        self.assert_(TemplateRegistry.get_stats()[main_tpl] == (1, 1))
+        self.assert_(rendered["a"] == "part a|a_x")
+        self.assert_(rendered["b"] == "part b|b_x")
+        # a new version of the file replaces the old code
+        with open("./var/templates_per_env/shared/main.tpl", "w") as f:
+            f.write("{{ name|tag }}")
+        os.utime(main_tpl, (0, 0))
+        self.assert_(TemplateRegistry.get_template(envs["a"], "main.tpl").render(name="y") == "a_y")
+        self.assert_(len([key for key in TemplateRegistry.codes if key[0] == main_tpl]) == 1)
+        shutil.rmtree("./var/templates_per_env", True)
+
+    def test_create_recipe_render_workers(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10')))
+        self.generator.add_recipe(name='test10workers', **dict(self.config.items('recipe_TEST10workers')))
+        for recipe in ['test10', 'test10workers']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+            self.generator.recipes[recipe].collect()
+            self.generator.recipes[recipe].assemble()
+            self.generator.recipes[recipe].render()
+        self.assert_(self.generator.recipes['test10workers'].render_workers == 3)
+        sequential = self.generator.recipes['test10'].objects
+        parallel = self.generator.recipes['test10workers'].objects
+        for objtype in ['hosts', 'applications', 'contactgroups', 'contacts', 'hostgroups']:
+            self.assert_(sorted(sequential[objtype].keys()) == sorted(parallel[objtype].keys()))
+            for key in sequential[objtype]:
+                self.assert_(sequential[objtype][key].config_files == parallel[objtype][key].config_files)
+        self.assert_('os_windows_default.cfg' in parallel['applications']['test_host_1+os+windows2k8r2'].config_files['nagios'])
+        # the parent sorted the lists like a sequential render leaves them
+        for key in sequential['hosts']:
+            self.assert_(sequential['hosts'][key].hostgroups == parallel['hosts'][key].hostgroups)
+            self.assert_(isinstance(parallel['hosts'][key].hostgroups, list))
+
+    def test_create_recipe_stream_output(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10', **dict(self.config.items('recipe_TEST10nogit')))
+        self.config.set("recipe_TEST10stream", "render_workers", "1")
+        self.generator.add_recipe(name='test10stream', **dict(self.config.items('recipe_TEST10stream')))
+        self.config.set("recipe_TEST10stream", "render_workers", "3")
+        self.config.set("recipe_TEST10stream", "objects_dir", "./var/objects/test10stream/workers")
+        self.generator.add_recipe(name='test10streamworkers', **dict(self.config.items('recipe_TEST10stream')))
+        for recipe in ['test10', 'test10stream', 'test10streamworkers']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+            self.generator.recipes[recipe].collect()
+            self.generator.recipes[recipe].assemble()
+            self.generator.recipes[recipe].render()
+            self.generator.recipes[recipe].output()
+        self.assert_(not self.generator.recipes['test10'].streaming)
+        def read_tree(top):
+            files = {}
+            for root, dirs, names in os.walk(top):
+                for name in names:
+                    files[os.path.relpath(os.path.join(root, name), top)] = open(os.path.join(root, name)).read()
+            return files
+        written = read_tree("./var/objects/test10/dynamic")
+        self.assert_('hosts/test_host_1/os_windows_default.cfg' in written)
+        for recipe, objects_dir in [('test10stream', './var/objects/test10stream'), ('test10streamworkers', './var/objects/test10stream/workers')]:
+            self.assert_(self.generator.recipes[recipe].streaming)
+            self.assert_(read_tree(objects_dir + "/dynamic") == written)
+            # the rendered text was released after it was written
+            self.assert_(not self.generator.recipes[recipe].objects['applications']['test_host_1+os+windows2k8r2'].config_files)
+            self.assert_(not self.generator.recipes[recipe].objects['hosts']['test_host_1'].config_files)
+
+    def test_create_recipe_stream_output_failed(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.config.set("recipe_TEST10stream", "render_workers", "1")
+        self.generator.add_recipe(name='test10stream', **dict(self.config.items('recipe_TEST10stream')))
+        self.generator.add_recipe(name='test10streamfail', **dict(self.config.items('recipe_TEST10stream')))
+        for recipe in ['test10stream', 'test10streamfail']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+        def read_tree(top):
+            files = {}
+            for root, dirs, names in os.walk(top):
+                for name in names:
+                    files[os.path.relpath(os.path.join(root, name), top)] = open(os.path.join(root, name)).read()
+            return files
+        recipe = self.generator.recipes['test10stream']
+        recipe.collect()
+        recipe.assemble()
+        recipe.render()
+        recipe.output()
+        written = read_tree("./var/objects/test10stream/dynamic")
+        self.assert_('hosts/test_host_1/os_windows_default.cfg' in written)
+        # the second run dies after a few items were written
+        recipe = self.generator.recipes['test10streamfail']
+        recipe.collect()
+        recipe.assemble()
+        streamed = []
+        def stream_item(objtype, obj):
+            if len(streamed) == 3:
+                raise IOError("disk full")
+            streamed.append(obj)
+        for datarecipient in recipe.datarecipients:
+            datarecipient.stream_item = stream_item
+        self.assertRaises(IOError, recipe.render)
+        self.assert_(len(streamed) == 3)
+        # the previous output was not touched
+        self.assert_(read_tree("./var/objects/test10stream/dynamic") == written)
+        # and the stage of the failed run is removed by the next one
+        def stages():
+            return [d for d in glob.glob("./var/objects/test10stream/dynamic.stage.*") if os.path.realpath(d) != os.path.realpath("./var/objects/test10stream/dynamic")]
+        self.assert_(len(stages()) == 1)
+        recipe = self.generator.recipes['test10stream']
+        recipe.render()
+        recipe.output()
+        self.assert_(not stages())
+        self.assert_(read_tree("./var/objects/test10stream/dynamic") == written)
+
+    def test_create_recipe_profile_templates(self):
+        self.print_header()
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        self.generator.add_recipe(name='test10profile', **dict(self.config.items('recipe_TEST10profile')))
+        self.config.set("recipe_TEST10profile", "render_workers", "3")
+        self.generator.add_recipe(name='test10profileworkers', **dict(self.config.items('recipe_TEST10profile')))
+        for recipe in ['test10profile', 'test10profileworkers']:
+            for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+                self.generator.recipes[recipe].add_datasource(**dict(self.config.items(ds)))
+            self.generator.recipes[recipe].collect()
+            self.generator.recipes[recipe].assemble()
+            self.generator.recipes[recipe].render()
+        profiler = self.generator.recipes['test10profile'].jinja2.profiler
+        self.assert_(profiler.top == 3)
+        hosts = self.generator.recipes['test10profile'].objects['hosts']
+        self.assert_(profiler.templates['host'][0] == len(hosts))
+        self.assert_(profiler.templates['host'][3] == sum([len(h.config_files['nagios']['host.cfg']) for h in hosts.values()]))
+        self.assert_(profiler.items['test_host_1'][0] == 1)
+        self.assert_(len(profiler.ranking(profiler.items)) == 3)
+        # the workers sent their numbers back
+        merged = self.generator.recipes['test10profileworkers'].jinja2.profiler
+        self.assert_(sorted(merged.templates.keys()) == sorted(profiler.templates.keys()))
+        self.assert_([merged.templates[t][0] for t in sorted(merged.templates)] == [profiler.templates[t][0] for t in sorted(profiler.templates)])
+        path = self.generator.recipes['test10profile'].template_profile_path()
+        self.assert_(os.path.exists(path))
+        data = json.load(open(path))
+        self.assert_(data['templates']['host'][0] == len(hosts))
+        os.remove(path)
+        os.remove(self.generator.recipes['test10profileworkers'].template_profile_path())
+
 if __name__ == '__main__':
     unittest.main()
 
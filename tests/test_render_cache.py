@@ -0,0 +1,141 @@
+import unittest
+import os
+import sys
+import shutil
+import string
+import logging
+
+
+sys.dont_write_bytecode = True
+
+import coshsh
+from coshsh.generator import Generator
+from coshsh.configparser import CoshshConfigParser
+from coshsh.util import setup_logging
+
+class CoshshTest(unittest.TestCase):
+    def print_header(self):
+        print "#" * 80 + "\n" + "#" + " " * 78 + "#"
+        print "#" + string.center(self.id(), 78) + "#"
+        print "#" + " " * 78 + "#\n" + "#" * 80 + "\n"
+
+    def setUp(self):
+        shutil.rmtree("./var/objects/test10", True)
+        if os.path.exists("./var/objects/test10.render_cache"):
+            os.remove("./var/objects/test10.render_cache")
+        self.config = coshsh.configparser.CoshshConfigParser()
+        self.config.read('etc/coshsh.cfg')
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        setup_logging()
+
+    def tearDown(self):
+        shutil.rmtree("./var/objects/test10", True)
+        if os.path.exists("./var/objects/test10.render_cache"):
+            os.remove("./var/objects/test10.render_cache")
+
+    def cook(self, modify=None):
+        generator = coshsh.generator.Generator()
+        generator.add_recipe(name='test10cache', **dict(self.config.items('recipe_TEST10cache')))
+        recipe = generator.recipes['test10cache']
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            recipe.add_datasource(**dict(self.config.items(ds)))
+        recipe.collect()
+        recipe.assemble()
+        if modify:
+            modify(recipe)
+        recipe.render()
+        recipe.output()
+        return recipe
+
+    def read_output(self):
+        files = {}
+        for root, dirs, names in os.walk("var/objects/test10/dynamic"):
+            for name in names:
+                files[os.path.join(root, name)] = open(os.path.join(root, name)).read()
+        return files
+
+    def test_render_cache(self):
+        self.print_header()
+        recipe = self.cook()
+        self.assert_(os.path.exists("var/objects/test10.render_cache"))
+        self.assert_(recipe.render_cache.hits == 0)
+        misses = recipe.render_cache.misses
+        self.assert_(misses > 0)
+        first_output = self.read_output()
+
+        recipe = self.cook()
+        self.assert_(recipe.render_cache.hits == misses)
+        self.assert_(recipe.render_cache.misses == 0)
+        self.assert_(self.read_output() == first_output)
+
+        def modify(recipe):
+            recipe.objects['hosts']['test_host_2'].address = '127.0.0.2'
+        recipe = self.cook(modify)
+        # the host itself, its os and its mysql application see the new address
+        self.assert_(recipe.render_cache.misses == 3)
+        self.assert_(recipe.render_cache.hits == misses - 3)
+        self.assert_('127.0.0.2' in open("var/objects/test10/dynamic/hosts/test_host_2/host.cfg").read())
+
+    def test_render_cache_stream_output(self):
+        self.print_header()
+        recipe = self.cook()
+        first_output = self.read_output()
+        self.config.set("recipe_TEST10cache", "stream_output", "yes")
+        for render_workers in ["1", "3"]:
+            # the recipe settings are part of the key, every variant
+            # starts with an empty cache
+            self.config.set("recipe_TEST10cache", "render_workers", render_workers)
+            recipe = self.cook()
+            misses = recipe.render_cache.misses
+            self.assert_(recipe.render_cache.hits == 0)
+            self.assert_(self.read_output() == first_output)
+            recipe = self.cook()
+            self.assert_(recipe.streaming)
+            self.assert_(recipe.render_cache.hits == misses)
+            # the cache did not keep the written files
+            self.assert_(len(recipe.render_cache.used) == misses)
+            self.assert_(not [content for content in recipe.render_cache.used.values() if content is not None])
+            self.assert_(self.read_output() == first_output)
+            # the file which was written while streaming is complete
+            def modify(recipe):
+                recipe.objects['hosts']['test_host_2'].address = '127.0.0.2'
+            recipe = self.cook(modify)
+            self.assert_(recipe.render_cache.misses == 3)
+            self.assert_(recipe.render_cache.hits == misses - 3)
+            self.assert_(not os.path.exists("var/objects/test10.render_cache.tmp"))
+
+    def test_render_cache_environment(self):
+        self.print_header()
+        import jinja2
+        from coshsh.rendercache import RenderCache
+        recipe = self.cook()
+        misses = recipe.render_cache.misses
+        # variables which no template reads do not matter
+        os.environ["COSHSH_UNRELATED"] = "changed"
+        try:
+            recipe = self.cook()
+        finally:
+            del os.environ["COSHSH_UNRELATED"]
+        self.assert_(recipe.render_cache.hits == misses)
+        # the ones behind environ("...") do
+        shutil.rmtree("./var/environ_templates", True)
+        os.makedirs("./var/environ_templates")
+        with open("./var/environ_templates/literal.tpl", "w") as f:
+            f.write('{{ environ("COSHSHENV1") }}')
+        with open("./var/environ_templates/dynamic.tpl", "w") as f:
+            f.write('{{ environ(host.name) }}')
+        env = jinja2.Environment(loader=jinja2.FileSystemLoader("./var/environ_templates"))
+        os.environ["COSHSHENV1"] = "variante1"
+        try:
+            digest = RenderCache("./var/environ_templates/cache").template_digest(env, "literal.tpl")
+            os.environ["COSHSHENV1"] = "variante2"
+            self.assert_(RenderCache("./var/environ_templates/cache").template_digest(env, "literal.tpl") != digest)
+        finally:
+            del os.environ["COSHSHENV1"]
+        self.assert_(RenderCache("./var/environ_templates/cache").template_digest(env, "dynamic.tpl") is None)
+        shutil.rmtree("./var/environ_templates", True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import os
+import sys
+import shutil
+import string
+import logging
+import subprocess
+
+
+sys.dont_write_bytecode = True
+
+import coshsh
+from coshsh.generator import Generator
+from coshsh.configparser import CoshshConfigParser
+from coshsh.util import setup_logging
+
+class CoshshTest(unittest.TestCase):
+    def print_header(self):
+        print "#" * 80 + "\n" + "#" + " " * 78 + "#"
+        print "#" + string.center(self.id(), 78) + "#"
+        print "#" + " " * 78 + "#\n" + "#" * 80 + "\n"
+
+    def setUp(self):
+        shutil.rmtree("./var/objects/test10", True)
+        self.config = coshsh.configparser.CoshshConfigParser()
+        self.config.read('etc/coshsh.cfg')
+        self.config.set("datasource_CSV10.1", "name", "csv1")
+        self.config.set("datasource_CSV10.2", "name", "csv2")
+        self.config.set("datasource_CSV10.3", "name", "csv3")
+        setup_logging()
+
+    def tearDown(self):
+        shutil.rmtree("./var/objects/test10", True)
+
+    def cook(self, modify=None):
+        generator = coshsh.generator.Generator()
+        generator.add_recipe(name='test10staged', **dict(self.config.items('recipe_TEST10staged')))
+        recipe = generator.recipes['test10staged']
+        for ds in ["datasource_CSV10.1", "datasource_CSV10.2", "datasource_CSV10.3"]:
+            recipe.add_datasource(**dict(self.config.items(ds)))
+        recipe.collect()
+        recipe.assemble()
+        if modify:
+            modify(recipe)
+        recipe.render()
+        recipe.output()
+        return recipe
+
+    def read_output(self):
+        files = {}
+        for root, dirs, names in os.walk("var/objects/test10/dynamic/"):
+            for name in names:
+                files[os.path.relpath(os.path.join(root, name), "var/objects/test10/dynamic")] = open(os.path.join(root, name)).read()
+        return files
+
+    def test_staged_symlink(self):
+        self.print_header()
+        recipe = self.cook()
+        self.assert_(os.path.islink("var/objects/test10/dynamic"))
+        self.assert_(recipe.datarecipients[0].dynamic_dir == recipe.datarecipients[0].published_dir)
+        first_target = os.path.realpath("var/objects/test10/dynamic")
+        first_output = self.read_output()
+        self.assert_('hosts/test_host_1/host.cfg' in first_output)
+        inode = os.stat("var/objects/test10/dynamic/hosts/test_host_1/host.cfg").st_ino
+
+        # a crashed run
+        os.mkdir("var/objects/test10/dynamic.stage.19700101000000.1")
+        def modify(recipe):
+            recipe.objects['hosts']['test_host_2'].address = '127.0.0.2'
+        recipe = self.cook(modify)
+        self.assert_(os.path.islink("var/objects/test10/dynamic"))
+        self.assert_(os.path.realpath("var/objects/test10/dynamic") != first_target)
+        self.assert_(not os.path.exists(first_target))
+        self.assert_(not os.path.exists("var/objects/test10/dynamic.stage.19700101000000.1"))
+        self.assert_(recipe.output_stats()["written"] == 1)
+        # unchanged files were hard-linked to the new dir
+        self.assert_(os.stat("var/objects/test10/dynamic/hosts/test_host_1/host.cfg").st_ino == inode)
+        second_output = self.read_output()
+        self.assert_('127.0.0.2' in second_output['hosts/test_host_2/host.cfg'])
+        self.assert_(sorted(second_output.keys()) == sorted(first_output.keys()))
+
+    def test_staged_from_directory(self):
+        self.print_header()
+        self.config.set("recipe_TEST10staged", "staged_output", "no")
+        self.config.set("recipe_TEST10staged", "diff_output", "no")
+        recipe = self.cook()
+        self.assert_(not os.path.islink("var/objects/test10/dynamic"))
+        first_output = self.read_output()
+        subprocess.call(["git", "init", "-q", "var/objects/test10/dynamic"])
+        # rename is not atomic, it became symlink
+        self.config.set("recipe_TEST10staged", "staged_output", "rename")
+        self.config.set("recipe_TEST10staged", "fsync", "syncfs")
+        recipe = self.cook()
+        self.assert_(recipe.datarecipients[0].staged_output == "symlink")
+        self.assert_(recipe.datarecipients[0].fsync == "syncfs")
+        self.assert_(os.path.islink("var/objects/test10/dynamic"))
+        self.assert_(dict([(f, c) for f, c in self.read_output().items() if not f.startswith(".git")]) == first_output)
+        # the repository went to the new dir
+        self.assert_(os.path.exists("var/objects/test10/dynamic/.git/HEAD"))
+        self.assert_(sorted(os.listdir("var/objects/test10")) == sorted(["dynamic", os.path.basename(os.path.realpath("var/objects/test10/dynamic"))]))
+
+    def test_staged_max_delta(self):
+        self.print_header()
+        self.cook()
+        first_target = os.path.realpath("var/objects/test10/dynamic")
+        first_output = self.read_output()
+        self.config.set("recipe_TEST10staged", "safe_output", "yes")
+        self.config.set("recipe_TEST10staged", "max_delta", "10:10")
+        def modify(recipe):
+            # a datasource which delivered only half of the hosts
+            for host_name in sorted(recipe.objects['hosts'].keys())[1:]:
+                del recipe.objects['hosts'][host_name]
+                for fingerprint in [f for f in recipe.objects['applications'] if f.startswith(host_name + '+')]:
+                    del recipe.objects['applications'][fingerprint]
+        recipe = self.cook(modify)
+        self.assert_(recipe.datarecipients[0].too_much_delta())
+        # the new config was not published
+        self.assert_(os.path.realpath("var/objects/test10/dynamic") == first_target)
+        self.assert_(self.read_output() == first_output)
+        self.assert_(not [d for d in os.listdir("var/objects/test10") if d != "dynamic" and os.path.realpath(os.path.join("var/objects/test10", d)) != first_target])
+        self.assert_(recipe.datarecipients[0].dynamic_dir == recipe.datarecipients[0].published_dir)
+
+    def test_fsync_dir(self):
+        self.print_header()
+        self.config.set("recipe_TEST10staged", "staged_output", "no")
+        self.config.set("recipe_TEST10staged", "diff_output", "no")
+        synced = []
+        patched = {}
+        def modify(recipe):
+            module_globals = recipe.datarecipients[0].sync_target_dir.im_func.func_globals
+            patched["globals"], patched["fsync_path"] = module_globals, module_globals["fsync_path"]
+            module_globals["fsync_path"] = synced.append
+        try:
+            self.cook(modify)
+        finally:
+            patched["globals"]["fsync_path"] = patched["fsync_path"]
+        files = ["var/objects/test10/dynamic/" + f for f in self.read_output()]
+        # without staged_output, the files and then their directory
+        self.assert_(sorted([os.path.relpath(p) for p in synced if os.path.isfile(p)]) == sorted([os.path.relpath(f) for f in files]))
+        host_cfg = os.path.relpath("var/objects/test10/dynamic/hosts/test_host_1/host.cfg")
+        host_dir = os.path.relpath("var/objects/test10/dynamic/hosts/test_host_1")
+        synced = [os.path.relpath(p) for p in synced]
+        self.assert_(synced.index(host_cfg) < synced.index(host_dir))
+
+if __name__ == '__main__':
+    unittest.main()